@@ -10,4 +10,5 @@ urlpatterns = [
     path("dfreadings/", include("apps.dfreadings.urls")),
     path("dsreadings/", include("apps.dsreadings.urls")),
     path("nodes/", include("apps.nodes.urls")),
+    path("alarms/", include("apps.alarms.urls")),
 ]
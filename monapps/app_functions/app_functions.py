@@ -1,10 +1,30 @@
-from .stall_detection_by_two_temps import stall_detection_by_two_temps_0_0_1
-from .fake_data_generator import fake_data_generator_0_0_1
-from .monitoring import monitoring_0_0_1
+import importlib
+from collections.abc import Callable
 
+from common.complex_types import AppFuncReturn
 
-app_function_map = {
-    "stall_detection_by_two_temps": {"0.0.1": stall_detection_by_two_temps_0_0_1},
-    "fake_data_generator": {"0.0.1": fake_data_generator_0_0_1},
-    "monitoring": {"0.0.1": monitoring_0_0_1},
+# The app functions are imported on first use, so a process that evaluates only a few app types
+# doesn't import (and keep in memory) the modules of all the others.
+# {func_name: {func_version: "dotted.path.to.function"}}
+app_function_map: dict[str, dict[str, str]] = {
+    "stall_detection_by_two_temps": {
+        "0.0.1": "app_functions.stall_detection_by_two_temps.ver_0_0_1.stall_detection_by_two_temps_0_0_1",
+        "0.0.2": "app_functions.stall_detection_by_two_temps.ver_0_0_2.stall_detection_by_two_temps_0_0_2",
+    },
+    "fake_data_generator": {
+        "0.0.1": "app_functions.fake_data_generator.ver_0_0_1.fake_data_generator_0_0_1",
+    },
+    "monitoring": {
+        "0.0.1": "app_functions.monitoring.ver_0_0_1.monitoring_0_0_1",
+    },
 }
+
+_loaded_app_functions: dict[str, Callable[..., AppFuncReturn]] = {}
+
+
+def load_app_function(path: str) -> Callable[..., AppFuncReturn]:
+    if (app_func := _loaded_app_functions.get(path)) is None:
+        module_path, func_name = path.rsplit(".", 1)
+        app_func = getattr(importlib.import_module(module_path), func_name)
+        _loaded_app_functions[path] = app_func
+    return app_func
@@ -1 +0,0 @@
-from .ver_0_0_1 import fake_data_generator_0_0_1
@@ -1 +0,0 @@
-from .ver_0_0_1 import monitoring_0_0_1
\ No newline at end of file
@@ -0,0 +1,54 @@
+import numpy as np
+
+from common.constants import CurrStateTypes
+
+# The functions here work with arrays only and don't touch the db, so they can be run in the app sandbox.
+# Don't import Django models into this module, the sandbox workers don't set up Django.
+
+# kinds of grid points, the non-negative ones are the same as the current state they produce
+_HOLD = -1  # the current state is the same as in the previous point
+_HOLD_BELOW_DELTA_T_IN = -2  # OK unless the previous current state is WARNING (or worse)
+
+
+def find_curr_states(
+    temps_in: np.ndarray,
+    temps_out: np.ndarray,
+    is_valid: np.ndarray,
+    delta_t_in: float,
+    delta_t_out: float,
+    prev_curr_state: int,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    First, every grid point gets a 'kind': most of the points define the current state on their own,
+    only the points inside the hysteresis band depend on the previous current state.
+    Then the state machine goes over the runs of points of the same kind (not over the individual points),
+    so the Python-level work is proportional to the number of runs.
+    """
+    with np.errstate(invalid="ignore"):  # NaN values are possible where 'is_valid' is False
+        deltas = temps_in - temps_out
+        is_reversed = is_valid & (-deltas > 0.5)
+
+        kinds = np.full(len(deltas), _HOLD, dtype=np.int8)
+        kinds[deltas < delta_t_in] = _HOLD_BELOW_DELTA_T_IN
+        kinds[deltas < delta_t_out] = CurrStateTypes.OK
+        kinds[deltas > delta_t_in] = CurrStateTypes.WARNING
+    kinds[is_reversed | ~is_valid] = CurrStateTypes.UNDEFINED
+
+    curr_states = np.empty(len(kinds), dtype=np.int8)
+    if len(kinds) == 0:
+        return curr_states, is_reversed
+
+    run_starts = np.flatnonzero(np.diff(kinds)) + 1
+    run_bounds = zip(np.concatenate(([0], run_starts)), np.concatenate((run_starts, [len(kinds)])))
+
+    curr_state = prev_curr_state
+    for start, end in run_bounds:
+        kind = kinds[start]
+        if kind == _HOLD_BELOW_DELTA_T_IN:
+            if curr_state < CurrStateTypes.WARNING:
+                curr_state = CurrStateTypes.OK
+        elif kind != _HOLD:
+            curr_state = kind
+        curr_states[start:end] = curr_state
+
+    return curr_states, is_reversed
@@ -0,0 +1,84 @@
+from apps.applications.models import Application
+from apps.datafeeds.models import Datafeed
+from apps.dfreadings.models import DfReading
+from common.constants import CurrStateTypes, HealthGrades
+from common.complex_types import AppFuncReturn, DerivedDfReadingMap, UpdateMap
+from common.constants import CURR_STATE_FIELD_NAME
+from utils.app_func_utils import get_end_rts, get_df_frame
+from utils.alarm_utils import AlarmPayloadBuilder
+from utils.app_state_utils import load_app_state
+from services.app_sandbox import run_in_sandbox
+from .kernels import find_curr_states
+
+STALL_ALARM_NAME = "Stall detected"
+REVERSED_TEMPS_ALARM_NAME = "Temp outlet > Temp inlet"
+
+
+def stall_detection_by_two_temps_0_0_2(
+    app: Application, native_df_map: dict[str, Datafeed], derived_df_map: dict[str, Datafeed]
+) -> AppFuncReturn:
+    """
+    Gives the same current state as 0.0.1, but the evaluation is done over arrays.
+    The current state is produced in the columnar form, and alarms are put into
+    the alarm payload builder only when they change (as persistent alarms with "st": "in"/"out").
+    The alarms are not the same as in 0.0.1: there "Stall detected" was a non-persistent alarm raised only
+    at the points with delta T > 'delta_t_in', here it follows the current state WARNING,
+    so it also stays "in" inside the hysteresis band ('delta_t_out' <= delta T <= 'delta_t_in').
+    """
+    print("We are in 'stall_detection_by_two_temps_0_0_2'")
+
+    temp_in_df = native_df_map["Temp inlet"]
+    temp_out_df = native_df_map["Temp outlet"]
+    curr_state_df = derived_df_map[CURR_STATE_FIELD_NAME]
+
+    start_rts = app.cursor_ts
+    num_df_to_process = 3  # 3 is because we use 2 temperature datafeed + 1 curr_state datafeed
+    end_rts, is_catching_up = get_end_rts(native_df_map.values(), app.t_resample, start_rts, num_df_to_process)
+
+    update_map: UpdateMap = {}
+    alarm_payload_builder = AlarmPayloadBuilder(app)
+
+    derived_df_reading_map: DerivedDfReadingMap = {CURR_STATE_FIELD_NAME: {"df": curr_state_df, "new_df_readings": []}}
+
+    if end_rts > start_rts:  # all datafeed have readings with ts > cursor_ts
+
+        df_frame = get_df_frame([temp_in_df, temp_out_df], start_rts, end_rts, app.t_resample)
+        grid = df_frame["grid"]
+        temps_in = df_frame["values"][temp_in_df.name]
+        temps_out = df_frame["values"][temp_out_df.name]
+        is_valid = df_frame["masks"][temp_in_df.name] & df_frame["masks"][temp_out_df.name]
+
+        delta_t_in = app.settings.get("delta_t_in", 10)
+        delta_t_out = app.settings.get("delta_t_out", 5)
+
+        # the current state at 'start_rts' is needed for the hysteresis
+        prev_curr_state = load_app_state(app).get("prev_curr_state")
+        if prev_curr_state is None:  # the first invocation or the cursor was moved, so take it from the df readings
+            prev_curr_state_dfr = DfReading.objects.filter(datafeed=curr_state_df, time=start_rts).first()
+            if prev_curr_state_dfr is None:
+                prev_curr_state = CurrStateTypes.UNDEFINED
+            else:
+                prev_curr_state = prev_curr_state_dfr.value
+
+        # the only heavy part of the function, so it is the part that goes to the sandbox
+        curr_states, is_reversed = run_in_sandbox(
+            find_curr_states, temps_in, temps_out, is_valid, delta_t_in, delta_t_out, int(prev_curr_state)
+        )
+
+        if is_reversed.any():
+            update_map["health"] = HealthGrades.ERROR
+
+        alarm_payload_builder.add_transitions(STALL_ALARM_NAME, curr_states == CurrStateTypes.WARNING, grid, "w")
+        alarm_payload_builder.add_transitions(REVERSED_TEMPS_ALARM_NAME, is_reversed, grid, "w")
+
+        derived_df_reading_map[CURR_STATE_FIELD_NAME]["rtss"] = grid
+        derived_df_reading_map[CURR_STATE_FIELD_NAME]["values"] = curr_states
+
+        update_map["cursor_ts"] = end_rts
+        if len(curr_states) > 0:
+            update_map["state"] = {"prev_curr_state": int(curr_states[-1])}
+        update_map["is_catching_up"] = is_catching_up
+        update_map["alarm_rows"] = alarm_payload_builder.get_rows()
+
+    return derived_df_reading_map, update_map
+
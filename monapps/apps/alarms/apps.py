@@ -0,0 +1,19 @@
+from django.apps import AppConfig
+from django.db.models.signals import post_delete
+
+
+def delete_alarm_map_on_delete(sender, instance, **kwargs):
+    from utils.alarm_map_utils import delete_alarm_map
+
+    delete_alarm_map(instance)
+
+
+class AlarmsConfig(AppConfig):
+    default_auto_field = "django.db.models.BigAutoField"
+    name = "apps.alarms"
+
+    def ready(self):
+        # the alarms are not linked to their instances by foreign keys, so they are deleted by the signal
+        # (it is also sent for the instances deleted by cascade, for example, the datastreams of a device)
+        for model_label in ("devices.Device", "datastreams.Datastream", "applications.Application"):
+            post_delete.connect(delete_alarm_map_on_delete, sender=model_label)
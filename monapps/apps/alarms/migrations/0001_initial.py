@@ -0,0 +1,32 @@
+# Generated by Django 5.2 on 2026-10-19 19:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Alarm',
+            fields=[
+                ('pk', models.CompositePrimaryKey('entity_type', 'entity_id', 'kind', 'name', blank=True, editable=False, primary_key=True, serialize=False)),
+                ('entity_type', models.CharField(choices=[('device', 'Device'), ('datastream', 'Datastream'), ('application', 'Application')], max_length=50)),
+                ('entity_id', models.BigIntegerField()),
+                ('kind', models.CharField(choices=[('errors', 'Errors'), ('warnings', 'Warnings')], max_length=50)),
+                ('name', models.CharField(max_length=200)),
+                ('persist', models.BooleanField()),
+                ('st', models.CharField(max_length=3)),
+                ('last_trans_ts', models.BigIntegerField()),
+                ('last_in_payload_ts', models.BigIntegerField()),
+            ],
+            options={
+                'db_table': 'alarms',
+                'indexes': [models.Index(condition=models.Q(('st', 'in')), fields=['kind', 'entity_type', 'entity_id'], name='alarm_in_idx')],
+            },
+        ),
+    ]
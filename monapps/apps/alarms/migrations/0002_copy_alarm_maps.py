@@ -0,0 +1,59 @@
+from django.db import migrations
+
+ALARM_MODELS = (("devices", "Device"), ("datastreams", "Datastream"), ("applications", "Application"))
+
+
+def copy_alarm_maps(apps, schema_editor):
+    Alarm = apps.get_model("alarms", "Alarm")
+    for app_label, model_name in ALARM_MODELS:
+        model = apps.get_model(app_label, model_name)
+        alarms = []
+        for entity_id, alarm_map in model.objects.values_list("pk", "alarms").iterator():
+            for kind in ("errors", "warnings"):
+                for name, alarm in (alarm_map or {}).get(kind, {}).items():
+                    alarms.append(
+                        Alarm(
+                            entity_type=model_name.lower(),
+                            entity_id=entity_id,
+                            kind=kind,
+                            name=name,
+                            persist=alarm.get("persist", False),
+                            st=alarm.get("st", "out"),
+                            last_trans_ts=alarm.get("lastTransTs", 0),
+                            last_in_payload_ts=alarm.get("lastInPayloadTs", 0),
+                        )
+                    )
+        Alarm.objects.bulk_create(alarms, batch_size=1000)
+
+
+def copy_alarm_maps_back(apps, schema_editor):
+    Alarm = apps.get_model("alarms", "Alarm")
+    for app_label, model_name in ALARM_MODELS:
+        model = apps.get_model(app_label, model_name)
+        alarm_maps = {}
+        alarms = Alarm.objects.filter(entity_type=model_name.lower())
+        for alarm in alarms.order_by("entity_id", "kind", "last_trans_ts", "name"):
+            alarm_map = alarm_maps.setdefault(alarm.entity_id, {"errors": {}, "warnings": {}})
+            alarm_map[alarm.kind][alarm.name] = {
+                "persist": alarm.persist,
+                "st": alarm.st,
+                "lastTransTs": alarm.last_trans_ts,
+                "lastInPayloadTs": alarm.last_in_payload_ts,
+            }
+        for entity_id, alarm_map in alarm_maps.items():
+            model.objects.filter(pk=entity_id).update(alarms=alarm_map)
+    Alarm.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("alarms", "0001_initial"),
+        ("applications", "0005_appstate"),
+        ("datastreams", "0003_remove_health_next_eval_ts"),
+        ("devices", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.RunPython(copy_alarm_maps, copy_alarm_maps_back),
+    ]
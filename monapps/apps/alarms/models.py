@@ -0,0 +1,32 @@
+from django.db import models
+from django.db.models import Q
+
+from common.constants import AlarmEntityTypes, AlarmKinds
+
+
+class Alarm(models.Model):
+    """
+    An error or a warning of a device, a datastream or an application, one row per alarm name.
+    The row is kept when the alarm goes "out", so together the rows of an instance make its alarm map
+    (see 'AlarmMapMixin'). Only the alarms that are "in" are indexed, so the questions like
+    "all the entities with an active error" do not scan the whole table.
+    """
+
+    class Meta:
+        db_table = "alarms"
+        indexes = [
+            models.Index(fields=["kind", "entity_type", "entity_id"], name="alarm_in_idx", condition=Q(st="in")),
+        ]
+
+    pk = models.CompositePrimaryKey("entity_type", "entity_id", "kind", "name")
+    entity_type = models.CharField(max_length=50, choices=AlarmEntityTypes.choices)
+    entity_id = models.BigIntegerField()
+    kind = models.CharField(max_length=50, choices=AlarmKinds.choices)
+    name = models.CharField(max_length=200)
+    persist = models.BooleanField()
+    st = models.CharField(max_length=3)  # "in" or "out"
+    last_trans_ts = models.BigIntegerField()
+    last_in_payload_ts = models.BigIntegerField()
+
+    def __str__(self):
+        return f"Alarm {self.entity_type} {self.entity_id} {self.kind} '{self.name}' {self.st}"
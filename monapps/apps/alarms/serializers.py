@@ -0,0 +1,27 @@
+from rest_framework import serializers
+
+from .models import Alarm
+
+
+class AlarmSerializer(serializers.ModelSerializer):
+
+    id = serializers.SerializerMethodField()
+
+    def get_id(self, instance):
+        # the same as the 'full id' of the instance the alarm belongs to
+        return f"{instance.entity_type} {instance.entity_id}"
+
+    lastTransTs = serializers.IntegerField(source="last_trans_ts")
+    lastInPayloadTs = serializers.IntegerField(source="last_in_payload_ts")
+
+    class Meta:
+        model = Alarm
+        fields = [
+            "id",
+            "kind",
+            "name",
+            "persist",
+            "st",
+            "lastTransTs",
+            "lastInPayloadTs",
+        ]
@@ -0,0 +1,318 @@
+import copy
+import random
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from utils.alarm_utils import add_to_alarm_payload, AlarmPayloadBuilder, AlarmState
+from services.alarm_log import add_to_alarm_log
+
+
+def create_instance(errors=None, warnings=None):
+    return SimpleNamespace(alarms={"errors": errors or {}, "warnings": warnings or {}})
+
+
+def update_part_of_alarm_map(instance, alarm_dict_for_ts, ts, alarm_map_part, has_value=False):
+    """
+    The function 'AlarmState' replaced (it returned an updated copy of the part of the alarm map).
+    """
+    alarm_map = instance.alarms[alarm_map_part]
+    log_level = alarm_map_part[:-1].upper()
+    is_nd_marker_needed = False
+    upd_alarm_map = copy.deepcopy(alarm_map)
+    if alarm_dict_for_ts is not None:
+        for alarm_name, ind_alarm_obj in alarm_dict_for_ts.items():
+            if alarm_name in upd_alarm_map:
+                if isinstance(ind_alarm_obj, dict) and (
+                    (new_status := str(ind_alarm_obj.get("st")).lower()) == "in" or new_status == "out"
+                ):
+                    upd_alarm_map[alarm_name]["persist"] = True
+                    upd_alarm_map[alarm_name]["lastInPayloadTs"] = ts
+                    if alarm_map_part == "errors" and new_status == "in" and has_value:
+                        is_nd_marker_needed = True
+                    if upd_alarm_map[alarm_name]["st"] != new_status:
+                        upd_alarm_map[alarm_name]["st"] = new_status
+                        upd_alarm_map[alarm_name]["lastTransTs"] = ts
+                        add_to_alarm_log(log_level, alarm_name, ts, instance, new_status)
+                        if alarm_map_part == "errors" and new_status == "in":
+                            is_nd_marker_needed = True
+                else:
+                    upd_alarm_map[alarm_name]["persist"] = False
+                    upd_alarm_map[alarm_name]["lastInPayloadTs"] = ts
+                    if alarm_map_part == "errors" and has_value:
+                        is_nd_marker_needed = True
+                    if upd_alarm_map[alarm_name]["st"] != "in":
+                        upd_alarm_map[alarm_name]["st"] = "in"
+                        upd_alarm_map[alarm_name]["lastTransTs"] = ts
+                        add_to_alarm_log(log_level, alarm_name, ts, instance, "in")
+                        if alarm_map_part == "errors":
+                            is_nd_marker_needed = True
+            else:
+                upd_alarm_map[alarm_name] = {}
+                if isinstance(ind_alarm_obj, dict) and (
+                    (new_status := str(ind_alarm_obj.get("st")).lower()) == "in" or new_status == "out"
+                ):
+                    upd_alarm_map[alarm_name]["persist"] = True
+                    upd_alarm_map[alarm_name]["st"] = new_status
+                    upd_alarm_map[alarm_name]["lastInPayloadTs"] = ts
+                    upd_alarm_map[alarm_name]["lastTransTs"] = ts
+                    if new_status == "in":
+                        add_to_alarm_log(log_level, alarm_name, ts, instance, "in")
+                        if alarm_map_part == "errors":
+                            is_nd_marker_needed = True
+                else:
+                    upd_alarm_map[alarm_name]["persist"] = False
+                    upd_alarm_map[alarm_name]["st"] = "in"
+                    upd_alarm_map[alarm_name]["lastInPayloadTs"] = ts
+                    upd_alarm_map[alarm_name]["lastTransTs"] = ts
+                    add_to_alarm_log(log_level, alarm_name, ts, instance, "in")
+                    if alarm_map_part == "errors":
+                        is_nd_marker_needed = True
+
+    for alarm_name, ind_alarm_obj in upd_alarm_map.items():
+        if ind_alarm_obj["persist"]:
+            if (
+                alarm_map_part == "errors"
+                and ind_alarm_obj["st"] == "in"
+                and ind_alarm_obj["lastInPayloadTs"] < ts
+                and has_value
+            ):
+                ind_alarm_obj["st"] = "out"
+                ind_alarm_obj["lastTransTs"] = ts
+                add_to_alarm_log(log_level, alarm_name, ts, instance, "out")
+        else:
+            if ind_alarm_obj["st"] == "in" and (alarm_dict_for_ts is None or alarm_dict_for_ts.get(alarm_name) is None):
+                ind_alarm_obj["st"] = "out"
+                ind_alarm_obj["lastTransTs"] = ts
+                add_to_alarm_log(log_level, alarm_name, ts, instance, "out")
+
+    return upd_alarm_map, is_nd_marker_needed
+
+
+def get_payload_rows(alarm_payload):
+    # the same as the app wrapper does with 'alarm_payload', sorted by ts as 'AlarmPayloadBuilder.get_rows'
+    return [(ts, row.get("e"), row.get("w"), row.get("i")) for ts, row in sorted(alarm_payload.items())]
+
+
+class AlarmPayloadTest(SimpleTestCase):
+    """
+    'add_to_alarm_payload' and 'AlarmPayloadBuilder', the rows of the builder should be the same
+    as the ones the app wrapper gets from the alarm payload.
+    """
+
+    def test_alarms_at_same_ts(self):
+        alarm_payload = {}
+        builder = AlarmPayloadBuilder(create_instance())
+        for alarm_name, alarm_dict, key in (
+            ("CPU Error", {"st": "in"}, "e"),
+            ("Another error", {}, "e"),
+            ("Some warning", {}, "w"),
+            ("Info 1", None, "i"),
+            ("Info 2", None, "i"),
+        ):
+            add_to_alarm_payload(alarm_payload, alarm_name, alarm_dict, 1000, key)
+            builder.add(alarm_name, alarm_dict, 1000, key)
+
+        self.assertEqual(
+            alarm_payload,
+            {
+                1000: {
+                    "e": {"CPU Error": {"st": "in"}, "Another error": {}},
+                    "w": {"Some warning": {}},
+                    "i": ["Info 1", "Info 2"],
+                }
+            },
+        )
+        self.assertEqual(builder.get_rows(), get_payload_rows(alarm_payload))
+
+    def test_add_same_as_payload(self):
+        rng = random.Random(49)
+        for _ in range(500):
+            alarm_payload = {}
+            builder = AlarmPayloadBuilder(create_instance())
+            for _ in range(rng.randint(0, 30)):
+                ts = rng.choice([3000, 1000, 2000])  # not in order
+                key = rng.choice(["e", "w", "i"])
+                alarm_name = rng.choice(["a", "b", "c"])
+                alarm_dict = None if key == "i" else rng.choice([{}, {"st": "in"}, {"st": "out"}])
+                add_to_alarm_payload(alarm_payload, alarm_name, alarm_dict, ts, key)
+                builder.add(alarm_name, alarm_dict, ts, key)
+            with self.subTest(alarm_payload=alarm_payload):
+                self.assertEqual(builder.get_rows(), get_payload_rows(alarm_payload))
+
+    def check_transitions(self, instance, is_in, exp_transitions):
+        tss = np.arange(1, len(is_in) + 1, dtype=np.int64) * 1000
+        builder = AlarmPayloadBuilder(instance)
+        builder.add_transitions("Stall", np.array(is_in, dtype=bool), tss, "w")
+
+        alarm_payload = {}
+        for idx, st in exp_transitions:
+            add_to_alarm_payload(alarm_payload, "Stall", {"st": st}, int(tss[idx]), "w")
+        self.assertEqual(builder.get_rows(), get_payload_rows(alarm_payload))
+
+    def test_transitions_only(self):
+        is_in = [False, True, True, False, False, True]
+        self.check_transitions(create_instance(), is_in, [(1, "in"), (3, "out"), (5, "in")])
+        out_instance = create_instance(warnings={"Stall": {"st": "out"}})
+        self.check_transitions(out_instance, is_in, [(1, "in"), (3, "out"), (5, "in")])
+        # the alarm is "in" already, so there is no transition at the first timestamp
+        in_instance = create_instance(warnings={"Stall": {"st": "in"}})
+        self.check_transitions(in_instance, is_in, [(0, "out"), (1, "in"), (3, "out"), (5, "in")])
+        self.check_transitions(in_instance, [True, True, False], [(2, "out")])
+        # an error with the same name does not count
+        self.check_transitions(create_instance(errors={"Stall": {"st": "in"}}), [True, True], [(0, "in")])
+        self.check_transitions(create_instance(), [False, False], [])
+        self.check_transitions(in_instance, [], [])
+
+    def test_transitions_with_other_alarms(self):
+        builder = AlarmPayloadBuilder(create_instance())
+        tss = np.array([1000, 2000, 3000], dtype=np.int64)
+        builder.add_transitions("Stall", np.array([True, True, False]), tss, "w")
+        builder.add_transitions("Reversed", np.array([True, False, False]), tss, "w")
+        builder.add("Wrong data", {}, 2000, "e")
+
+        alarm_payload = {}
+        add_to_alarm_payload(alarm_payload, "Stall", {"st": "in"}, 1000, "w")
+        add_to_alarm_payload(alarm_payload, "Reversed", {"st": "in"}, 1000, "w")
+        add_to_alarm_payload(alarm_payload, "Reversed", {"st": "out"}, 2000, "w")
+        add_to_alarm_payload(alarm_payload, "Wrong data", {}, 2000, "e")
+        add_to_alarm_payload(alarm_payload, "Stall", {"st": "out"}, 3000, "w")
+        self.assertEqual(builder.get_rows(), get_payload_rows(alarm_payload))
+        # both alarms at 1000 survive
+        self.assertEqual(builder.get_rows()[0], (1000, None, {"Stall": {"st": "in"}, "Reversed": {"st": "in"}}, None))
+
+
+class AlarmStateTest(SimpleTestCase):
+    """
+    'AlarmState.update_part' against 'update_part_of_alarm_map' used the way the callers used it:
+    the part of the map was replaced by the updated copy and the instance was saved if the copy differed.
+    'changed' should be the alarms that differ from the initial map, as only they are saved.
+    """
+
+    alarm_names = ["a", "b", "c"]
+
+    def run_updates(self, update_func, alarms, updates):
+        alarm_log = []
+
+        def add_to_log(type, msg, ts, instance=None, *args):
+            alarm_log.append((type, msg, ts, *args))
+
+        # every record is copied, so the records used twice in 'alarms' are not shared (they never are in the db)
+        alarms = {part: {name: dict(alarm) for name, alarm in alarm_map.items()} for part, alarm_map in alarms.items()}
+        instance = create_instance(**alarms)
+        with (
+            mock.patch("utils.alarm_utils.add_to_alarm_log", add_to_log),
+            mock.patch(f"{__name__}.add_to_alarm_log", add_to_log),
+        ):
+            result = update_func(instance, updates)
+        # the order of the alarms in the map matters, it is the order of the "out" transitions in the log
+        alarm_maps = {part: list(alarm_map.items()) for part, alarm_map in instance.alarms.items()}
+        return alarm_maps, alarm_log, result
+
+    def update_by_state(self, instance, updates):
+        alarm_state = AlarmState(instance)
+        nd_flags = [alarm_state.update_part(*update) for update in updates]
+        return nd_flags, alarm_state.is_dirty, alarm_state.changed
+
+    def update_by_copies(self, instance, updates):
+        initial_alarms = copy.deepcopy(instance.alarms)
+        nd_flags = []
+        is_changed = False
+        for alarm_dict_for_ts, ts, part, has_value in updates:
+            upd_alarm_map, is_nd_marker_needed = update_part_of_alarm_map(
+                instance, alarm_dict_for_ts, ts, part, has_value
+            )
+            nd_flags.append(is_nd_marker_needed)
+            if upd_alarm_map != instance.alarms[part]:
+                instance.alarms[part] = upd_alarm_map
+                is_changed = True
+        # the alarms to be saved
+        changed = set()
+        for part, alarm_map in instance.alarms.items():
+            for alarm_name, alarm in alarm_map.items():
+                if initial_alarms[part].get(alarm_name) != alarm:
+                    changed.add((part, alarm_name))
+        return nd_flags, is_changed, changed
+
+    def check(self, alarms, updates):
+        with self.subTest(alarms=alarms, updates=updates):
+            alarm_maps, alarm_log, (nd_flags, is_dirty, changed) = self.run_updates(
+                self.update_by_state, alarms, updates
+            )
+            exp_alarm_maps, exp_alarm_log, (exp_nd_flags, was_saved, exp_changed) = self.run_updates(
+                self.update_by_copies, alarms, updates
+            )
+            self.assertEqual(alarm_maps, exp_alarm_maps)
+            self.assertEqual(alarm_log, exp_alarm_log)
+            self.assertEqual(nd_flags, exp_nd_flags)
+            self.assertEqual(changed, exp_changed)
+            self.assertEqual(is_dirty, len(exp_changed) > 0)
+            # the previous code also saved the map when an alarm went "in" and back "out" at the same timestamp
+            # in two calls, the map it saved was the same as before
+            self.assertTrue(was_saved or not is_dirty)
+
+    def test_cases(self):
+        persistent_in = {"persist": True, "st": "in", "lastTransTs": 0, "lastInPayloadTs": 0}
+        non_persistent_in = {"persist": False, "st": "in", "lastTransTs": 0, "lastInPayloadTs": 0}
+        out = {"persist": True, "st": "out", "lastTransTs": 0, "lastInPayloadTs": 0}
+        # repeated in/out of the same alarm
+        for alarm in (persistent_in, non_persistent_in, out, None):
+            alarms = {} if alarm is None else {"errors": {"a": alarm}}
+            self.check(
+                alarms,
+                [
+                    ({"a": {"st": "in"}}, 10, "errors", True),
+                    ({"a": {"st": "out"}}, 11, "errors", False),
+                    ({"a": {"st": "in"}}, 12, "errors", False),
+                    ({"a": {}}, 13, "errors", True),
+                    (None, 14, "errors", False),
+                    ({"a": {"st": "in"}}, 15, "errors", False),
+                    (None, 16, "errors", True),
+                ],
+            )
+        # "out" for an alarm that is not "in" (or is not known at all), nothing changes but 'lastInPayloadTs'
+        self.check({"warnings": {"a": out}}, [({"a": {"st": "out"}}, 10, "warnings", False)])
+        self.check({"warnings": {"a": out}}, [({"a": {"st": "out"}}, 0, "warnings", False)])
+        self.check({}, [({"a": {"st": "out"}}, 10, "warnings", False)])
+        # errors and warnings with the same names at the same timestamp
+        self.check(
+            {"errors": {"a": non_persistent_in}, "warnings": {"a": persistent_in, "b": non_persistent_in}},
+            [
+                ({"a": {}, "b": {"st": "in"}}, 10, "errors", True),
+                ({"a": {"st": "out"}}, 10, "warnings", False),
+                (None, 11, "errors", True),
+                ({"b": {}}, 11, "warnings", False),
+            ],
+        )
+        # nothing comes and nothing is "in"
+        self.check({"errors": {"a": out}}, [(None, 10, "errors", True), (None, 10, "warnings", True)])
+
+    def random_alarm_map(self, rng):
+        alarm_map = {}
+        for name in rng.sample(self.alarm_names, rng.randint(0, len(self.alarm_names))):
+            alarm_map[name] = {
+                "persist": rng.random() < 0.5,
+                "st": rng.choice(["in", "out"]),
+                "lastTransTs": rng.randint(0, 5),
+                "lastInPayloadTs": rng.randint(0, 5),
+            }
+        return alarm_map
+
+    def test_random_updates(self):
+        rng = random.Random(47)
+        alarm_objs = [{}, {"st": "in"}, {"st": "out"}, {"st": "IN"}, {"st": "unknown"}, "in", None]
+        for _ in range(5000):
+            alarms = {"errors": self.random_alarm_map(rng), "warnings": self.random_alarm_map(rng)}
+            updates = []
+            ts = rng.randint(0, 5)
+            for _ in range(rng.randint(1, 8)):
+                ts += rng.choice([0, 1, 1, 2])
+                for part in ("errors", "warnings"):
+                    alarm_dict = None
+                    if rng.random() < 0.7:
+                        names = rng.sample(self.alarm_names, rng.randint(0, 2))
+                        alarm_dict = {name: rng.choice(alarm_objs) for name in names}
+                    updates.append((alarm_dict, ts, part, rng.random() < 0.5))
+            self.check(alarms, updates)
@@ -0,0 +1,6 @@
+from django.urls import path
+from .views import ListActiveAlarms
+
+urlpatterns = [
+    path("", ListActiveAlarms.as_view()),
+]
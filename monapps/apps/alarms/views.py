@@ -0,0 +1,20 @@
+from rest_framework import generics
+
+from .models import Alarm
+from .serializers import AlarmSerializer
+
+
+class ListActiveAlarms(generics.ListAPIView):
+    """
+    The alarms that are "in" now, can be filtered by '?kind=errors' and '?type=device' (the query uses 'alarm_in_idx').
+    """
+
+    serializer_class = AlarmSerializer
+
+    def get_queryset(self):
+        qs = Alarm.objects.filter(st="in")
+        if (kind := self.request.query_params.get("kind")) is not None:
+            qs = qs.filter(kind=kind)
+        if (entity_type := self.request.query_params.get("type")) is not None:
+            qs = qs.filter(entity_type=entity_type)
+        return qs.order_by("kind", "entity_type", "entity_id", "name")
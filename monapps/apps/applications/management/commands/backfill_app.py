@@ -0,0 +1,67 @@
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.applications.models import Application
+from common.constants import BackfillStates
+from tasks.backfill_app import backfill_app
+
+
+class Command(BaseCommand):
+    help = "Starts, pauses or resumes the backfill of a catching up application"
+
+    def add_arguments(self, parser):
+        parser.add_argument("app_id", type=int)
+        group = parser.add_mutually_exclusive_group()
+        group.add_argument("--pause", action="store_true", help="stop after the current window")
+        group.add_argument("--resume", action="store_true", help="continue from the last committed cursor")
+        group.add_argument(
+            "--cancel", action="store_true", help="return the app to the app scheduler without finishing the backfill"
+        )
+
+    def handle(self, *args, **kwargs):
+        app_id = kwargs["app_id"]
+        app = Application.objects.filter(pk=app_id).first()
+        if app is None:
+            raise CommandError(f"No application with id {app_id}")
+
+        # the state is changed only if it is still the one that was checked, so two commands given at the same time
+        # (or a command and a finishing backfill task) cannot both succeed
+        if kwargs["pause"]:
+            if app.backfill_state != BackfillStates.RUNNING:
+                raise CommandError(f"{app} is not being backfilled")
+            if not self.change_state(app, BackfillStates.PAUSED):
+                raise CommandError(f"The backfill state of {app} was changed meanwhile, try again")
+            self.stdout.write(f"Backfill of {app} will be paused after the current window")
+            return
+
+        if kwargs["cancel"]:
+            if app.backfill_state == BackfillStates.NONE:
+                raise CommandError(f"{app} is not being backfilled")
+            # a running backfill task stops after the current window
+            if not self.change_state(app, BackfillStates.NONE, backfill_token=None):
+                raise CommandError(f"The backfill state of {app} was changed meanwhile, try again")
+            self.stdout.write(f"Backfill of {app} cancelled at cursor {app.cursor_ts}")
+            return
+
+        if kwargs["resume"]:
+            if app.backfill_state != BackfillStates.PAUSED:
+                raise CommandError(f"Backfill of {app} is not paused")
+        elif app.backfill_state != BackfillStates.NONE:
+            raise CommandError(f"{app} is already being backfilled, use --pause or --resume")
+        elif not app.is_enabled:
+            raise CommandError(f"{app} is not enabled")
+
+        # the task of the previous chain (f.e. still finishing its window after '--pause') stops
+        # as soon as it sees the new token, so only one chain runs
+        backfill_token = uuid.uuid4()
+        if not self.change_state(app, BackfillStates.RUNNING, backfill_token=backfill_token):
+            raise CommandError(f"The backfill state of {app} was changed meanwhile, try again")
+        backfill_app.delay(app_id, str(backfill_token))
+        self.stdout.write(f"Backfill of {app} started from cursor {app.cursor_ts}")
+
+    def change_state(self, app: Application, backfill_state: BackfillStates, **fields) -> bool:
+        num_updated = Application.objects.filter(pk=app.pk, backfill_state=app.backfill_state).update(
+            backfill_state=backfill_state, **fields
+        )
+        return num_updated == 1
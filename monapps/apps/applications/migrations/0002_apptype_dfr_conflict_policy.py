@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-19 18:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('applications', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='apptype',
+            name='dfr_conflict_policy',
+            field=models.IntegerField(choices=[(0, 'Fail'), (1, 'Skip'), (2, 'Overwrite')], default=0),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2 on 2026-10-19 18:43
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def delete_app_periodic_tasks(apps, schema_editor):
+    # the per-app periodic tasks call "evaluate.app_func" without 'app_id', the apps are run by 'dispatch_apps' now
+    Application = apps.get_model("applications", "Application")
+    PeriodicTask = apps.get_model("django_celery_beat", "PeriodicTask")
+    PeriodicTasks = apps.get_model("django_celery_beat", "PeriodicTasks")
+    task_ids = list(Application.objects.filter(task__isnull=False).values_list("task_id", flat=True))
+    PeriodicTask.objects.filter(pk__in=task_ids).delete()
+    # the signals that tell beat about the changed schedule are not sent from migrations
+    PeriodicTasks.objects.update_or_create(ident=1, defaults={"last_update": timezone.now()})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('applications', '0002_apptype_dfr_conflict_policy'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_app_periodic_tasks, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='application',
+            name='task',
+        ),
+        migrations.AddField(
+            model_name='application',
+            name='next_run_ts',
+            field=models.BigIntegerField(db_index=True, default=0),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-19 18:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('applications', '0003_app_scheduler'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='application',
+            name='backfill_state',
+            field=models.IntegerField(choices=[(0, 'None'), (1, 'Running'), (2, 'Paused')], default=0),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2 on 2026-10-19 18:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('applications', '0004_application_backfill_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AppState',
+            fields=[
+                ('pk', models.CompositePrimaryKey('app_id', 'name', blank=True, editable=False, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=200)),
+                ('dtype', models.CharField(max_length=50)),
+                ('shape', models.JSONField(default=list)),
+                ('data', models.BinaryField()),
+                ('ts', models.BigIntegerField()),
+                ('app', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='state_items', related_query_name='state_item', to='applications.application')),
+            ],
+            options={
+                'db_table': 'app_states',
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-19 19:14
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('alarms', '0002_copy_alarm_maps'),
+        ('applications', '0005_appstate'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='application',
+            name='alarms',
+        ),
+    ]
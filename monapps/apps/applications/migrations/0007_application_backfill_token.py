@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-19 19:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('applications', '0006_remove_alarms'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='application',
+            name='backfill_token',
+            field=models.UUIDField(blank=True, default=None, null=True),
+        ),
+    ]
@@ -1,8 +1,8 @@
 from django.db import models
-from django_celery_beat.models import PeriodicTask, IntervalSchedule
+from django_celery_beat.models import IntervalSchedule
 
 from apps.assets.models import Asset
-from common.abstract_classes import PublishingOnSaveModel
+from common.abstract_classes import ChildCountedModel, AlarmMapMixin
 from common.constants import (
     StatusTypes,
     CurrStateTypes,
@@ -10,6 +10,8 @@ from common.constants import (
     CurrStateUse,
     HealthGrades,
     AppPurps,
+    DfrConflictPolicies,
+    BackfillStates,
     DEFAULT_T_RESAMPLE,
     DEFAULT_T_STATUS_STALE,
     DEFAULT_T_CURR_STATE_STALE,
@@ -18,7 +20,6 @@ from common.constants import (
     CURR_STATE_FIELD_NAME,
 )
 from utils.ts_utils import create_now_ts_ms
-from utils.db_field_utils import create_alarms_field_default
 
 
 class AppType(models.Model):
@@ -41,6 +42,8 @@ class AppType(models.Model):
     # -> https://json-schema.org/understanding-json-schema/basics
     settings_jsonschema = models.JSONField(default=dict, blank=True)
     func_name = models.CharField(max_length=200)
+    # applies to both resampled and derived df readings of the applications of this type
+    dfr_conflict_policy = models.IntegerField(default=DfrConflictPolicies.FAIL, choices=DfrConflictPolicies.choices)
 
     @property
     def has_status(self) -> bool:
@@ -54,7 +57,7 @@ class AppType(models.Model):
         return f"AppType '{self.name}'"
 
 
-class Application(PublishingOnSaveModel):
+class Application(AlarmMapMixin, ChildCountedModel):
 
     class Meta:
         db_table = "applications"
@@ -79,7 +82,6 @@ class Application(PublishingOnSaveModel):
 
     settings = models.JSONField(default=dict, blank=True)  # application settings in format "{valid from": {settings},}
     state = models.JSONField(default=dict, blank=True)  # for retaining the state between calculations
-    alarms = models.JSONField(default=create_alarms_field_default)
 
     cursor_ts = models.BigIntegerField(default=0)
     is_enabled = models.BooleanField(default=False)
@@ -94,6 +96,11 @@ class Application(PublishingOnSaveModel):
         related_query_name="catching_up_app",
     )
     is_catching_up = models.BooleanField(default=False)
+    # when the app function is to be invoked next time, the app scheduler picks up the apps with 'next_run_ts' <= now
+    next_run_ts = models.BigIntegerField(default=0, db_index=True)
+    backfill_state = models.IntegerField(default=BackfillStates.NONE, choices=BackfillStates.choices)
+    # identifies the chain of 'backfill_app' tasks allowed to run, a new one is made on every start and resume
+    backfill_token = models.UUIDField(default=None, blank=True, null=True)
 
     func_version = models.CharField(max_length=200, default="1.0.0")
 
@@ -113,8 +120,6 @@ class Application(PublishingOnSaveModel):
     is_status_stale = models.BooleanField(default=False)
     is_curr_state_stale = models.BooleanField(default=False)
 
-    task = models.OneToOneField(PeriodicTask, on_delete=models.SET_NULL, null=True, blank=True, default=None)
-
     health = models.IntegerField(default=HealthGrades.UNDEFINED, choices=HealthGrades.choices)
     # should be > 4 * t_change + t_resample if there is a datafeed CONT + AVG + restoration enabled
     t_health_error = models.BigIntegerField(default=DEFAULT_T_APP_HEALTH_ERROR)
@@ -156,8 +161,35 @@ class Application(PublishingOnSaveModel):
     def __str__(self):
         return f"Application {self.pk} '{self.type.name}'"
 
+    def get_run_interval_ms(self) -> int:
+        interval = self.catch_up_interval if self.is_catching_up else self.invoc_interval
+        return int(interval.schedule.run_every.total_seconds() * 1000)
+
     def get_native_df_qs(self):
         return self.datafeeds.exclude(datastream__isnull=True)
 
     def get_derived_df_qs(self):
         return self.datafeeds.filter(datastream__isnull=True)
+
+
+class AppState(models.Model):
+    """
+    A named piece of the state of an application function, kept between its invocations.
+    Scalars are stored as 0-d arrays, all the values are stored as raw bytes of a NumPy array.
+    """
+
+    class Meta:
+        db_table = "app_states"
+
+    pk = models.CompositePrimaryKey("app_id", "name")
+    app = models.ForeignKey(
+        Application, on_delete=models.CASCADE, related_name="state_items", related_query_name="state_item"
+    )
+    name = models.CharField(max_length=200)
+    dtype = models.CharField(max_length=50)  # NumPy dtype string, f.e. "<f8"
+    shape = models.JSONField(default=list)  # [] for scalars
+    data = models.BinaryField()
+    ts = models.BigIntegerField()  # the cursor timestamp the value corresponds to
+
+    def __str__(self):
+        return f"AppState app:{self.app_id} '{self.name}'"
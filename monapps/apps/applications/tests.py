@@ -1,3 +1,291 @@
-from django.test import TestCase
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.test import SimpleTestCase
+
+from apps.datafeeds.models import Datafeed
+from apps.dfreadings.models import DfReading
+from common.constants import CurrStateTypes, HealthGrades, CURR_STATE_FIELD_NAME
+from app_functions.stall_detection_by_two_temps.kernels import find_curr_states
+from app_functions.stall_detection_by_two_temps import ver_0_0_1, ver_0_0_2
+from utils.rolling_utils import RollingSum, RollingMean, RollingVariance, RollingMax, RollingMin, Ewma
+
+
+def find_curr_states_0_0_1(temps_in, temps_out, delta_t_in, delta_t_out, prev_curr_state):
+    """
+    The loop of 'stall_detection_by_two_temps_0_0_1' over the grid points, None - no reading.
+    """
+    curr_states = []
+    is_reversed = []
+    for temp_inlet, temp_outlet in zip(temps_in, temps_out):
+        curr_state = CurrStateTypes.UNDEFINED
+        reversed_ = False
+        if temp_inlet is not None and temp_outlet is not None:
+            if temp_outlet - temp_inlet > 0.5:
+                reversed_ = True
+            else:
+                if temp_inlet - temp_outlet > delta_t_in:
+                    curr_state = CurrStateTypes.WARNING
+                elif temp_inlet - temp_outlet < delta_t_in and prev_curr_state < CurrStateTypes.WARNING:
+                    curr_state = CurrStateTypes.OK
+                elif temp_inlet - temp_outlet < delta_t_out:
+                    curr_state = CurrStateTypes.OK
+                else:
+                    curr_state = prev_curr_state
+        prev_curr_state = curr_state
+        curr_states.append(curr_state)
+        is_reversed.append(reversed_)
+    return curr_states, is_reversed
+
+
+class StallDetectionKernelTest(SimpleTestCase):
+    """
+    'find_curr_states' (0.0.2) against the loop of 0.0.1 on generated temperature records.
+    """
+
+    def check(self, temps_in, temps_out, is_valid, delta_t_in, delta_t_out, prev_curr_state):
+        curr_states, is_reversed = find_curr_states(
+            temps_in, temps_out, is_valid, delta_t_in, delta_t_out, prev_curr_state
+        )
+        exp_curr_states, exp_is_reversed = find_curr_states_0_0_1(
+            [t if v else None for t, v in zip(temps_in, is_valid)],
+            [t if v else None for t, v in zip(temps_out, is_valid)],
+            delta_t_in,
+            delta_t_out,
+            prev_curr_state,
+        )
+        self.assertEqual(curr_states.tolist(), exp_curr_states)
+        self.assertEqual(is_reversed.tolist(), exp_is_reversed)
+
+    def test_random_records(self):
+        rng = np.random.default_rng(28)
+        for _ in range(3000):
+            n = int(rng.integers(0, 200))
+            # temperatures as random walks, so the delta T crosses both thresholds and stays between them
+            temps_in = 80 + np.cumsum(rng.normal(0, 1.5, n))
+            temps_out = temps_in - 7 + np.cumsum(rng.normal(0, 1.5, n))
+            # deltas exactly at the thresholds
+            at_threshold = rng.random(n) < 0.05
+            temps_out[at_threshold] = temps_in[at_threshold] - rng.choice([10, 5, -0.5], at_threshold.sum())
+            is_valid = rng.random(n) > 0.1
+            temps_in[~is_valid] = np.nan
+            prev_curr_state = int(rng.choice(CurrStateTypes.values))
+            with self.subTest(n=n):
+                self.check(temps_in, temps_out, is_valid, 10, 5, prev_curr_state)
+
+    def test_hysteresis(self):
+        deltas = np.array([4, 7, 11, 7, 10, 5, 4, 7, -1, 7])
+        temps_in = np.full(len(deltas), 80.0)
+        temps_out = temps_in - deltas
+        is_valid = np.ones(len(deltas), dtype=bool)
+        curr_states, _ = find_curr_states(temps_in, temps_out, is_valid, 10, 5, CurrStateTypes.UNDEFINED)
+        OK, WARNING, UNDEFINED = CurrStateTypes.OK, CurrStateTypes.WARNING, CurrStateTypes.UNDEFINED
+        self.assertEqual(curr_states.tolist(), [OK, OK, WARNING, WARNING, WARNING, WARNING, OK, OK, UNDEFINED, OK])
+        self.check(temps_in, temps_out, is_valid, 10, 5, CurrStateTypes.UNDEFINED)
+
+
+class StallDetectionFunctionTest(SimpleTestCase):
+    """
+    'stall_detection_by_two_temps_0_0_2' against 0.0.1 end to end on a recorded series (1 min resampling),
+    the df readings are given to both versions instead of the db, the kernel is not sandboxed.
+    """
+
+    t_resample = 60000
+    start_rts = 1734567840000
+    # a heat exchanger going into a stall twice (delta T > 10), a gap in the inlet readings
+    # and two points with the outlet warmer than the inlet
+    temps_in = [78.2, 78.5, 79.1, 80.4, 82.0, 83.5, 84.1, 83.0, 81.2, 80.0, None,
+                79.5, 79.0, 78.8, 79.2, 80.1, 83.9, 84.0, 82.5, 80.3]  # fmt: skip
+    temps_out = [72.0, 71.8, 71.5, 71.0, 71.2, 72.1, 72.5, 75.0, 74.6, 73.1, 73.0,
+                 73.6, 79.9, 79.6, 73.0, 72.8, 72.7, 77.5, 76.8, 76.9]  # fmt: skip
+    # the points inside the hysteresis band after a stall: WARNING in both versions,
+    # but "Stall detected" is "in" there only in 0.0.2
+    band_idxs_after_stall = [7, 8, 9, 17, 18]
+    reversed_idxs = [12, 13]
+
+    def setUp(self):
+        self.end_rts = self.start_rts + self.t_resample * len(self.temps_in)
+        self.grid = [self.start_rts + self.t_resample * (i + 1) for i in range(len(self.temps_in))]
+        self.temp_in_df = Datafeed(id=1, name="Temp inlet", ts_to_start_with=self.end_rts)
+        self.temp_out_df = Datafeed(id=2, name="Temp outlet", ts_to_start_with=self.end_rts)
+        self.curr_state_df = Datafeed(id=3, name=CURR_STATE_FIELD_NAME)
+        self.records = {self.temp_in_df.name: self.temps_in, self.temp_out_df.name: self.temps_out}
+
+    def get_df_value_map(self, datafeeds, start_rts, end_rts):
+        df_value_map = {}
+        for df in datafeeds:
+            for rts, value in zip(self.grid, self.records[df.name]):
+                if value is not None and start_rts < rts <= end_rts:
+                    df_value_map.setdefault(rts, {})[df.name] = value
+        return df_value_map
+
+    def get_df_frame(self, datafeeds, start_rts, end_rts, t_resample):
+        values = {}
+        masks = {}
+        for df in datafeeds:
+            masks[df.name] = np.array([value is not None for value in self.records[df.name]])
+            values[df.name] = np.array([np.nan if value is None else value for value in self.records[df.name]])
+        return {"grid": np.array(self.grid, dtype=np.int64), "values": values, "masks": masks}
+
+    def run_version(self, app_func, module, stored_curr_state, app_state):
+        app = SimpleNamespace(
+            cursor_ts=self.start_rts,
+            t_resample=self.t_resample,
+            settings={"delta_t_in": 10, "delta_t_out": 5},
+            alarms={"errors": {}, "warnings": {}},
+        )
+        stored_dfr = None if stored_curr_state is None else SimpleNamespace(value=stored_curr_state)
+        dfr_manager = mock.Mock()
+        dfr_manager.filter.return_value.first.return_value = stored_dfr
+        with (
+            mock.patch.object(DfReading, "objects", dfr_manager),
+            mock.patch.object(module, "get_df_value_map", self.get_df_value_map, create=True),
+            mock.patch.object(module, "get_df_frame", self.get_df_frame, create=True),
+            mock.patch.object(module, "load_app_state", lambda app: app_state, create=True),
+            mock.patch.object(module, "run_in_sandbox", lambda func, *args: func(*args), create=True),
+            mock.patch("builtins.print"),
+        ):
+            native_df_map = {self.temp_in_df.name: self.temp_in_df, self.temp_out_df.name: self.temp_out_df}
+            derived_df_map = {CURR_STATE_FIELD_NAME: self.curr_state_df}
+            derived_df_reading_map, update_map = app_func(app, native_df_map, derived_df_map)
+        if "prev_curr_state" not in app_state:
+            dfr_manager.filter.assert_called_once_with(datafeed=self.curr_state_df, time=self.start_rts)
+        else:
+            dfr_manager.filter.assert_not_called()
+        return derived_df_reading_map[CURR_STATE_FIELD_NAME], update_map
+
+    def alarm_points_0_0_1(self, alarm_payload, alarm_name):
+        # non-persistent alarms, raised at every point where the condition holds
+        return [alarm_name in alarm_payload.get(rts, {}).get("w", {}) for rts in self.grid]
+
+    def alarm_points_0_0_2(self, alarm_rows, alarm_name):
+        # persistent alarms, only the transitions are given
+        transitions = {}
+        for ts, _, warnings, _ in alarm_rows:
+            if alarm_name in (warnings or {}):
+                transitions[ts] = warnings[alarm_name]["st"]
+        is_in = False
+        points = []
+        for rts in self.grid:
+            is_in = transitions.get(rts, "in" if is_in else "out") == "in"
+            points.append(is_in)
+        return points
+
+    def check(self, stored_curr_state, app_state):
+        curr_state_0_0_1, update_map_0_0_1 = self.run_version(
+            ver_0_0_1.stall_detection_by_two_temps_0_0_1, ver_0_0_1, stored_curr_state, {}
+        )
+        curr_state_0_0_2, update_map_0_0_2 = self.run_version(
+            ver_0_0_2.stall_detection_by_two_temps_0_0_2, ver_0_0_2, stored_curr_state, app_state
+        )
+
+        # the current state datafeed
+        exp_curr_states = [(dfr.time, dfr.db_value) for dfr in curr_state_0_0_1["new_df_readings"]]
+        self.assertEqual(len(curr_state_0_0_2["new_df_readings"]), 0)
+        curr_states = list(zip(curr_state_0_0_2["rtss"].tolist(), curr_state_0_0_2["values"].tolist()))
+        self.assertEqual(curr_states, exp_curr_states)
+        self.assertEqual([rts for rts, _ in exp_curr_states], self.grid)
+
+        # the app fields
+        for field in ("health", "cursor_ts", "is_catching_up"):
+            self.assertEqual(update_map_0_0_2.get(field), update_map_0_0_1.get(field))
+        self.assertEqual(update_map_0_0_2["health"], HealthGrades.ERROR)
+        self.assertEqual(update_map_0_0_2["cursor_ts"], self.end_rts)
+        self.assertEqual(update_map_0_0_2["state"], {"prev_curr_state": exp_curr_states[-1][1]})
+
+        # the alarms
+        alarm_payload = update_map_0_0_1["alarm_payload"]
+        alarm_rows = update_map_0_0_2["alarm_rows"]
+        reversed_points = self.alarm_points_0_0_1(alarm_payload, ver_0_0_2.REVERSED_TEMPS_ALARM_NAME)
+        self.assertEqual([i for i, is_in in enumerate(reversed_points) if is_in], self.reversed_idxs)
+        self.assertEqual(self.alarm_points_0_0_2(alarm_rows, ver_0_0_2.REVERSED_TEMPS_ALARM_NAME), reversed_points)
+
+        # 0.0.1: "Stall detected" only where delta T > 'delta_t_in',
+        # 0.0.2: wherever the current state is WARNING, the hysteresis band included
+        warning_points = [value == CurrStateTypes.WARNING for _, value in exp_curr_states]
+        stall_points_0_0_1 = self.alarm_points_0_0_1(alarm_payload, ver_0_0_2.STALL_ALARM_NAME)
+        stall_points_0_0_2 = self.alarm_points_0_0_2(alarm_rows, ver_0_0_2.STALL_ALARM_NAME)
+        self.assertEqual(stall_points_0_0_2, warning_points)
+        only_0_0_2 = [i for i, (old, new) in enumerate(zip(stall_points_0_0_1, stall_points_0_0_2)) if new and not old]
+        self.assertFalse(any(old and not new for old, new in zip(stall_points_0_0_1, stall_points_0_0_2)))
+        return only_0_0_2
+
+    def test_no_stored_curr_state(self):
+        self.assertEqual(self.check(None, {}), self.band_idxs_after_stall)
+
+    def test_stored_curr_state(self):
+        # WARNING at 'start_rts', so the points in the band at the beginning are WARNING too
+        only_0_0_2 = self.check(CurrStateTypes.WARNING, {})
+        self.assertEqual(only_0_0_2, [0, 1, 2, 3, *self.band_idxs_after_stall])
+
+    def test_curr_state_from_app_state(self):
+        only_0_0_2 = self.check(CurrStateTypes.WARNING, {"prev_curr_state": CurrStateTypes.WARNING})
+        self.assertEqual(only_0_0_2, [0, 1, 2, 3, *self.band_idxs_after_stall])
+
+
+class RollingUtilsTest(SimpleTestCase):
+    """
+    The incremental aggregators against naive recomputation over the whole series, the series is fed
+    in random chunks and the aggregators are restored from their state between some of the chunks.
+    """
+
+    def naive(self, values, window, func):
+        return np.array([func(values[max(0, i + 1 - window) : i + 1]) for i in range(len(values))])
+
+    def feed(self, rng, aggr_cls, values, param, max_chunk_size):
+        aggr = aggr_cls(param)
+        results = []
+        pos = 0
+        while pos < len(values):
+            size = int(rng.integers(0, max_chunk_size + 1))  # longer and shorter than the window, empty too
+            results.append(aggr.update(values[pos : pos + size]))
+            pos += size
+            if rng.random() < 0.5:
+                aggr = aggr_cls.from_state("aggr", aggr.to_state("aggr"), param)
+        return np.concatenate(results) if results else np.zeros(0)
+
+    def check(self, aggr_cls, func, num_series=300):
+        rng = np.random.default_rng(37)
+        for _ in range(num_series):
+            window = int(rng.integers(1, 12))
+            values = rng.normal(1000, 10, int(rng.integers(0, 60)))
+            with self.subTest(aggr=aggr_cls.__name__, window=window, n=len(values)):
+                np.testing.assert_allclose(
+                    self.feed(rng, aggr_cls, values, window, 2 * window + 2),
+                    self.naive(values, window, func),
+                    rtol=1e-7,
+                    atol=1e-6,
+                    equal_nan=True,
+                )
+
+    def test_rolling_sum(self):
+        self.check(RollingSum, np.sum)
+
+    def test_rolling_mean(self):
+        self.check(RollingMean, np.mean)
+
+    def test_rolling_variance(self):
+        self.check(RollingVariance, lambda window: np.var(window, ddof=1) if len(window) > 1 else np.nan)
+
+    def test_rolling_max_min(self):
+        self.check(RollingMax, np.max)
+        self.check(RollingMin, np.min)
+
+    def test_ewma(self):
+        rng = np.random.default_rng(37)
+        for _ in range(300):
+            alpha = float(rng.uniform(0.01, 1))
+            values = rng.normal(0, 10, int(rng.integers(0, 60)))
+            expected = []
+            for value in values:
+                expected.append(value if len(expected) == 0 else alpha * value + (1 - alpha) * expected[-1])
+            with self.subTest(alpha=alpha, n=len(values)):
+                np.testing.assert_allclose(self.feed(rng, Ewma, values, alpha, 10), expected, rtol=1e-9, atol=1e-9)
+
+    def test_state_after_window_change(self):
+        # the state of another window length is dropped
+        aggr = RollingSum(3)
+        aggr.update(np.array([1.0, 2.0, 3.0]))
+        restored = RollingSum.from_state("aggr", aggr.to_state("aggr"), 5)
+        np.testing.assert_allclose(restored.update(np.array([4.0])), [4.0])
@@ -0,0 +1,65 @@
+# Generated by Django 5.2 on 2026-10-19 19:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# the counters of the existing children, so the assets are not rolled up from empty counters;
+# a frozen copy of 'EXPECTED_COUNTERS_SQL' as of this migration ("use" 0 - DONT_USE, 3 - HEALTH_USE)
+FILL_COUNTERS_SQL = """
+    INSERT INTO asset_child_counters (asset_id, prop, value, use, is_stale, count)
+    SELECT parent_id, 'status', status, status_use, is_status_stale, count(*)
+    FROM applications
+    WHERE parent_id IS NOT NULL AND status IS NOT NULL AND status_use <> 0
+    GROUP BY 1, 3, 4, 5
+    UNION ALL
+    SELECT parent_id, 'curr_state', curr_state, curr_state_use, is_curr_state_stale, count(*)
+    FROM applications
+    WHERE parent_id IS NOT NULL AND curr_state IS NOT NULL AND curr_state_use <> 0
+    GROUP BY 1, 3, 4, 5
+    UNION ALL
+    SELECT parent_id, 'status', status, status_use, FALSE, count(*)
+    FROM assets
+    WHERE parent_id IS NOT NULL AND status IS NOT NULL AND status_use <> 0
+    GROUP BY 1, 3, 4
+    UNION ALL
+    SELECT parent_id, 'curr_state', curr_state, curr_state_use, FALSE, count(*)
+    FROM assets
+    WHERE parent_id IS NOT NULL AND curr_state IS NOT NULL AND curr_state_use <> 0
+    GROUP BY 1, 3, 4
+    UNION ALL
+    SELECT parent_id, 'health', health, 3, FALSE, count(*)
+    FROM (
+        SELECT parent_id, health FROM applications
+        UNION ALL SELECT parent_id, health FROM devices
+        UNION ALL SELECT parent_id, health FROM assets
+    ) AS children
+    WHERE parent_id IS NOT NULL
+    GROUP BY 1, 3
+"""
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assets', '0001_initial'),
+        ('applications', '0001_initial'),
+        ('devices', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AssetChildCounter',
+            fields=[
+                ('pk', models.CompositePrimaryKey('asset_id', 'prop', 'value', 'use', 'is_stale', blank=True, editable=False, primary_key=True, serialize=False)),
+                ('prop', models.CharField(max_length=50)),
+                ('value', models.IntegerField()),
+                ('use', models.IntegerField()),
+                ('is_stale', models.BooleanField()),
+                ('count', models.IntegerField(default=0)),
+                ('asset', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='child_counters', related_query_name='child_counter', to='assets.asset')),
+            ],
+            options={
+                'db_table': 'asset_child_counters',
+            },
+        ),
+        migrations.RunSQL(FILL_COUNTERS_SQL, migrations.RunSQL.noop),
+    ]
@@ -1,11 +1,11 @@
 from django.db import models
 from django.contrib.postgres.fields import ArrayField
 
-from common.abstract_classes import PublishingOnSaveModel
+from common.abstract_classes import ChildCountedModel
 from common.constants import StatusTypes, CurrStateTypes, HealthGrades, StatusUse, CurrStateUse, AssetTypes
 
 
-class Asset(PublishingOnSaveModel):
+class Asset(ChildCountedModel):
     """
     Represents a monitored asset (a heat exchanger, a pipe, a whole workshop, etc).
     An asset can contain other assets and also applications/devices as leaves of the tree.
@@ -55,3 +55,26 @@ class Asset(PublishingOnSaveModel):
 
     def __str__(self):
         return f"Asset {self.pk} {self.name}"
+
+
+class AssetChildCounter(models.Model):
+    """
+    The number of children of an asset with a certain value of "status"/"curr_state"/"health",
+    a certain '*_use' and staleness. Maintained by 'ChildCountedModel', see 'child_counter_utils'.
+    """
+
+    class Meta:
+        db_table = "asset_child_counters"
+
+    pk = models.CompositePrimaryKey("asset_id", "prop", "value", "use", "is_stale")
+    asset = models.ForeignKey(
+        Asset, on_delete=models.CASCADE, related_name="child_counters", related_query_name="child_counter"
+    )
+    prop = models.CharField(max_length=50)  # "status", "curr_state" or "health"
+    value = models.IntegerField()
+    use = models.IntegerField()
+    is_stale = models.BooleanField()
+    count = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"AssetChildCounter asset:{self.asset_id} {self.prop}={self.value} use:{self.use} stale:{self.is_stale}"
@@ -1,3 +1,120 @@
-from django.test import TestCase
+from itertools import combinations_with_replacement, product
+from types import SimpleNamespace
 
-# Create your tests here.
+from django.test import SimpleTestCase
+
+from common.constants import StatusTypes, CurrStateTypes, HealthGrades, StatusUse
+from utils.rollup_utils import rollup, rollup_health
+from utils.child_counter_utils import get_counter_keys, derive_from_child_counters
+
+
+def derive_from_children(children_objects, prop):
+    """
+    'derive_status_from_children'/'derive_curr_state_from_children' as they were before 'rollup_utils'
+    (the two functions differed only in the names of the fields).
+    """
+    value_type = StatusTypes if prop == "status" else CurrStateTypes
+    assumption = value_type.UNDEFINED
+    is_none_assumption = True
+    num_with_error = 0
+    num_with_warn_ok = 0
+
+    for obj in children_objects:  # first cycle
+        if getattr(obj, prop) is None or getattr(obj, f"{prop}_use") == StatusUse.DONT_USE:
+            continue
+        if getattr(obj, f"is_{prop}_stale"):
+            is_none_assumption = False
+            continue
+        is_none_assumption = False
+        if getattr(obj, prop) in (value_type.OK, value_type.WARNING):
+            num_with_warn_ok += 1
+        elif getattr(obj, prop) == value_type.ERROR:
+            num_with_error += 1
+
+    all_have_error = num_with_warn_ok == 0 and num_with_error > 0
+
+    if is_none_assumption:
+        return None
+    for obj in children_objects:  # second cycle
+        value = getattr(obj, prop)
+        use = getattr(obj, f"{prop}_use")
+        if value is None or use == StatusUse.DONT_USE or getattr(obj, f"is_{prop}_stale"):
+            continue
+        if value > assumption:
+            if value == value_type.ERROR:
+                if use == StatusUse.AS_WARNING or (use == StatusUse.AS_ERROR_IF_ALL and not all_have_error):
+                    assumption = value_type.WARNING
+                else:
+                    assumption = value
+            else:
+                assumption = value
+    return assumption
+
+
+def derive_health_from_children(children_objects):
+    """
+    'derive_health_from_children' as it was before 'rollup_utils'.
+    """
+    assumption = HealthGrades.UNDEFINED
+    num_with_error = 0
+    num_with_warn_ok = 0
+    for obj in children_objects:
+        if obj.health in (HealthGrades.OK, HealthGrades.WARNING):
+            num_with_warn_ok += 1
+        elif obj.health == HealthGrades.ERROR:
+            num_with_error += 1
+
+    if num_with_warn_ok == 0 and num_with_error > 0:
+        return HealthGrades.ERROR
+    for obj in children_objects:
+        if obj.health > assumption:
+            assumption = HealthGrades.WARNING if obj.health == HealthGrades.ERROR else obj.health
+    return assumption
+
+
+class RollupTest(SimpleTestCase):
+    """
+    'rollup' (over the children rows and over the child counters) against the previous implementation
+    on all the sets of children over every combination of value, use and staleness.
+    """
+
+    def count_rows(self, children, prop):
+        rows = {}
+        for obj in children:
+            key = (getattr(obj, prop), getattr(obj, f"{prop}_use"), getattr(obj, f"is_{prop}_stale"))
+            rows[key] = rows.get(key, 0) + 1
+        return [(*key, count) for key, count in rows.items()]
+
+    def count_counters(self, children, prop):
+        counters = {}
+        for obj in children:
+            if (key := get_counter_keys(obj, [prop])[prop]) is not None:
+                counters[key[1:]] = counters.get(key[1:], 0) + 1
+        return counters
+
+    def test_status_and_curr_state(self):
+        for prop, value_type in (("status", StatusTypes), ("curr_state", CurrStateTypes)):
+            child_variants = [
+                SimpleNamespace(**{prop: value, f"{prop}_use": use, f"is_{prop}_stale": is_stale})
+                for value, use, is_stale in product([None, *value_type.values], StatusUse.values, [False, True])
+            ]
+            for num_children in range(4):
+                for children in combinations_with_replacement(child_variants, num_children):
+                    expected = derive_from_children(children, prop)
+                    with self.subTest(prop=prop, children=children):
+                        self.assertEqual(rollup(self.count_rows(children, prop), value_type), expected)
+                        counters = self.count_counters(children, prop)
+                        self.assertEqual(derive_from_child_counters(prop, counters), expected)
+
+    def test_health(self):
+        child_variants = [SimpleNamespace(health=health) for health in HealthGrades.values]
+        for num_children in range(6):
+            for children in combinations_with_replacement(child_variants, num_children):
+                expected = derive_health_from_children(children)
+                counts = {}
+                for obj in children:
+                    counts[obj.health] = counts.get(obj.health, 0) + 1
+                with self.subTest(children=children):
+                    self.assertEqual(rollup_health(counts.items()), expected)
+                    counters = self.count_counters(children, "health")
+                    self.assertEqual(derive_from_child_counters("health", counters), expected)
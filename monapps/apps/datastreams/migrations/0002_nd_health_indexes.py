@@ -0,0 +1,25 @@
+# Generated by Django 5.2 on 2026-10-19 19:04
+
+import django.db.models.expressions
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('datastreams', '0001_initial'),
+        ('datatypes', '0001_initial'),
+        ('devices', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='datastream',
+            index=models.Index(django.db.models.expressions.CombinedExpression(django.db.models.functions.comparison.Coalesce('last_reading_ts', 'created_ts'), '+', models.F('t_nd_health_error')), condition=models.Q(('is_enabled', True), ('t_update__isnull', False), models.Q(('nd_health', 3), _negated=True)), name='ds_nd_deadline_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='datastream',
+            index=models.Index(condition=models.Q(('is_enabled', True), ('t_update__isnull', False), models.Q(('nd_health', 1), _negated=True)), fields=['nd_health'], name='ds_nd_not_ok_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2 on 2026-10-19 19:06
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('datastreams', '0002_nd_health_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='datastream',
+            name='health_next_eval_ts',
+        ),
+    ]
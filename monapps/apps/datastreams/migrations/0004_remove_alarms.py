@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-19 19:14
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('alarms', '0002_copy_alarm_maps'),
+        ('datastreams', '0003_remove_health_next_eval_ts'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='datastream',
+            name='alarms',
+        ),
+    ]
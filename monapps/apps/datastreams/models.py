@@ -1,14 +1,17 @@
 from django.db import models
+from django.db.models import F, Q
+from django.db.models.functions import Coalesce
 
 from apps.devices.models import Device
 from apps.datatypes.models import DataType
-from common.abstract_classes import PublishingOnSaveModel
+from common.abstract_classes import PublishingOnSaveModel, AlarmMapMixin
 from common.constants import VariableTypes, HealthGrades
 from utils.ts_utils import create_now_ts_ms
-from utils.db_field_utils import create_alarms_field_default
+from utils.update_utils import get_ds_nd_deadline
+from services.dirty_queue import mark_dirty
 
 
-class Datastream(PublishingOnSaveModel):
+class Datastream(AlarmMapMixin, PublishingOnSaveModel):
     """
     Represents a "data stream" from a sensor that is part of a digital device.
     Has "health" that represents how regularly data is coming.
@@ -17,6 +20,19 @@ class Datastream(PublishingOnSaveModel):
     class Meta:
         db_table = "datastreams"
         constraints = [models.UniqueConstraint(fields=["name", "parent_id"], name="unique_name_device")]
+        # for 'update_periodic_ds_health', the expressions should be the same as in its query
+        indexes = [
+            models.Index(
+                Coalesce("last_reading_ts", "created_ts") + F("t_nd_health_error"),
+                name="ds_nd_deadline_idx",
+                condition=Q(is_enabled=True, t_update__isnull=False) & ~Q(nd_health=HealthGrades.ERROR),
+            ),
+            models.Index(
+                fields=["nd_health"],
+                name="ds_nd_not_ok_idx",
+                condition=Q(is_enabled=True, t_update__isnull=False) & ~Q(nd_health=HealthGrades.OK),
+            ),
+        ]
 
     published_fields = set(["health", "last_reading_ts", "is_enabled"])
 
@@ -37,7 +53,6 @@ class Datastream(PublishingOnSaveModel):
 
     # a datastream can be deactivated, if all are deactivated, then the parent device is also deactivated
     is_enabled = models.BooleanField(default=True)
-    alarms = models.JSONField(default=create_alarms_field_default)
 
     health = models.IntegerField(default=HealthGrades.UNDEFINED, choices=HealthGrades.choices)  # aggregated health
     # msg_health is health derived from errors/warnings
@@ -45,7 +60,6 @@ class Datastream(PublishingOnSaveModel):
     # will remain Undefined for non-periodic ds
     nd_health = models.IntegerField(default=HealthGrades.UNDEFINED, choices=HealthGrades.choices)
     t_nd_health_error = models.BigIntegerField(default=300000)
-    health_next_eval_ts = models.BigIntegerField(default=0)  # 0 will initiate health eval right after a device creation
 
     max_rate_of_change = models.FloatField(default=1.0)  # TODO: units per second, can't be <= 0, create a validator
     max_plausible_value = models.FloatField(default=1000000.0)  # TODO: should be > min_plausible_value
@@ -70,9 +84,11 @@ class Datastream(PublishingOnSaveModel):
         self.__is_enabled = self.is_enabled
 
     def save(self, **kwargs):
-        if not self.pk:
+        is_adding = not self.pk
+        if is_adding:
             # https://stackoverflow.com/questions/1737017/django-auto-now-and-auto-now-add
             self.created_ts = create_now_ts_ms()
+        is_enabling = self.is_enabled and not is_adding and self.__is_enabled is False
         if self.is_enabled is not None and self.__is_enabled != self.is_enabled:
             self.health = HealthGrades.UNDEFINED
             self.msg_health = HealthGrades.UNDEFINED
@@ -82,3 +98,6 @@ class Datastream(PublishingOnSaveModel):
 
         super().save(**kwargs)
         self.__is_enabled = self.is_enabled
+        if self.t_update is not None and self.is_enabled and (is_adding or is_enabling):
+            # a new (or enabled again) periodic datastream has no deadline in the dirty queue yet
+            mark_dirty("ds_nd_health", [self.pk], get_ds_nd_deadline(self) + 1, postpone=True)
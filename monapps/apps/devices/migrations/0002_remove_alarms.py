@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-19 19:14
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('alarms', '0002_copy_alarm_maps'),
+        ('devices', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='device',
+            name='alarms',
+        ),
+    ]
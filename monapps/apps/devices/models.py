@@ -1,12 +1,11 @@
 from django.db import models
 
 from apps.assets.models import Asset
-from common.abstract_classes import PublishingOnSaveModel
+from common.abstract_classes import ChildCountedModel, AlarmMapMixin
 from common.constants import HealthGrades
-from utils.db_field_utils import create_alarms_field_default
 
 
-class Device(PublishingOnSaveModel):
+class Device(AlarmMapMixin, ChildCountedModel):
     """
     Represents a digital device that collects and transmits data (a LoRa node, a PLC, etc).
     Every device has one or several datastreams (temperature 1, pressure 5, etc).
@@ -30,8 +29,6 @@ class Device(PublishingOnSaveModel):
     description = models.TextField(max_length=1000, blank=True)
     characteristics = models.JSONField(default=dict, blank=True)  # like {"power": 25, "weight": 43.2, ...}
 
-    alarms = models.JSONField(default=create_alarms_field_default)
-
     health = models.IntegerField(
         default=HealthGrades.UNDEFINED, choices=HealthGrades.choices
         )  # aggregated health
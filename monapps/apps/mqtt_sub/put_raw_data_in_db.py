@@ -16,13 +16,107 @@ from apps.dsreadings.models import (
 from utils.prep_ds_readings import prepare_ds_readings
 from utils.prep_nd_markers import prep_nodata_markers
 from utils.ts_utils import create_now_ts_ms
-from utils.update_utils import evaluate_ds_health
-from utils.alarm_utils import update_part_of_alarm_map, at_least_one_alarm_in
+from utils.update_utils import evaluate_ds_health, evaluate_ds_nd_health, get_ds_nd_deadline
+from utils.alarm_utils import AlarmState, at_least_one_alarm_in, save_alarm_states
+from utils.alarm_map_utils import load_alarm_maps
 from utils.sequnce_utils import find_max_ts
 from services.alarm_log import add_to_alarm_log
+from services.dirty_queue import mark_dirty, mark_dirty_each
 from common.constants import HealthGrades, VariableTypes, DataAggrTypes
 
 
+def process_payload_rows(
+    int_key_payload: dict[int, dict],
+    dev: Device,
+    ds_map: dict[str, Datastream],
+    dev_alarm_state: AlarmState,
+    ds_alarm_state_map: dict[str, AlarmState],
+) -> tuple[dict[str, set[int]], dict[str, dict[int, float]]]:
+    """
+    Goes through the rows of the payload (sorted by timestamps) and updates the alarm maps of the device and
+    its datastreams in place. Returns the timestamps of the nd markers and the values for every datastream.
+    """
+    nd_marker_map = {ds_name: set() for ds_name in ds_map}
+    ds_reading_map = {ds_name: {} for ds_name in ds_map}
+    # a row usually has only a few datastreams, the rest of them are processed only if they have
+    # non-persistent alarms "in", as such alarms get "out" when they are not in the payload
+    ds_positions = {ds_name: i for i, ds_name in enumerate(ds_map)}
+    ds_names_with_non_persistent_in = {
+        ds_name for ds_name, alarm_state in ds_alarm_state_map.items() if alarm_state.has_active_non_persistent()
+    }
+
+    for ts, row in int_key_payload.items():
+        needing_nd_marker_dss = set()
+        at_least_one_ds_has_no_errors_and_has_value = False
+        # -2- process datastreams (in the order of 'ds_map', so the alarm log is filled in the same order)
+        ds_names_to_process = (ds_map.keys() & row.keys()) | ds_names_with_non_persistent_in
+        for ds_name in sorted(ds_names_to_process, key=ds_positions.__getitem__):
+            ds = ds_map[ds_name]
+            if (ds_row := row.get(ds_name)) is None:
+                ds_row = {}  # just to ensure '.get' execution
+
+            # -2-1- process ds values
+            has_value = False
+            new_ds_value = ds_row.get("v")
+            if new_ds_value is not None and isinstance(new_ds_value, (int, float)):
+                # add value to the array to be saved later
+                ds_reading_map[ds_name][ts] = new_ds_value
+                has_value = True
+
+            # -2-2- process ds errors
+            ds_error_dict_for_ts = ds_row.get("e")
+            # even if 'ds_error_dict_for_ts' is None, the alarm map will be processed
+            # to ensure 'out' statuses proper assigment
+            is_nd_marker_needed = ds_alarm_state_map[ds_name].update_part(ds_error_dict_for_ts, ts, "errors", has_value)
+
+            if is_nd_marker_needed:
+                needing_nd_marker_dss.add(ds.name)
+            else:
+                if has_value:
+                    at_least_one_ds_has_no_errors_and_has_value = True
+
+            # -2-3- process ds warnings
+            ds_warning_dict_for_ts = ds_row.get("w")
+            ds_alarm_state_map[ds_name].update_part(ds_warning_dict_for_ts, ts, "warnings")
+
+            # -2-4- process ds infos
+            ds_infos_for_ts = ds_row.get("i")
+            if ds_infos_for_ts is not None and isinstance(ds_infos_for_ts, Iterable):
+                for info_str in ds_infos_for_ts:
+                    add_to_alarm_log("INFO", info_str, ts, ds, "")
+
+            if ds_alarm_state_map[ds_name].has_active_non_persistent():
+                ds_names_with_non_persistent_in.add(ds_name)
+            else:
+                ds_names_with_non_persistent_in.discard(ds_name)
+
+        # -3- Process the device
+        # -3-1- process device errors
+        dev_error_dict_for_ts = row.get("e")
+        is_nd_marker_needed = dev_alarm_state.update_part(
+            dev_error_dict_for_ts, ts, "errors", at_least_one_ds_has_no_errors_and_has_value
+        )
+
+        if is_nd_marker_needed:
+            needing_nd_marker_dss.update(ds_map.keys())  # on device error all datastreams acquire nd markers
+
+        # -3-2- process device warnings
+        dev_warning_dict_for_ts = row.get("w")
+        dev_alarm_state.update_part(dev_warning_dict_for_ts, ts, "warnings")
+
+        # -3-3- process device infos
+        dev_infos_for_ts = row.get("i")
+        if dev_infos_for_ts is not None and isinstance(dev_infos_for_ts, Iterable):
+            for info_str in dev_infos_for_ts:
+                add_to_alarm_log("INFO", info_str, ts, dev)
+
+        # -4- add nd markers to the array to be saved later
+        for ds_name in needing_nd_marker_dss:
+            nd_marker_map[ds_name].add(ts)
+
+    return nd_marker_map, ds_reading_map
+
+
 def put_raw_data_in_db(dev_ui, payload: dict):
     # 'dev_payload' should look like
     # {"173456980": {"e":{...}, "w":{...}, "i":{...}, "Temperature 1":{...}, "Temperature 2":{...}, ...}
@@ -66,92 +160,34 @@ def put_raw_data_in_db(dev_ui, payload: dict):
                              instance="MQTT Sub")
             return
 
-        nd_marker_map = {ds.name: set() for ds in ds_qs}
-        ds_reading_map = {ds.name: {} for ds in ds_qs}
         int_key_payload = dict(sorted(int_key_payload.items()))  # sort by timestamps
         dev_update_fields = set()
         ds_update_fields_map = {ds.name: set() for ds in ds_qs}
-
-        for ts, row in int_key_payload.items():
-            needing_nd_marker_dss = set()
-            at_least_one_ds_has_no_errors_and_has_value = False
-            # -2- process datastreams
-            for ds_name, ds in ds_map.items():
-                if (ds_row := row.get(ds_name)) is None:
-                    ds_row = {}  # just to ensure '.get' execution
-
-                # -2-1- process ds values
-                has_value = False
-                new_ds_value = ds_row.get("v")
-                if new_ds_value is not None and isinstance(new_ds_value, (int, float)):
-                    # add value to the array to be saved later
-                    ds_reading_map[ds_name][ts] = new_ds_value
-                    has_value = True
-
-                # -2-2- process ds errors
-                ds_error_dict_for_ts = ds_row.get("e")
-                # even if 'ds_error_dict_for_ts' is None, the alarm map will be processed
-                # to ensure 'out' statuses proper assigment
-                upd_ds_error_map, is_nd_marker_needed = update_part_of_alarm_map(
-                    ds, ds_error_dict_for_ts, ts, "errors", has_value
-                )
-                if upd_ds_error_map != ds.alarms["errors"]:
-                    ds.alarms["errors"] = upd_ds_error_map
-                    ds_update_fields_map[ds_name].add("alarms")
-
-                if is_nd_marker_needed:
-                    needing_nd_marker_dss.add(ds.name)
-                else:
-                    if has_value:
-                        at_least_one_ds_has_no_errors_and_has_value = True
-
-                # -2-3- process ds warnings
-                ds_warning_dict_for_ts = ds_row.get("w")
-                upd_ds_warning_map, _ = update_part_of_alarm_map(ds, ds_warning_dict_for_ts, ts, "warnings")
-                if upd_ds_warning_map != ds.alarms["warnings"]:
-                    ds.alarms["warnings"] = upd_ds_warning_map
-                    ds_update_fields_map[ds_name].add("alarms")
-
-                # -2-4- process ds infos
-                ds_infos_for_ts = ds_row.get("i")
-                if ds_infos_for_ts is not None and isinstance(ds_infos_for_ts, Iterable):
-                    for info_str in ds_infos_for_ts:
-                        add_to_alarm_log("INFO", info_str, ts, ds, "")
-
-            # -3- Process the device
-            # -3-1- process device errors
-            dev_error_dict_for_ts = row.get("e")
-            upd_dev_error_map, is_nd_marker_needed = update_part_of_alarm_map(
-                dev, dev_error_dict_for_ts, ts, "errors", at_least_one_ds_has_no_errors_and_has_value
-            )
-            if upd_dev_error_map != dev.alarms["errors"]:
-                dev.alarms["errors"] = upd_dev_error_map
-                dev_update_fields.add("alarms")
-
-            if is_nd_marker_needed:
-                needing_nd_marker_dss.update(ds_map.keys())  # on device error all datastreams acquire nd markers
-
-            # -3-2- process device warnings
-            dev_warning_dict_for_ts = row.get("w")
-            upd_dev_warning_map, _ = update_part_of_alarm_map(dev, dev_warning_dict_for_ts, ts, "warnings")
-            if upd_dev_warning_map != dev.alarms["warnings"]:
-                dev.alarms["warnings"] = upd_dev_warning_map
-                dev_update_fields.add("alarms")
-
-            # -3-3- process device infos
-            dev_infos_for_ts = row.get("i")
-            if dev_infos_for_ts is not None and isinstance(dev_infos_for_ts, Iterable):
-                for info_str in dev_infos_for_ts:
-                    add_to_alarm_log("INFO", info_str, ts, dev)
-
-            # -4- add nd markers to the array to be saved later
-            for ds_name in needing_nd_marker_dss:
-                nd_marker_map[ds_name].add(ts)
+        # the alarm maps of the device and all its datastreams are loaded at once and changed in place,
+        # only the changed alarms are saved
+        load_alarm_maps([dev, *ds_map.values()])
+        ds_alarm_state_map = {ds.name: AlarmState(ds) for ds in ds_qs}
+        dev_alarm_state = AlarmState(dev)
+        nd_marker_map, ds_reading_map = process_payload_rows(
+            int_key_payload, dev, ds_map, dev_alarm_state, ds_alarm_state_map
+        )
 
         # after the cycle
+        save_alarm_states([*ds_alarm_state_map.values(), dev_alarm_state])
+
         # first, process the datastreams
+        # the readings and markers of all the datastreams are created together, one query per table
+        new_rows_map = {
+            DsReading: [],
+            UnusedDsReading: [],
+            InvalidDsReading: [],
+            NonRocDsReading: [],
+            NoDataMarker: [],
+            UnusedNoDataMarker: [],
+        }
+        nd_deadline_map = {}  # the next no-data deadlines of the periodic datastreams, queued together
         for ds_name, ds in ds_map.items():
-            # -1-1- define ds health
+            # -1-1- define ds msg health ('health' is defined after the readings are processed)
             at_least_one_error_in = at_least_one_alarm_in(ds.alarms["errors"])
             at_least_one_warning_in = at_least_one_alarm_in(ds.alarms["warnings"])
             ds_msg_health = HealthGrades.UNDEFINED
@@ -162,14 +198,6 @@ def put_raw_data_in_db(dev_ui, payload: dict):
             if ds.msg_health != ds_msg_health:
                 ds.msg_health = ds_msg_health
                 ds_update_fields_map[ds_name].add("msg_health")
-                ds_health = evaluate_ds_health(ds)
-                if ds.health != ds_health:
-                    ds.health = ds_health
-                    ds_update_fields_map[ds_name].add("health")
-                    # as the ds health changed it is necessary to enqueue the parent device update
-                    if dev.next_upd_ts > now_ts + settings.T_ASSET_UPD_MS:
-                        dev.next_upd_ts = now_ts + settings.T_ASSET_UPD_MS
-                        dev_update_fields.add("next_upd_ts")
 
             # -1-2- create nd markers
             if not ds.is_rbe or (
@@ -197,19 +225,49 @@ def put_raw_data_in_db(dev_ui, payload: dict):
                 ds.last_reading_ts = last_reading_ts
                 ds_update_fields_map[ds.name].add("last_reading_ts")
 
-            # -1-5- for periodic datastreams plan health recalculation right away
+            # -1-5- for periodic datastreams define no-data health right away
+            # and plan its next evaluation for the moment the datastream goes silent
             if ds.t_update is not None:
-                ds.health_next_eval_ts = now_ts + settings.T_DS_HEALTH_EVAL_MS
-                ds_update_fields_map[ds.name].add('health_next_eval_ts')
-
-            # -1-6- finally, save the datastream and readings
-            ds.save(update_fields=ds_update_fields_map[ds.name])
-            DsReading.objects.bulk_create(ds_readings, batch_size=100, ignore_conflicts=True)
-            UnusedDsReading.objects.bulk_create(unused_ds_readings, batch_size=100, ignore_conflicts=True)
-            InvalidDsReading.objects.bulk_create(invalid_ds_readings, batch_size=100, ignore_conflicts=True)
-            NonRocDsReading.objects.bulk_create(non_roc_ds_readings, batch_size=100, ignore_conflicts=True)
-            NoDataMarker.objects.bulk_create(nd_markers, batch_size=100, ignore_conflicts=True)
-            UnusedNoDataMarker.objects.bulk_create(unused_nd_markers, batch_size=100, ignore_conflicts=True)
+                ds_nd_health = evaluate_ds_nd_health(ds, now_ts)
+                if ds.nd_health != ds_nd_health:
+                    ds.nd_health = ds_nd_health
+                    ds_update_fields_map[ds_name].add("nd_health")
+                if "last_reading_ts" in ds_update_fields_map[ds_name]:
+                    # +1 as the deadline itself is not overdue yet
+                    nd_deadline_map[ds.pk] = get_ds_nd_deadline(ds) + 1
+
+            # -1-6- define ds health
+            ds_health = evaluate_ds_health(ds)
+            if ds.health != ds_health:
+                ds.health = ds_health
+                ds_update_fields_map[ds_name].add("health")
+                # as the ds health changed it is necessary to enqueue the parent device update
+                if dev.next_upd_ts > now_ts + settings.T_ASSET_UPD_MS:
+                    dev.next_upd_ts = now_ts + settings.T_ASSET_UPD_MS
+                    dev_update_fields.add("next_upd_ts")
+
+            new_rows_map[DsReading].extend(ds_readings)
+            new_rows_map[UnusedDsReading].extend(unused_ds_readings)
+            new_rows_map[InvalidDsReading].extend(invalid_ds_readings)
+            new_rows_map[NonRocDsReading].extend(non_roc_ds_readings)
+            new_rows_map[NoDataMarker].extend(nd_markers)
+            new_rows_map[UnusedNoDataMarker].extend(unused_nd_markers)
+
+        # -1-7- finally, save the changed datastreams and the readings
+        # the datastreams are locked, so the fields that were not changed are overwritten with the same values,
+        # the datastreams without published fields changed are saved separately not to be published
+        published_dss = []
+        other_dss = []
+        for ds in ds_map.values():
+            if len(Datastream.published_fields & ds_update_fields_map[ds.name]) > 0:
+                published_dss.append(ds)
+            elif len(ds_update_fields_map[ds.name]) > 0:
+                other_dss.append(ds)
+        for dss in (published_dss, other_dss):
+            Datastream.bulk_save(dss, set().union(*(ds_update_fields_map[ds.name] for ds in dss)))
+        for model, new_rows in new_rows_map.items():
+            model.objects.bulk_create(new_rows, batch_size=100, ignore_conflicts=True)
+        mark_dirty_each("ds_nd_health", nd_deadline_map, postpone=True)
 
         # -2- then process the device
         # -2-1- device health
@@ -228,5 +286,8 @@ def put_raw_data_in_db(dev_ui, payload: dict):
                 dev.next_upd_ts = now_ts + settings.T_ASSET_UPD_MS
                 dev_update_fields.add("next_upd_ts")
 
-        # -2-2- finally, save the device
-        dev.save(update_fields=dev_update_fields)
+        # -2-2- finally, save the device if something changed
+        if len(dev_update_fields) > 0:
+            dev.save(update_fields=dev_update_fields)
+        if "next_upd_ts" in dev_update_fields:
+            mark_dirty("device", [dev.pk], dev.next_upd_ts)
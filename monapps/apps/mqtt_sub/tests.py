@@ -0,0 +1,136 @@
+import copy
+import random
+from collections.abc import Iterable
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from apps.mqtt_sub.put_raw_data_in_db import process_payload_rows
+from utils.alarm_utils import AlarmState
+from services.alarm_log import add_to_alarm_log
+
+
+def process_payload_rows_full(int_key_payload, dev, ds_map, dev_alarm_state, ds_alarm_state_map):
+    """
+    'process_payload_rows' as it was before the sparse loop: every datastream is processed at every timestamp.
+    """
+    nd_marker_map = {ds_name: set() for ds_name in ds_map}
+    ds_reading_map = {ds_name: {} for ds_name in ds_map}
+    for ts, row in int_key_payload.items():
+        needing_nd_marker_dss = set()
+        at_least_one_ds_has_no_errors_and_has_value = False
+        for ds_name, ds in ds_map.items():
+            ds_row = row.get(ds_name) or {}
+            has_value = False
+            new_ds_value = ds_row.get("v")
+            if new_ds_value is not None and isinstance(new_ds_value, (int, float)):
+                ds_reading_map[ds_name][ts] = new_ds_value
+                has_value = True
+            if ds_alarm_state_map[ds_name].update_part(ds_row.get("e"), ts, "errors", has_value):
+                needing_nd_marker_dss.add(ds_name)
+            elif has_value:
+                at_least_one_ds_has_no_errors_and_has_value = True
+            ds_alarm_state_map[ds_name].update_part(ds_row.get("w"), ts, "warnings")
+            if (ds_infos_for_ts := ds_row.get("i")) is not None and isinstance(ds_infos_for_ts, Iterable):
+                for info_str in ds_infos_for_ts:
+                    add_to_alarm_log("INFO", info_str, ts, ds, "")
+
+        if dev_alarm_state.update_part(row.get("e"), ts, "errors", at_least_one_ds_has_no_errors_and_has_value):
+            needing_nd_marker_dss.update(ds_map.keys())
+        dev_alarm_state.update_part(row.get("w"), ts, "warnings")
+        if (dev_infos_for_ts := row.get("i")) is not None and isinstance(dev_infos_for_ts, Iterable):
+            for info_str in dev_infos_for_ts:
+                add_to_alarm_log("INFO", info_str, ts, dev)
+
+        for ds_name in needing_nd_marker_dss:
+            nd_marker_map[ds_name].add(ts)
+    return nd_marker_map, ds_reading_map
+
+
+class PayloadRowsTest(SimpleTestCase):
+    """
+    The sparse loop of 'process_payload_rows' (only the datastreams in a row or with non-persistent alarms "in")
+    against the full loop on random payloads and random initial alarm maps.
+    """
+
+    alarm_names = ["a", "b", "c"]
+    ds_names = ["ds0", "ds1", "ds2", "ds3"]
+
+    def random_alarm_map(self, rng):
+        alarm_map = {"errors": {}, "warnings": {}}
+        for part in alarm_map.values():
+            for name in rng.sample(self.alarm_names, rng.randint(0, len(self.alarm_names))):
+                part[name] = {
+                    "persist": rng.random() < 0.5,
+                    "st": rng.choice(["in", "out"]),
+                    "lastTransTs": 0,
+                    "lastInPayloadTs": rng.randint(0, 5),
+                }
+        return alarm_map
+
+    def random_alarm_dict(self, rng):
+        if rng.random() < 0.3:
+            return None
+        names = rng.sample(self.alarm_names, rng.randint(0, 2))
+        return {name: rng.choice([{}, {"st": "in"}, {"st": "out"}]) for name in names}
+
+    def random_row(self, rng):
+        row = {}
+        for ds_name in rng.sample(self.ds_names, rng.randint(0, 2)):
+            ds_row = {}
+            if rng.random() < 0.6:
+                ds_row["v"] = rng.choice([1.0, 2, "bad"])
+            if rng.random() < 0.1:
+                ds_row["i"] = ["info"]
+            for key in ("e", "w"):
+                if (alarm_dict := self.random_alarm_dict(rng)) is not None:
+                    ds_row[key] = alarm_dict
+            row[ds_name] = ds_row
+        for key in ("e", "w"):
+            if (alarm_dict := self.random_alarm_dict(rng)) is not None:
+                row[key] = alarm_dict
+        if rng.random() < 0.1:
+            row["i"] = ["info"]
+        return row
+
+    def run_loop(self, loop_func, dev_alarms, ds_alarms_map, int_key_payload):
+        alarm_log = []
+
+        def add_to_log(type, msg, ts, instance=None, *args):
+            alarm_log.append((type, msg, ts, getattr(instance, "name", instance), *args))
+
+        dev = SimpleNamespace(name="dev", alarms=copy.deepcopy(dev_alarms))
+        ds_map = {}
+        for ds_name, alarms in ds_alarms_map.items():
+            ds_map[ds_name] = SimpleNamespace(name=ds_name, alarms=copy.deepcopy(alarms))
+        dev_alarm_state = AlarmState(dev)
+        ds_alarm_state_map = {ds_name: AlarmState(ds) for ds_name, ds in ds_map.items()}
+        with (
+            mock.patch("utils.alarm_utils.add_to_alarm_log", add_to_log),
+            mock.patch("apps.mqtt_sub.put_raw_data_in_db.add_to_alarm_log", add_to_log),
+            mock.patch(f"{__name__}.add_to_alarm_log", add_to_log),
+        ):
+            nd_marker_map, ds_reading_map = loop_func(
+                copy.deepcopy(int_key_payload), dev, ds_map, dev_alarm_state, ds_alarm_state_map
+            )
+        return {
+            "nd_marker_map": nd_marker_map,
+            "ds_reading_map": ds_reading_map,
+            "alarm_maps": [dev.alarms, *(ds.alarms for ds in ds_map.values())],
+            "changed": [alarm_state.changed for alarm_state in (dev_alarm_state, *ds_alarm_state_map.values())],
+            "alarm_log": alarm_log,
+        }
+
+    def test_random_payloads(self):
+        rng = random.Random(48)
+        for _ in range(5000):
+            dev_alarms = self.random_alarm_map(rng)
+            ds_alarms_map = {ds_name: self.random_alarm_map(rng) for ds_name in self.ds_names}
+            first_ts = rng.randint(10, 20)
+            int_key_payload = {ts: self.random_row(rng) for ts in range(first_ts, first_ts + rng.randint(1, 6))}
+            with self.subTest(dev_alarms=dev_alarms, ds_alarms_map=ds_alarms_map, payload=int_key_payload):
+                self.assertEqual(
+                    self.run_loop(process_payload_rows, dev_alarms, ds_alarms_map, int_key_payload),
+                    self.run_loop(process_payload_rows_full, dev_alarms, ds_alarms_map, int_key_payload),
+                )
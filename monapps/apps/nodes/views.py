@@ -11,6 +11,8 @@ from apps.datastreams.serializers import DsSerializer
 from apps.datafeeds.models import Datafeed
 from apps.datafeeds.serializers import DfSerializer
 from utils.db_field_utils import get_instance_full_id
+from utils.alarm_map_utils import load_alarm_maps
+from common.abstract_classes import AlarmMapMixin
 
 
 type_map = {
@@ -29,7 +31,10 @@ def get_tuple(instance, srlzr):
 
 
 def get_resp_dict_item(model, srlzr):
-    return {k: v for (k, v) in (get_tuple(instance, srlzr) for instance in model.objects.all())}
+    instances = list(model.objects.all())
+    if issubclass(model, AlarmMapMixin):
+        load_alarm_maps(instances)  # one query instead of one per instance
+    return {k: v for (k, v) in (get_tuple(instance, srlzr) for instance in instances)}
 
 
 class ListNodes(APIView):
@@ -1,11 +1,14 @@
 import json
 import humps
+from functools import cached_property
 
 from django.db import models
 from django.conf import settings
 
 from utils.db_field_utils import get_parent_id, get_instance_full_id
 from utils.ts_utils import create_dt_from_ts_ms, create_now_ts_ms
+from utils.child_counter_utils import COUNTED_FIELDS_BY_PROP, get_counter_keys, add_counter_deltas, apply_counter_deltas
+from utils.alarm_map_utils import load_alarm_maps
 from services.alarm_log import add_to_alarm_log
 from services.mqtt_publisher import mqtt_publisher
 
@@ -33,15 +36,32 @@ class PublishingOnSaveModel(models.Model):
             # if the result of 'kwargs.get("update_fields")' is None, it will substitute
             # both '"update_fields" not in kwargs' and 'kwargs["update_fields"] is None'
             if update_fields is None or (len(update_fields) > 0 and self.published_fields.intersection(update_fields)):
-                mqtt_pub_dict = self.create_mqtt_pub_dict()
-
-                topic = f"procdata/{settings.INSTANCE_ID}/{self._meta.model_name}/{self.pk}"
-                payload_str = json.dumps(mqtt_pub_dict)
-                mess_info = mqtt_publisher.publish(topic, payload_str, qos=0, retain=True)
-                add_to_alarm_log("INFO",
-                                 "Changes published",
-                                 create_now_ts_ms(),
-                                 instance=self)
+                self.publish()
+
+    @classmethod
+    def bulk_save(cls, instances, update_fields) -> None:
+        """
+        Saves several instances with one 'bulk_update' and then publishes them in the same way as 'save' does.
+        Overloaded 'save' methods of subclasses are not invoked, so it is suitable only for plain field updates.
+        """
+        instances = list(instances)
+        if len(instances) == 0 or len(update_fields) == 0:
+            return
+        cls.objects.bulk_update(instances, list(update_fields))
+        if mqtt_publisher is not None and cls.published_fields.intersection(update_fields):
+            for instance in instances:
+                instance.publish()
+
+    def publish(self):
+        mqtt_pub_dict = self.create_mqtt_pub_dict()
+
+        topic = f"procdata/{settings.INSTANCE_ID}/{self._meta.model_name}/{self.pk}"
+        payload_str = json.dumps(mqtt_pub_dict)
+        mess_info = mqtt_publisher.publish(topic, payload_str, qos=0, retain=True)
+        add_to_alarm_log("INFO",
+                         "Changes published",
+                         create_now_ts_ms(),
+                         instance=self)
 
     def create_mqtt_pub_dict(self):
         mqtt_pub_dict = {}
@@ -60,6 +80,89 @@ class PublishingOnSaveModel(models.Model):
         return mqtt_pub_dict
 
 
+class ChildCountedModel(PublishingOnSaveModel):
+    """
+    A model whose instances are children of assets (applications, devices, assets).
+    The counters of the parent asset (see 'child_counter_utils') are changed when an instance is saved
+    with 'save'/'bulk_save' or deleted with 'delete'. The code that changes the counted fields bypassing
+    these methods ('QuerySet.update', raw SQL) should change the counters itself,
+    otherwise they are fixed by the 'check_child_counters' task.
+    """
+
+    class Meta:
+        abstract = True
+
+    # (parent_id, counter keys) as they are in the db, None - not known (the counted fields were deferred)
+    _counted = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        counted_attnames = {"parent_id", *(field for fields in COUNTED_FIELDS_BY_PROP.values() for field in fields)}
+        if len(instance.get_deferred_fields() & counted_attnames) == 0:
+            instance._counted = (instance.parent_id, get_counter_keys(instance))
+        return instance
+
+    def add_counter_deltas(self, deltas, update_fields=None, is_adding=False) -> None:
+        if is_adding:
+            old_parent_id, old_keys = None, {}
+        elif self._counted is None:
+            return
+        else:
+            old_parent_id, old_keys = self._counted
+
+        if update_fields is None or "parent" in update_fields or "parent_id" in update_fields:
+            new_parent_id = self.parent_id
+            new_keys = get_counter_keys(self)
+        else:  # only the saved fields are taken into account
+            new_parent_id = old_parent_id
+            props = [prop for prop, fields in COUNTED_FIELDS_BY_PROP.items() if set(fields) & set(update_fields)]
+            new_keys = {**old_keys, **get_counter_keys(self, props)}
+
+        add_counter_deltas(deltas, old_parent_id, old_keys, new_parent_id, new_keys)
+        self._counted = (new_parent_id, new_keys)
+
+    def save(self, **kwargs):
+        is_adding = self._state.adding
+        super().save(**kwargs)
+        deltas = {}
+        self.add_counter_deltas(deltas, kwargs.get("update_fields"), is_adding)
+        apply_counter_deltas(deltas)
+
+    @classmethod
+    def bulk_save(cls, instances, update_fields) -> None:
+        instances = list(instances)
+        super().bulk_save(instances, update_fields)
+        if len(update_fields) == 0:
+            return
+        deltas = {}
+        for instance in instances:
+            instance.add_counter_deltas(deltas, update_fields)
+        apply_counter_deltas(deltas)
+
+    def delete(self, *args, **kwargs):
+        deltas = {}
+        if self._counted is not None:
+            add_counter_deltas(deltas, *self._counted, None, {})
+        result = super().delete(*args, **kwargs)
+        apply_counter_deltas(deltas)
+        return result
+
+
+class AlarmMapMixin:
+    """
+    For the models with alarms (devices, datastreams, applications). The alarms are kept in the table
+    'alarms' (see 'Alarm'), 'alarms' gives them as the alarm map {"errors": {...}, "warnings": {...}}.
+    The map is loaded on the first access, 'load_alarm_maps' loads the maps of many instances with one query.
+    The changes of the map are saved by 'AlarmState', saving the instance does not save the map.
+    """
+
+    @cached_property
+    def alarms(self) -> dict:
+        load_alarm_maps([self])
+        return self.__dict__["alarms"]
+
+
 class AnyDsReading(models.Model):
     class Meta:
         abstract = True
@@ -1,4 +1,5 @@
-from typing import TypedDict, Literal, Any
+from typing import TypedDict, Literal, Any, NotRequired
+import numpy as np
 from apps.dfreadings.models import DfReading
 from apps.datafeeds.models import Datafeed
 from common.constants import HealthGrades
@@ -7,8 +8,21 @@ from common.constants import HealthGrades
 type DfReadingMap = dict[int, dict[int, DfReading]]
 type DfValueMap = dict[int, dict[str, int | float]]
 type IndDfReadingMap = dict[int, DfReading]
+type DfReadingRow = tuple[int, int, float, bool]  # (datafeed_id, time, db_value, restored)
+
+
+class DfFrame(TypedDict):  # columnar alternative to DfValueMap, all the arrays are aligned with 'grid'
+    grid: np.ndarray  # int64 rounded timestamps
+    values: dict[str, np.ndarray]  # float64 values by df name, NaN where there is no df reading
+    masks: dict[str, np.ndarray]  # bool, True where there is a df reading
+
+
+type AppStateValue = int | float | bool | np.ndarray
+type AppStateMap = dict[str, AppStateValue]  # kept between invocations of an app function, see 'app_state_utils'
 
 type AlarmPayloadDictForTs = dict[str, Any]  # can be {"CPU Error": {"st": "in"}} or {"CPU Error": {} - can be anything}
+# (ts, errors, warnings, infos) - the same as {ts: {"e": errors, "w": warnings, "i": infos}} in the alarm payload
+type AlarmPayloadRow = tuple[int, AlarmPayloadDictForTs | None, AlarmPayloadDictForTs | None, list[str] | None]
 
 
 class AlarmRecord(TypedDict):
@@ -23,16 +37,28 @@ class AlarmMap(TypedDict):  # is stored inside an app, a datastream or a device
     warnings: dict[str, AlarmRecord]
 
 
+class AlarmTransition(TypedDict):  # a change of "st" of an alarm, collected by 'AlarmState'
+    part: Literal["errors", "warnings"]
+    name: str
+    st: Literal["in", "out"]
+    ts: int
+
+
 class UpdateMap(TypedDict, total=False):
     cursor_ts: int
     is_catching_up: bool
     health: HealthGrades
     alarm_payload: dict
+    alarm_rows: list[AlarmPayloadRow]  # an alternative to 'alarm_payload' sorted by ts, see 'AlarmPayloadBuilder'
+    state: AppStateMap  # is saved at the new cursor position
 
 
 class DerivedDfReadingRow(TypedDict):
     df: Datafeed
     new_df_readings: list[DfReading]
+    # a columnar alternative to 'new_df_readings', both arrays should have the same length
+    rtss: NotRequired[np.ndarray]
+    values: NotRequired[np.ndarray]
 
 
 type DerivedDfReadingMap = dict[str, DerivedDfReadingRow]
@@ -63,6 +63,18 @@ class NotToUseDfrTypes(models.IntegerChoices):
     SPLINE_UNCLOSED = 3
 
 
+class DfrConflictPolicies(models.IntegerChoices):  # what to do when new df readings collide with existing ones
+    FAIL = 0  # the whole evaluation is discarded
+    SKIP = 1  # existing df readings are kept
+    OVERWRITE = 2  # existing df readings are overwritten
+
+
+class BackfillStates(models.IntegerChoices):  # an app being backfilled is not run by the app scheduler
+    NONE = 0
+    RUNNING = 1
+    PAUSED = 2
+
+
 class AugmentationPolicy(models.IntegerChoices):
     TILL_LAST_DF_READING = 1
     TILL_NOW = 2
@@ -149,3 +161,14 @@ class MeasUnits(models.TextChoices):
     M3_H = "m3/h"
     M3_S = "m3/s"
     USM_CM = "uSm/cm"
+
+
+class AlarmEntityTypes(models.TextChoices):  # the models with alarms, the values are their model names
+    DEVICE = "device"
+    DATASTREAM = "datastream"
+    APPLICATION = "application"
+
+
+class AlarmKinds(models.TextChoices):  # the parts of the alarm map
+    ERRORS = "errors"
+    WARNINGS = "warnings"
@@ -54,6 +54,7 @@ INSTALLED_APPS = [
     "apps.dsreadings",
     "apps.nodes",
     "apps.mqtt_sub",
+    "apps.alarms",
 ]
 
 MIDDLEWARE = [
@@ -157,13 +158,28 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # Monitoring Application settings
 NUM_MAX_DFREADINGS_TO_PROCESS = 50000
 NUM_MAX_DSREADINGS_TO_PROCESS = 100000
+NUM_MIN_DSREADINGS_TO_PROCESS = 1000  # the smallest batch the ds reading batch planner can shrink to
+T_DSR_BATCH_TARGET_MS = 2000  # desired time to fetch and resample one batch of ds readings
 MIN_T_RES_MS = 1000
 MIN_T_INVOC_MS = 60000
-
-# DS health monitoring settings
-MAX_DS_TO_HEALTH_PROC = 100
-T_DS_HEALTH_EVAL_MS = 5000  # 5 seconds, how often the ds health check procedure is executed
-NEXT_EVAL_MARGIN_COEF = 1.5  # will be a multiplicator for t_update for periodic datastreams
+DFR_SAVE_BATCH_SIZE = 5000  # df readings per one INSERT when derived df readings are saved
+DFR_SAVE_USE_COPY = False  # if True, derived df readings are saved with 'COPY ... FROM STDIN'
+
+# App sandbox settings, the heavy parts of app functions are run in a pool of worker processes
+APP_SANDBOX_ENABLED = True  # if False, they are run in the process of the celery worker
+APP_SANDBOX_NUM_WORKERS = 2
+APP_SANDBOX_CPU_LIMIT_S = 30  # CPU time per call
+APP_SANDBOX_TIMEOUT_S = 60  # wall time per call (waiting for a free worker included)
+APP_SANDBOX_MEM_LIMIT_MB = 1024  # address space of a worker process
+
+# App scheduler settings
+MAX_APPS_TO_DISPATCH = 200
+# 'next_run_ts' of a dispatched app is moved forward by this value, so the app is not dispatched again
+# while its app function is still in the queue or running (if the worker dies, the app is dispatched after the lease)
+T_APP_RUN_LEASE_MS = 600000
+# how many apps are evaluated by one 'evaluate' task, if 1 - every app gets its own 'evaluate.app_func' task
+NUM_APPS_PER_EVAL_TASK = 20
+T_BACKFILL_TASK_MS = 300000  # a backfill task re-enqueues itself after this time to give way to other tasks
 
 # Asset/Site update settings
 T_ASSET_UPD_MS = 5000  # 5 seconds, how often the asset update procedure is executed
@@ -171,6 +187,11 @@ MAX_SITES_TO_UPD = 10
 MAX_ASSETS_TO_UPD = 100
 MAX_DEVICES_TO_UPD = 50
 
+# Dirty queue settings (the devices and assets to update are taken from a Redis sorted set by 'drain_dirty_queue')
+DIRTY_QUEUE_REDIS_URL = "redis://localhost:6379/3"
+MAX_ASSET_TREE_DEPTH = 20  # the updates are propagated up to this number of asset levels in one pass
+MAX_DS_TO_ND_EVAL = 1000  # how many datastreams with passed no-data deadlines are evaluated in one pass
+
 # it is datetime(2999, 12, 31, 23, 59, 59, 999999, tzinfo=timezone.utc), something similar to Infinity
 MAX_TS_MS = 32503679999999
 TILL_NOW_MARGIN_MS = 0
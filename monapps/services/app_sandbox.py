@@ -0,0 +1,93 @@
+import math
+import resource
+import signal
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+
+
+class AppSandboxError(Exception):
+    pass
+
+
+# The workers are started with 'spawn', so they don't inherit db and MQTT connections of the celery worker.
+# Because of that, a function run in the sandbox (and its module) must not need Django to be set up:
+# it gets arrays and numbers and returns arrays and numbers.
+_executor: ProcessPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def _init_worker(mem_limit_bytes: int) -> None:
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    resource.setrlimit(resource.RLIMIT_AS, (mem_limit_bytes, hard))
+    signal.signal(signal.SIGXCPU, _on_cpu_limit)
+
+
+def _on_cpu_limit(signum, frame):
+    raise AppSandboxError("CPU time limit exceeded")
+
+
+def _run_with_cpu_limit(func, args: tuple, kwargs: dict, cpu_limit_s: int):
+    # RLIMIT_CPU counts the CPU time of the whole worker process, so the limit is moved for every call
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    soft = math.ceil(usage.ru_utime + usage.ru_stime) + cpu_limit_s
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+    try:
+        return func(*args, **kwargs)
+    finally:
+        resource.setrlimit(resource.RLIMIT_CPU, (resource.RLIM_INFINITY, hard))
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.APP_SANDBOX_NUM_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(settings.APP_SANDBOX_MEM_LIMIT_MB * 1024 * 1024,),
+            )
+        return _executor
+
+
+def _drop_executor(executor: ProcessPoolExecutor) -> None:
+    """
+    The workers are terminated, 'shutdown' alone doesn't stop a job that is already running.
+    The other jobs running in the same pool fail as if their workers died, a new pool is created for the next call.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    # '_processes' is private, but there is no public way to stop a busy worker ('shutdown' clears it)
+    processes = list((executor._processes or {}).values())
+    executor.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        process.terminate()
+
+
+def run_in_sandbox(func, *args, **kwargs):
+    """
+    Runs 'func(*args, **kwargs)' in a warm worker process with CPU time and memory limits.
+    Raises AppSandboxError if a limit is exceeded, the exceptions raised by 'func' are re-raised as they are.
+    """
+    if not settings.APP_SANDBOX_ENABLED:
+        return func(*args, **kwargs)
+
+    executor = _get_executor()
+    try:
+        future = executor.submit(_run_with_cpu_limit, func, args, kwargs, settings.APP_SANDBOX_CPU_LIMIT_S)
+        return future.result(timeout=settings.APP_SANDBOX_TIMEOUT_S)
+    except FutureTimeoutError:
+        # the worker is still running the function and would block the next calls, so it is stopped
+        _drop_executor(executor)
+        raise AppSandboxError(f"'{func.__name__}' did not finish in {settings.APP_SANDBOX_TIMEOUT_S} s")
+    except BrokenProcessPool:
+        # a worker was killed (f.e. by the hard CPU limit or the OOM killer), the pool can't be used anymore
+        _drop_executor(executor)
+        raise AppSandboxError(f"The sandbox worker running '{func.__name__}' died")
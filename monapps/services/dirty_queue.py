@@ -0,0 +1,74 @@
+from collections.abc import Iterable
+from typing import Literal
+
+import redis
+from django.conf import settings
+from django.db import transaction
+
+# Devices and assets waiting for an update, kept in Redis sorted sets (member - pk, score - 'next_upd_ts').
+# It is filled by everyone who brings 'next_upd_ts' closer and drained by the 'drain_dirty_queue' task,
+# 'next_upd_ts' in the db is still the source of truth and the polling tasks work without the queue.
+# The periodic datastreams are also kept here with their no-data deadlines as the score ("ds_nd_health"),
+# so their 'nd_health' is evaluated only when a datastream goes silent.
+
+type DirtyKind = Literal["device", "asset", "ds_nd_health"]
+
+redis_client = redis.Redis.from_url(settings.DIRTY_QUEUE_REDIS_URL)
+
+# takes the members that are due and removes them from the set atomically,
+# so the same instance is not taken by two workers
+_POP_DUE_SCRIPT = redis_client.register_script(
+    """
+    local ids = redis.call("ZRANGEBYSCORE", KEYS[1], "-inf", ARGV[1], "LIMIT", 0, ARGV[2])
+    if #ids > 0 then
+        redis.call("ZREM", KEYS[1], unpack(ids))
+    end
+    return ids
+    """
+)
+
+
+def _get_key(kind: DirtyKind) -> str:
+    return f"monapps:{settings.INSTANCE_ID}:dirty:{kind}"
+
+
+def mark_dirty(kind: DirtyKind, ids: Iterable[int], due_ts: int, postpone: bool = False) -> None:
+    mark_dirty_each(kind, {pk: due_ts for pk in ids}, postpone)
+
+
+def mark_dirty_each(kind: DirtyKind, due_ts_map: dict[int, int], postpone: bool = False) -> None:
+    """
+    Puts the instances ({pk: due_ts}) into the queue after the current transaction is committed
+    (right away if there is none), so the drain never sees the changes that are not committed yet.
+    An earlier 'due_ts' wins, or a later one if 'postpone' is True (for deadlines that are moved forward).
+    """
+    mapping = {str(pk): due_ts for pk, due_ts in due_ts_map.items()}
+    if len(mapping) == 0:
+        return
+
+    def add_to_queue():
+        try:
+            redis_client.zadd(_get_key(kind), mapping, gt=postpone, lt=not postpone)
+        except redis.RedisError as e:
+            # not critical, the instances are still picked up by the polling tasks
+            print(f"Cannot put {kind}s {list(mapping)} into the dirty queue, {e}")
+
+    transaction.on_commit(add_to_queue)
+
+
+def pop_due(kind: DirtyKind, now_ts: int, max_num: int) -> list[int]:
+    try:
+        return [int(pk) for pk in _POP_DUE_SCRIPT(keys=[_get_key(kind)], args=[now_ts, max_num])]
+    except redis.RedisError as e:
+        print(f"Cannot take {kind}s from the dirty queue, {e}")
+        return []
+
+
+def remove_from_queue(kind: DirtyKind, ids: Iterable[int]) -> None:
+    members = [str(pk) for pk in ids]
+    if len(members) == 0:
+        return
+    try:
+        redis_client.zrem(_get_key(kind), *members)
+    except redis.RedisError as e:
+        print(f"Cannot remove {kind}s from the dirty queue, {e}")
@@ -1,4 +1,10 @@
 from .app_func_wrapper import app_func_wrapper
+from .app_funcs_batch_wrapper import app_funcs_batch_wrapper
+from .backfill_app import backfill_app
+from .check_child_counters import check_child_counters
+from .dispatch_apps import dispatch_apps
+from .drain_dirty_queue import drain_dirty_queue
+from .update_apps_health import update_apps_health
 from .update_assets import update_assets
 from .update_devices import update_devices
 from .update_periodic_ds_health import update_periodic_ds_health
\ No newline at end of file
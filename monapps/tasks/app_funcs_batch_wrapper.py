@@ -0,0 +1,66 @@
+import traceback
+from celery import shared_task
+
+from apps.applications.models import Application
+from apps.datafeeds.models import Datafeed
+from common.constants import HealthGrades
+
+from utils.prep_all_df_readings import create_all_df_readings
+from utils.ts_utils import create_now_ts_ms
+from utils.update_utils import enqueue_asset_updates
+from utils.app_eval_utils import compute_app, commit_app, get_app_parent_fields
+
+
+@shared_task(bind=True, name="evaluate.app_funcs")
+def app_funcs_batch_wrapper(self, app_ids: list[int]) -> None:
+    """
+    The same as 'app_func_wrapper' but for several applications at once.
+    The applications are processed grouped by app type and function version, the apps, their types
+    and their datafeeds are brought from the db with a few queries for the whole batch.
+    Each application is committed in its own transaction, so a failure of one app
+    does not roll back the results of the others.
+    """
+
+    apps = list(
+        Application.objects.filter(pk__in=app_ids)
+        .select_related("type", "invoc_interval", "catch_up_interval")
+        .order_by("type_id", "func_version", "pk")
+    )
+    enabled_apps = []
+    failed_app_ids = set()  # the apps that failed to create df readings, they are committed with health ERROR
+    for app in apps:
+        if app.is_enabled:
+            try:
+                # this function has its own 'transaction.atomic'
+                create_all_df_readings(app)
+                enabled_apps.append(app)
+            except Exception as e:
+                print(f"Error happened while creating df readings for {app}, {e}\n{traceback.format_exc()}")
+                failed_app_ids.add(app.pk)
+
+    df_qs = Datafeed.objects.filter(parent_id__in=[app.pk for app in enabled_apps]).select_related("data_type")
+    native_df_maps = {app.pk: {} for app in enabled_apps}
+    derived_df_maps = {app.pk: {} for app in enabled_apps}
+    for df in df_qs:
+        if df.datastream_id is not None:
+            native_df_maps[df.parent_id][df.name] = df
+        else:
+            derived_df_maps[df.parent_id][df.name] = df
+
+    fields_by_parent_id = {}  # the parents are updated once for the whole batch
+    for app in apps:
+        try:
+            app_func_return = None
+            excep_health = HealthGrades.UNDEFINED
+            if app.pk in failed_app_ids:
+                excep_health = HealthGrades.ERROR
+            elif app.pk in native_df_maps:
+                app_func_return, excep_health = compute_app(app, native_df_maps[app.pk], derived_df_maps[app.pk])
+            app, app_update_fields = commit_app(app, app_func_return, excep_health)
+            parent_fields = get_app_parent_fields(app_update_fields)
+            if app.parent_id is not None and len(parent_fields) > 0:
+                fields_by_parent_id.setdefault(app.parent_id, set()).update(parent_fields)
+        except Exception as e:
+            print(f"Error happened while evaluating {app}, {e}\n{traceback.format_exc()}")
+
+    enqueue_asset_updates(fields_by_parent_id, create_now_ts_ms())
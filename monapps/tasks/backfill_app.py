@@ -0,0 +1,79 @@
+import time
+import traceback
+from celery import shared_task
+
+from django.conf import settings
+
+from apps.applications.models import Application
+from common.constants import BackfillStates
+from utils.ts_utils import create_now_ts_ms
+from utils.app_eval_utils import run_app
+from services.alarm_log import add_to_alarm_log
+
+
+@shared_task(bind=True, name="evaluate.backfill_app")
+def backfill_app(self, app_id: int, backfill_token: str) -> None:
+    """
+    Runs the app function of a catching up application window after window without waiting for the app scheduler.
+    Every window is committed separately, so 'cursor_ts' is a checkpoint and the backfill can be paused
+    (by setting 'backfill_state' to PAUSED) and resumed from where it stopped.
+    To let other tasks use the worker, the task re-enqueues itself after T_BACKFILL_TASK_MS.
+    'backfill_token' is given by the 'backfill_app' command, the task stops when the token of the app is not
+    the same anymore (the backfill was resumed or started again meanwhile and another chain of tasks runs it).
+    """
+    app: Application | None = Application.objects.filter(pk=app_id).first()
+    if app is None:
+        print(f"No application with id {app_id}")
+        return
+    if str(app.backfill_token) != backfill_token:
+        print(f"The backfill of {app} was cancelled or is run by another chain of tasks")
+        return
+    own_backfill = {"pk": app_id, "backfill_state": BackfillStates.RUNNING, "backfill_token": backfill_token}
+
+    start_time = time.monotonic()
+    start_cursor_ts = app.cursor_ts
+    is_finished = False
+
+    try:
+        # the app is read again in every window, so pause works
+        while app.backfill_state == BackfillStates.RUNNING and str(app.backfill_token) == backfill_token:
+            prev_cursor_ts = app.cursor_ts
+            app = run_app(app_id)
+            if app is None:
+                return
+
+            if not app.is_enabled or not app.is_catching_up:
+                is_finished = True
+                break
+            if app.cursor_ts <= prev_cursor_ts:
+                add_to_alarm_log(
+                    "WARNING", "Backfill stopped, the cursor did not move", create_now_ts_ms(), instance=app
+                )
+                is_finished = True
+                break
+            if (time.monotonic() - start_time) * 1000 > settings.T_BACKFILL_TASK_MS:
+                break
+    except Exception as e:
+        # the app is given back to the app scheduler, otherwise it would stay RUNNING and never be run again,
+        # the windows committed before the error are kept
+        print(f"Error happened while backfilling {app}, {e}\n{traceback.format_exc()}")
+        Application.objects.filter(**own_backfill).update(backfill_state=BackfillStates.NONE, backfill_token=None)
+        add_to_alarm_log("ERROR", f"Backfill stopped, {e}", create_now_ts_ms(), instance=app)
+        return
+
+    elapsed_s = time.monotonic() - start_time
+    num_grid_points = (app.cursor_ts - start_cursor_ts) // app.t_resample
+    add_to_alarm_log(
+        "INFO",
+        f"Backfill: {num_grid_points} grid points in {elapsed_s:.1f} s, "
+        f"{num_grid_points / max(elapsed_s, 0.001):.0f} grid points/s",
+        create_now_ts_ms(),
+        instance=app,
+    )
+
+    if is_finished:
+        # if the backfill was paused (or taken by another chain) meanwhile, the state is kept
+        Application.objects.filter(**own_backfill).update(backfill_state=BackfillStates.NONE, backfill_token=None)
+        add_to_alarm_log("INFO", "Backfill finished", create_now_ts_ms(), instance=app)
+    elif app.backfill_state == BackfillStates.RUNNING and str(app.backfill_token) == backfill_token:
+        self.delay(app_id, backfill_token)
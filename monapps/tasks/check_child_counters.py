@@ -0,0 +1,23 @@
+from celery import shared_task
+from django.db import transaction
+
+from utils.ts_utils import create_now_ts_ms
+from utils.update_utils import enqueue_asset_updates
+from utils.child_counter_utils import recompute_child_counters
+from services.alarm_log import add_to_alarm_log
+
+
+@shared_task(bind=True, name="update.check_child_counters")
+def check_child_counters(self):
+    """
+    Recomputes the child counters of all the assets from scratch and fixes the ones that drifted
+    (the children were changed bypassing 'ChildCountedModel', a transaction was interrupted, etc).
+    The assets with fixed counters are updated again.
+    """
+    now_ts = create_now_ts_ms()
+    with transaction.atomic():
+        fixed_asset_ids = recompute_child_counters()
+        enqueue_asset_updates({asset_id: {"status", "curr_state", "health"} for asset_id in fixed_asset_ids}, now_ts)
+
+    if len(fixed_asset_ids) > 0:
+        add_to_alarm_log("WARNING", f"Child counters of the assets {sorted(fixed_asset_ids)} were fixed", now_ts)
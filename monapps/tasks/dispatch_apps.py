@@ -0,0 +1,45 @@
+from celery import shared_task
+from django.db import transaction
+from django.conf import settings
+
+from apps.applications.models import Application
+from common.constants import BackfillStates
+from utils.ts_utils import create_now_ts_ms
+from .app_func_wrapper import app_func_wrapper
+from .app_funcs_batch_wrapper import app_funcs_batch_wrapper
+
+
+@shared_task(bind=True, name="update.dispatch_apps")
+def dispatch_apps(self):
+    """
+    The only periodic task needed to run all the applications (instead of a separate periodic task per application).
+    Takes the applications whose 'next_run_ts' has come, the catching up ones go first,
+    and enqueues an app function evaluation for every of them.
+    The cadence of an application is set by the 'app_func_wrapper' via 'next_run_ts'.
+    """
+    now_ts = create_now_ts_ms()
+
+    with transaction.atomic():
+        # 'skip_locked' - the apps that are being saved by 'app_func_wrapper' right now are picked up next time
+        app_ids = list(
+            Application.objects.filter(next_run_ts__lte=now_ts, backfill_state=BackfillStates.NONE)
+            .order_by("-is_catching_up", "next_run_ts")
+            .select_for_update(skip_locked=True)
+            .values_list("pk", flat=True)[: settings.MAX_APPS_TO_DISPATCH]
+        )
+        if len(app_ids) == 0:
+            return
+
+        # 'next_run_ts' is not published, so there is no need to go through 'save'
+        Application.objects.filter(pk__in=app_ids).update(next_run_ts=now_ts + settings.T_APP_RUN_LEASE_MS)
+
+        def enqueue_apps():
+            batch_size = settings.NUM_APPS_PER_EVAL_TASK
+            if batch_size > 1:
+                for i in range(0, len(app_ids), batch_size):
+                    app_funcs_batch_wrapper.delay(app_ids[i : i + batch_size])
+            else:
+                for app_id in app_ids:
+                    app_func_wrapper.delay(app_id)
+
+        transaction.on_commit(enqueue_apps)
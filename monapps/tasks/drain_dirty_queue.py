@@ -0,0 +1,43 @@
+from celery import shared_task
+from django.conf import settings
+
+from apps.devices.models import Device
+from apps.assets.models import Asset
+from utils.ts_utils import create_now_ts_ms
+from services.dirty_queue import pop_due, remove_from_queue
+from tasks.update_periodic_ds_health import update_ds_nd_health
+from tasks.update_devices import update_device_qs
+from tasks.update_assets import update_asset_qs
+
+
+@shared_task(bind=True, name="update.drain_dirty_queue")
+def drain_dirty_queue(self):
+    """
+    Takes the due datastreams (no-data deadlines), devices and assets from the dirty queue and propagates
+    their updates bottom-up through the whole asset tree in one pass: the parents that got something to update
+    are updated right away at the next level instead of waiting for the next tick of 'update_assets'.
+    """
+    now_ts = create_now_ts_ms()
+
+    # the periodic datastreams whose no-data deadlines passed, their devices are put into the queue
+    ds_ids = pop_due("ds_nd_health", now_ts, settings.MAX_DS_TO_ND_EVAL)
+    if len(ds_ids) > 0:
+        update_ds_nd_health(now_ts, ds_ids)
+
+    dev_ids = pop_due("device", now_ts, settings.MAX_DEVICES_TO_UPD)
+    asset_ids = set(pop_due("asset", now_ts, settings.MAX_ASSETS_TO_UPD))
+    if len(dev_ids) > 0:
+        # 'next_upd_ts' in the db is the source of truth, the queue may keep stale entries
+        device_qs = Device.objects.filter(pk__in=dev_ids, next_upd_ts__lte=now_ts)
+        asset_ids |= update_device_qs(device_qs, now_ts)
+
+    for _ in range(settings.MAX_ASSET_TREE_DEPTH):
+        if len(asset_ids) == 0:
+            break
+        # the parents were put into the queue after the previous level was committed, they are updated here
+        remove_from_queue("asset", asset_ids)
+        asset_qs = Asset.objects.filter(pk__in=asset_ids).order_by("pk")
+        asset_ids = update_asset_qs(asset_qs, now_ts)
+    else:
+        if len(asset_ids) > 0:
+            print(f"Asset tree is deeper than {settings.MAX_ASSET_TREE_DEPTH}, the rest is left to the next pass")
@@ -0,0 +1,132 @@
+from types import SimpleNamespace
+from celery import shared_task
+from django.db import connection, transaction
+
+from apps.applications.models import AppType, Application
+from common.constants import HealthGrades
+from utils.ts_utils import create_now_ts_ms
+from utils.update_utils import enqueue_asset_updates
+from utils.child_counter_utils import get_counter_keys, add_counter_deltas, apply_counter_deltas
+
+# The same rules as in 'commit_app' but evaluated by the db for all the apps at once.
+# The health can only be raised to ERROR by the cursor here (and set to UNDEFINED for disabled apps),
+# it is lowered by the app itself, because the health from the app function is not known here.
+IS_STATUS_STALE_EXPR = """
+    CASE WHEN app.type_id = ANY(%(status_type_ids)s)
+        THEN %(now_ts)s - COALESCE(app.last_status_update_ts, app.created_ts) > app.t_status_stale
+        ELSE app.is_status_stale
+    END"""
+IS_CURR_STATE_STALE_EXPR = """
+    CASE WHEN app.type_id = ANY(%(curr_state_type_ids)s)
+        THEN CASE WHEN app.last_curr_state_update_ts IS NOT NULL
+            THEN %(now_ts)s - app.last_curr_state_update_ts > app.t_curr_state_stale
+            ELSE %(now_ts)s - app.created_ts > app.t_status_stale
+        END
+        ELSE app.is_curr_state_stale
+    END"""
+HEALTH_EXPR = """
+    CASE WHEN NOT app.is_enabled THEN %(undefined)s
+        WHEN NOT app.is_catching_up AND %(now_ts)s - app.cursor_ts > app.t_health_error THEN %(error)s
+        ELSE app.health
+    END"""
+
+# 'prev' is used to tell which fields have changed (and to change the counters of the parent),
+# 'app' in RETURNING has the new values
+UPDATE_APPS_HEALTH_SQL = f"""
+    UPDATE applications AS app
+    SET is_status_stale = {IS_STATUS_STALE_EXPR},
+        is_curr_state_stale = {IS_CURR_STATE_STALE_EXPR},
+        health = {HEALTH_EXPR}
+    FROM applications AS prev
+    WHERE prev.id = app.id AND (
+        {IS_STATUS_STALE_EXPR} <> app.is_status_stale
+        OR {IS_CURR_STATE_STALE_EXPR} <> app.is_curr_state_stale
+        OR {HEALTH_EXPR} <> app.health
+    )
+    RETURNING
+        app.id,
+        app.parent_id,
+        app.status,
+        app.status_use,
+        app.curr_state,
+        app.curr_state_use,
+        prev.is_status_stale,
+        app.is_status_stale,
+        prev.is_curr_state_stale,
+        app.is_curr_state_stale,
+        prev.health,
+        app.health
+"""
+
+
+@shared_task(bind=True, name="update.apps_health")
+def update_apps_health(self):
+    """
+    Recomputes staleness and cursor health of all the applications with one UPDATE,
+    so they are up to date even if the app functions are not executed (the scheduler is stopped, an app is stuck).
+    Only the rows that change are updated, published and cause their parents to be updated.
+    """
+    now_ts = create_now_ts_ms()
+    app_types = list(AppType.objects.all())  # there are few of them, so 'has_status' is evaluated here
+    params = {
+        "now_ts": now_ts,
+        "status_type_ids": [app_type.pk for app_type in app_types if app_type.has_status],
+        "curr_state_type_ids": [app_type.pk for app_type in app_types if app_type.has_curr_state],
+        "undefined": HealthGrades.UNDEFINED,
+        "error": HealthGrades.ERROR,
+    }
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(UPDATE_APPS_HEALTH_SQL, params)
+            rows = cursor.fetchall()
+
+        fields_by_parent_id = {}
+        counter_deltas = {}
+        for (
+            _,
+            parent_id,
+            status,
+            status_use,
+            curr_state,
+            curr_state_use,
+            prev_is_status_stale,
+            is_status_stale,
+            prev_is_curr_state_stale,
+            is_curr_state_stale,
+            prev_health,
+            health,
+        ) in rows:
+            if parent_id is None:
+                continue
+            parent_fields = fields_by_parent_id.setdefault(parent_id, set())
+            if is_status_stale != prev_is_status_stale:
+                parent_fields.add("status")
+            if is_curr_state_stale != prev_is_curr_state_stale:
+                parent_fields.add("curr_state")
+            if health != prev_health:
+                parent_fields.add("health")
+
+            # the rows are changed bypassing 'save', so the counters of the parent are changed here
+            values = dict(status=status, status_use=status_use, curr_state=curr_state, curr_state_use=curr_state_use)
+            prev_keys = get_counter_keys(
+                SimpleNamespace(
+                    **values,
+                    is_status_stale=prev_is_status_stale,
+                    is_curr_state_stale=prev_is_curr_state_stale,
+                    health=prev_health,
+                )
+            )
+            keys = get_counter_keys(
+                SimpleNamespace(
+                    **values, is_status_stale=is_status_stale, is_curr_state_stale=is_curr_state_stale, health=health
+                )
+            )
+            add_counter_deltas(counter_deltas, parent_id, prev_keys, parent_id, keys)
+
+        apply_counter_deltas(counter_deltas)
+        enqueue_asset_updates(fields_by_parent_id, now_ts)
+
+    if len(rows) > 0:
+        for app in Application.objects.filter(pk__in=[row[0] for row in rows]).select_related("type"):
+            app.publish()
@@ -4,47 +4,49 @@ from django.conf import settings
 
 from apps.assets.models import Asset
 from utils.ts_utils import create_now_ts_ms
-from utils.update_utils import update_func_by_property_map
+from utils.update_utils import enqueue_asset_updates
+from utils.child_counter_utils import load_child_counters, derive_from_child_counters
 
 
 @shared_task(bind=True, name="update.assets")
 def update_assets(self):
 
     now_ts = create_now_ts_ms()
-    parent_map = {}
-    parent_update_fields_map = {}
+    asset_qs = (
+        Asset.objects.filter(
+            next_upd_ts__lte=now_ts,
+        )
+        .order_by("next_upd_ts")[: settings.MAX_ASSETS_TO_UPD]
+    )
+    update_asset_qs(asset_qs, now_ts)
+
+
+def update_asset_qs(asset_qs, now_ts: int) -> set[int]:
+    """
+    Updates the assets of 'asset_qs' (it is locked here) and enqueues the updates of their parents.
+    Returns the pks of the parents that have something to update.
+    """
+    # several children can have the same parent, so the fields are merged per parent pk
+    # and all the parents are updated with one query in the end
+    fields_by_parent_id = {}
+    changed_assets = []  # with some published fields changed
+    other_assets = []
+    changed_fields = set()
 
     with transaction.atomic():
-        asset_qs = (
-            Asset.objects.filter(
-                next_upd_ts__lte=now_ts,
-            )
-            .order_by("next_upd_ts")
-            .prefetch_related("parent")
-            .prefetch_related("assets")
-            .prefetch_related("applications")
-            .prefetch_related("devices")
-            .select_for_update()[: settings.MAX_ASSETS_TO_UPD]
-        )
-        for asset in asset_qs:
+        assets = list(asset_qs.select_for_update())
+        # the children are not loaded, the rollup is made from their counters
+        counters_by_asset_id = load_child_counters([asset.pk for asset in assets])
+        for asset in assets:
             asset_update_fields = set()
-            parent = asset.parent
-            if parent is not None:
-                parent_map[parent.name] = parent
-                parent_update_fields_map[parent.name] = set()
-            children = [
-                *asset.applications.all(),
-                *asset.devices.all(),
-                *asset.assets.all(),
-            ]
+            counters = counters_by_asset_id.get(asset.pk, {})
 
             if len(asset.fields_to_update) > 0:  # it definitely should be >0,
                 # otherwise who could initiate the update process for this asset
                 # without injecting at least one field into it 'fields_to_update'?
 
                 for field_name in asset.fields_to_update:
-                    func = update_func_by_property_map[field_name]
-                    new_value = func(children)
+                    new_value = derive_from_child_counters(field_name, counters.get(field_name, {}))
                     if new_value != getattr(asset, field_name, None):
                         setattr(asset, field_name, new_value)
                         asset_update_fields.add(field_name)
@@ -55,22 +57,24 @@ def update_assets(self):
                             asset.last_curr_state_update_ts = now_ts
                             asset_update_fields.add("last_curr_state_update_ts")
 
-                        if parent is not None:
-                            if parent.next_upd_ts > now_ts + settings.T_ASSET_UPD_MS:
-                                parent.next_upd_ts = now_ts + settings.T_ASSET_UPD_MS
-                                parent_update_fields_map[parent.name].add("next_upd_ts")
-                            if field_name not in parent.fields_to_update:
-                                parent.fields_to_update.append(field_name)
-                                parent_update_fields_map[parent.name].add("fields_to_update")
+                        if asset.parent_id is not None:
+                            fields_by_parent_id.setdefault(asset.parent_id, set()).add(field_name)
 
                 asset.fields_to_update = []
-                asset_update_fields.add("fields_to_update")
 
             asset.next_upd_ts = settings.MAX_TS_MS
-            asset_update_fields.add("next_upd_ts")
 
-            asset.save(update_fields=asset_update_fields)
+            if len(asset_update_fields) > 0:
+                changed_assets.append(asset)
+                changed_fields |= asset_update_fields
+            else:
+                other_assets.append(asset)
+
+        # the assets are locked, so the fields that were not changed are overwritten with the same values
+        Asset.bulk_save(changed_assets, {*changed_fields, "fields_to_update", "next_upd_ts"})
+        Asset.bulk_save(other_assets, {"fields_to_update", "next_upd_ts"})  # these fields are not published
+
+        # it also puts the parents into the dirty queue
+        enqueue_asset_updates(fields_by_parent_id, now_ts)
 
-        for parent_name, parent_update_fields in parent_update_fields_map.items():
-            parent = parent_map[parent_name]
-            parent.save(update_fields=parent_update_fields)
+    return set(fields_by_parent_id.keys())
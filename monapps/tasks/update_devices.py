@@ -1,41 +1,56 @@
 from celery import shared_task
 from django.db import transaction
+from django.db.models import Count
 from django.conf import settings
 
 from apps.devices.models import Device
+from apps.datastreams.models import Datastream
 from utils.ts_utils import create_now_ts_ms
-from utils.update_utils import evaluate_dev_health, derive_health_from_children
+from utils.update_utils import evaluate_dev_health, enqueue_asset_updates
+from utils.rollup_utils import rollup_health
 
 
 @shared_task(bind=True, name="update.devices")
 def update_devices(self):
 
     now_ts = create_now_ts_ms()
-    parent_map = {}
-    parent_update_fields_map = {}
+    device_qs = (
+        Device.objects.filter(
+            next_upd_ts__lte=now_ts,
+        )
+        .order_by("next_upd_ts")[: settings.MAX_DEVICES_TO_UPD]
+    )
+    update_device_qs(device_qs, now_ts)
+
+
+def update_device_qs(device_qs, now_ts: int) -> set[int]:
+    """
+    Updates the devices of 'device_qs' (it is locked here) and enqueues the updates of their parents.
+    Returns the pks of the parents that have something to update.
+    """
+    parent_ids = set()  # only "health" is propagated from the devices
+    changed_devices = []  # with "health" changed
+    other_devices = []
+    changed_fields = set()
 
     with transaction.atomic():
-        device_qs = (
-            Device.objects.filter(
-                next_upd_ts__lte=now_ts,
-            )
-            .order_by("next_upd_ts")
-            .prefetch_related("parent")
-            .prefetch_related("datastreams")
-            .select_for_update()[: settings.MAX_DEVICES_TO_UPD]
+        devices = list(device_qs.select_for_update())
+        # the health of the datastreams is brought grouped, one row per (device, health)
+        ds_health_rows_map = {}
+        ds_health_qs = (
+            Datastream.objects.filter(parent_id__in=[dev.pk for dev in devices], is_enabled=True)
+            .values_list("parent_id", "health")
+            .annotate(Count("pk"))
+            .order_by()
         )
+        for dev_id, health, count in ds_health_qs:
+            ds_health_rows_map.setdefault(dev_id, []).append((health, count))
 
-        for dev in device_qs:
+        for dev in devices:
             dev_update_fields = set()
-            parent = dev.parent
-            if parent is not None:
-                parent_map[parent.name] = parent
-                if parent_update_fields_map.get(parent.name) is None:
-                    parent_update_fields_map[parent.name] = set()
-            children = list(dev.datastreams.filter(is_enabled=True))
 
             # evaluate health
-            dev_chld_health = derive_health_from_children(children)
+            dev_chld_health = rollup_health(ds_health_rows_map.get(dev.pk, []))
 
             if dev.chld_health != dev_chld_health:
                 dev.chld_health = dev_chld_health
@@ -45,20 +60,22 @@ def update_devices(self):
             if dev.health != dev_health:
                 dev.health = dev_health
                 dev_update_fields.add("health")
-                dev.next_upd_ts = settings.MAX_TS_MS
-                if parent is not None:
-                    if parent.next_upd_ts > now_ts + settings.T_ASSET_UPD_MS:
-                        parent.next_upd_ts = now_ts + settings.T_ASSET_UPD_MS
-                        parent_update_fields_map[parent.name].add("next_upd_ts")
-                    if "health" not in parent.fields_to_update:
-                        parent.fields_to_update.append("health")
-                        parent_update_fields_map[parent.name].add("fields_to_update")
+                if dev.parent_id is not None:
+                    parent_ids.add(dev.parent_id)
 
             dev.next_upd_ts = settings.MAX_TS_MS
-            dev_update_fields.add("next_upd_ts")
 
-            dev.save(update_fields=dev_update_fields)
+            if "health" in dev_update_fields:
+                changed_devices.append(dev)
+                changed_fields |= dev_update_fields
+            else:
+                other_devices.append(dev)
+
+        # the devices are locked, so the fields that were not changed are overwritten with the same values
+        Device.bulk_save(changed_devices, {*changed_fields, "next_upd_ts"})
+        Device.bulk_save(other_devices, {"chld_health", "next_upd_ts"})  # these fields are not published
+
+        # it also puts the parents into the dirty queue
+        enqueue_asset_updates({parent_id: {"health"} for parent_id in parent_ids}, now_ts)
 
-        for dev_ui, parent_update_fields in parent_update_fields_map.items():
-            parent = parent_map[dev_ui]
-            parent.save(update_fields=parent_update_fields)
+    return parent_ids
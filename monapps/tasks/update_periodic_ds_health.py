@@ -1,74 +1,89 @@
 from celery import shared_task
-from django.db import transaction
+from django.db import connection, transaction
 from django.conf import settings
 
 from apps.datastreams.models import Datastream
 from common.constants import HealthGrades
 from utils.ts_utils import create_now_ts_ms
-from utils.update_utils import evaluate_ds_health
+from services.dirty_queue import mark_dirty
 
+# 'nd_health' of a periodic datastream is ERROR if there were no readings for 't_nd_health_error'
+# (counting from the creation if there were no readings at all), otherwise OK
+# (UNDEFINED while waiting for the first reading).
+# Only the rows whose 'nd_health' changes are updated, both branches of the condition below are supported
+# by partial indexes (see 'Datastream.Meta'), so the cost of a tick depends on the number of changes and
+# of not OK datastreams, not on the number of all the datastreams.
+ND_HEALTH_EXPR = """
+    CASE WHEN COALESCE(ds.last_reading_ts, ds.created_ts) + ds.t_nd_health_error < %(now_ts)s THEN %(error)s
+        WHEN ds.last_reading_ts IS NULL THEN %(undefined)s
+        ELSE %(ok)s
+    END"""
 
-@shared_task(bind=True, name="update.periodic_ds_health")
-def update_periodic_ds_health(self):
-    '''
-    This task works only for periodic datastreams (the datastreams that have 't_update' != null)
-    '''
-    now_ts = create_now_ts_ms()
-    dev_map = {}
-    dev_update_fields_map = {}
-
-    with transaction.atomic():
-        # bring MAX_DS_TO_HEALTH_PROC active periodic datastream instances, the rest will be processed further
-        ds_qs = (
-            Datastream.objects.filter(
-                health_next_eval_ts__lte=now_ts,
+_UPDATE_ND_HEALTH_SQL = f"""
+    UPDATE datastreams AS ds
+    SET nd_health = {ND_HEALTH_EXPR},
+        health = GREATEST(ds.msg_health, {ND_HEALTH_EXPR})
+    FROM datastreams AS prev
+    WHERE prev.id = ds.id
+        AND ds.is_enabled AND ds.t_update IS NOT NULL
+        AND {ND_HEALTH_EXPR} <> ds.nd_health
+        AND (
+            -- no readings for too long, only in this case OK can change
+            (
+                ds.nd_health <> %(error)s
+                AND COALESCE(ds.last_reading_ts, ds.created_ts) + ds.t_nd_health_error < %(now_ts)s
             )
-            .filter(is_enabled=True)
-            .exclude(t_update__isnull=True)
-            .order_by("health_next_eval_ts")
-            .prefetch_related('parent')
-            .select_for_update()[: settings.MAX_DS_TO_HEALTH_PROC]
+            -- the rest of the changes are possible only for the datastreams that are not OK (there are few of them)
+            OR ds.nd_health <> %(ok)s
         )
+"""
+_RETURNING_SQL = "RETURNING ds.id, ds.parent_id, ds.health <> prev.health"
+UPDATE_ALL_ND_HEALTH_SQL = f"{_UPDATE_ND_HEALTH_SQL} {_RETURNING_SQL}"
+UPDATE_SOME_ND_HEALTH_SQL = f"{_UPDATE_ND_HEALTH_SQL} AND ds.id = ANY(%(ds_ids)s) {_RETURNING_SQL}"
 
-        for ds in ds_qs:  # this will evaluate the qs and lock the datastreams for update
-            ds_update_fields = set()
-            dev = ds.parent
-            dev_map[dev.dev_ui] = dev
-            if dev_update_fields_map.get(dev.dev_ui) is None:
-                dev_update_fields_map[dev.dev_ui] = set()
+ENQUEUE_DEVICE_UPDATES_SQL = """
+    UPDATE devices
+    SET next_upd_ts = LEAST(next_upd_ts, %s)
+    WHERE id = ANY(%s)
+"""
 
-            # evaluate health
-            ds_nd_health = HealthGrades.UNDEFINED
-            if ds.last_reading_ts is None:
-                if now_ts - ds.created_ts > ds.t_nd_health_error:  # TODO: from 'enabled' not from 'created'?
-                    ds_nd_health = HealthGrades.ERROR
-                else:
-                    ds_nd_health = HealthGrades.UNDEFINED
-            else:
-                if now_ts - ds.last_reading_ts > ds.t_nd_health_error:
-                    ds_nd_health = HealthGrades.ERROR
-                else:
-                    ds_nd_health = HealthGrades.OK
-            if ds.nd_health != ds_nd_health:
-                ds.nd_health = ds_nd_health
-                ds_update_fields.add("nd_health")
-                ds_health = evaluate_ds_health(ds)
-                if ds.health != ds_health:
-                    ds.health = ds_health
-                    ds_update_fields.add("health")
-                    # as the ds health changed it is necessary to enqueue the parent device update
-                    if dev.next_upd_ts > now_ts + settings.T_ASSET_UPD_MS:
-                        dev.next_upd_ts = now_ts + settings.T_ASSET_UPD_MS
-                        dev_update_fields_map[dev.dev_ui].add('next_upd_ts')
 
-            ds.health_next_eval_ts = now_ts + max(
-                settings.T_DS_HEALTH_EVAL_MS, ds.t_update * settings.NEXT_EVAL_MARGIN_COEF
-            )
-            ds_update_fields.add('health_next_eval_ts')
+@shared_task(bind=True, name="update.periodic_ds_health")
+def update_periodic_ds_health(self):
+    """
+    This task works only for periodic datastreams (the datastreams that have 't_update' != null).
+    The datastreams going silent are normally caught by their deadlines in the dirty queue ('drain_dirty_queue'),
+    this task evaluates all of them to catch what was missed (Redis was unavailable, the queue was lost, etc).
+    """
+    update_ds_nd_health(create_now_ts_ms())
+
+
+def update_ds_nd_health(now_ts: int, ds_ids: list[int] | None = None) -> None:
+    """
+    Evaluates 'nd_health' of all the periodic datastreams (or of 'ds_ids' only) by one UPDATE,
+    only the changed datastreams are published and cause their devices to be updated.
+    """
+    params = {
+        "now_ts": now_ts,
+        "undefined": HealthGrades.UNDEFINED,
+        "ok": HealthGrades.OK,
+        "error": HealthGrades.ERROR,
+        "ds_ids": ds_ids,
+    }
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(UPDATE_ALL_ND_HEALTH_SQL if ds_ids is None else UPDATE_SOME_ND_HEALTH_SQL, params)
+            rows = cursor.fetchall()
 
-            # save the changes
-            ds.save(update_fields=ds_update_fields)
+            # as the ds health changed it is necessary to enqueue the parent device update
+            dev_ids = sorted(set(dev_id for _, dev_id, is_health_changed in rows if is_health_changed))
+            if len(dev_ids) > 0:
+                cursor.execute(ENQUEUE_DEVICE_UPDATES_SQL, [now_ts + settings.T_ASSET_UPD_MS, dev_ids])
+        mark_dirty("device", dev_ids, now_ts + settings.T_ASSET_UPD_MS)
 
-        for dev_ui, dev_update_fields in dev_update_fields_map.items():
-            dev = dev_map[dev_ui]
-            dev.save(update_fields=dev_update_fields)
+    # 'nd_health' is not published, so only the datastreams with changed 'health' are
+    published_ds_ids = [ds_id for ds_id, _, is_health_changed in rows if is_health_changed]
+    if len(published_ds_ids) > 0:
+        for ds in Datastream.objects.filter(pk__in=published_ds_ids):
+            ds.publish()
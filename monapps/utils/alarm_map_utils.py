@@ -0,0 +1,91 @@
+from collections.abc import Iterable
+from typing import Any
+
+from django.db import connection
+from django.db.models import Q
+
+from apps.alarms.models import Alarm
+from utils.db_field_utils import create_alarms_field_default
+
+# The alarm maps of devices, datastreams and applications are kept in the table 'alarms',
+# one row per alarm, and are given to the code as before - {"errors": {name: AlarmRecord}, "warnings": {...}}.
+# Only the alarms that were changed are written back (see 'AlarmState'), not the whole map.
+
+type AlarmRow = tuple[str, int, str, str, bool, str, int, int]
+# (entity_type, entity_id, kind, name, persist, st, last_trans_ts, last_in_payload_ts)
+
+UPSERT_ALARMS_SQL = """
+    INSERT INTO alarms (entity_type, entity_id, kind, name, persist, st, last_trans_ts, last_in_payload_ts)
+    SELECT * FROM unnest(
+        %s::varchar(50)[], %s::bigint[], %s::varchar(50)[], %s::varchar(200)[],
+        %s::boolean[], %s::varchar(3)[], %s::bigint[], %s::bigint[]
+    )
+    ON CONFLICT (entity_type, entity_id, kind, name) DO UPDATE
+    SET persist = EXCLUDED.persist,
+        st = EXCLUDED.st,
+        last_trans_ts = EXCLUDED.last_trans_ts,
+        last_in_payload_ts = EXCLUDED.last_in_payload_ts
+"""
+
+
+def get_entity_type(instance: Any) -> str:
+    return instance._meta.model_name  # the same as the values of 'AlarmEntityTypes'
+
+
+def get_alarm_row(instance: Any, kind: str, name: str, alarm: dict) -> AlarmRow:
+    return (
+        get_entity_type(instance),
+        instance.pk,
+        kind,
+        name,
+        alarm.get("persist", False),
+        alarm.get("st", "out"),
+        alarm.get("lastTransTs", 0),
+        alarm.get("lastInPayloadTs", 0),
+    )
+
+
+def load_alarm_maps(instances: Iterable[Any]) -> None:
+    """
+    Loads the alarm maps of the instances (of any of the models with alarms) with one query
+    and puts them into 'alarms', so they are not loaded one by one on the first access.
+    """
+    instance_map = {}
+    for instance in instances:
+        instance.alarms = create_alarms_field_default()
+        instance_map[(get_entity_type(instance), instance.pk)] = instance
+    if len(instance_map) == 0:
+        return
+
+    ids_by_type = {}
+    for entity_type, entity_id in instance_map.keys():
+        ids_by_type.setdefault(entity_type, []).append(entity_id)
+    condition = Q()
+    for entity_type, entity_ids in ids_by_type.items():
+        condition |= Q(entity_type=entity_type, entity_id__in=entity_ids)
+
+    # the order of a map is the order its alarms are checked in, so the "out" transitions of one timestamp
+    # get into the alarm log in the order of their previous transitions (the JSON maps kept the order
+    # the alarms first came in, the table does not keep it)
+    alarms = Alarm.objects.filter(condition)
+    for alarm in alarms.order_by("entity_type", "entity_id", "kind", "last_trans_ts", "name"):
+        instance = instance_map[(alarm.entity_type, alarm.entity_id)]
+        instance.alarms[alarm.kind][alarm.name] = {
+            "persist": alarm.persist,
+            "st": alarm.st,
+            "lastTransTs": alarm.last_trans_ts,
+            "lastInPayloadTs": alarm.last_in_payload_ts,
+        }
+
+
+def save_alarm_rows(rows: Iterable[AlarmRow]) -> None:
+    # sorted, so concurrent transactions lock the rows in the same order and do not deadlock
+    rows = sorted(rows)
+    if len(rows) == 0:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(UPSERT_ALARMS_SQL, [list(column) for column in zip(*rows)])
+
+
+def delete_alarm_map(instance: Any) -> None:
+    Alarm.objects.filter(entity_type=get_entity_type(instance), entity_id=instance.pk).delete()
@@ -1,11 +1,14 @@
+from collections.abc import Iterable
 from typing import Literal
-import copy
+
+import numpy as np
 
 from apps.applications.models import Application
 from apps.datastreams.models import Datastream
 from apps.devices.models import Device
 
-from common.complex_types import AlarmPayloadDictForTs
+from common.complex_types import AlarmPayloadDictForTs, AlarmPayloadRow, AlarmTransition
+from utils.alarm_map_utils import get_alarm_row, save_alarm_rows
 from services.alarm_log import add_to_alarm_log
 
 
@@ -17,7 +20,8 @@ def add_to_alarm_payload(alarm_payload: dict, alarm_name: str, alarm_dict: dict,
         1734567890345: {...},
         ...
         }
-    This payload then can be processed by the 'update_part_of_alarm_map' function.
+    This payload then can be processed by 'AlarmState.update_part'.
+    For the alarms produced over long arrays see 'AlarmPayloadBuilder'.
     """
     if ts not in alarm_payload:
         alarm_payload[ts] = {}
@@ -32,7 +36,7 @@ def add_to_alarm_payload(alarm_payload: dict, alarm_name: str, alarm_dict: dict,
         if key == "i":
             alarm_payload[ts][key].append(alarm_name)
         else:
-            alarm_payload[ts][key].update(alarm_name=alarm_dict)
+            alarm_payload[ts][key][alarm_name] = alarm_dict
 
 
 def at_least_one_alarm_in(alarm_map):
@@ -45,111 +49,224 @@ def at_least_one_alarm_in(alarm_map):
     return at_least_one_in
 
 
-def update_part_of_alarm_map(
-    instance: Device | Datastream | Application,
-    alarm_dict_for_ts: AlarmPayloadDictForTs | None,
-    ts: int,
-    alarm_map_part: Literal["errors", "warnings"],
-    has_value: bool = False,
-):
+class AlarmPayloadBuilder:
+    """
+    Collects the alarms of an app function in flat lists (one entry per alarm record), without creating
+    a nested dict for every grid point. 'get_rows' groups them by timestamp, the result is given to the app
+    wrapper as 'alarm_rows' of the update map instead of 'alarm_payload'.
+    """
+
+    def __init__(self, instance: Application):
+        self.instance = instance
+        self._tss: list[int] = []
+        self._keys: list[Literal["e", "w", "i"]] = []
+        self._names: list[str] = []  # an alarm name or an info string
+        self._alarm_dicts: list[dict | None] = []
+
+    def add(self, alarm_name: str, alarm_dict: dict | None, ts: int, key: Literal["e", "w", "i"]) -> None:
+        """
+        The same as 'add_to_alarm_payload', 'alarm_dict' is None for infos.
+        """
+        self._tss.append(ts)
+        self._keys.append(key)
+        self._names.append(alarm_name)
+        self._alarm_dicts.append(alarm_dict)
+
+    def add_transitions(self, alarm_name: str, is_in: np.ndarray, tss: np.ndarray, key: Literal["e", "w"]) -> None:
+        """
+        Adds a persistent alarm ("st": "in"/"out") only at the timestamps where 'is_in' changes,
+        the alarm state before the first timestamp is taken from the alarm map of the instance.
+        Should be called once per alarm name.
+        """
+        part = "errors" if key == "e" else "warnings"
+        was_in = self.instance.alarms[part].get(alarm_name, {}).get("st") == "in"
+        states = np.concatenate(([was_in], is_in)).astype(np.int8)
+        idxs = np.flatnonzero(np.diff(states))
+        self._tss.extend(np.asarray(tss)[idxs].tolist())
+        self._keys.extend([key] * len(idxs))
+        self._names.extend([alarm_name] * len(idxs))
+        self._alarm_dicts.extend({"st": "in" if st else "out"} for st in is_in[idxs])
+
+    def get_rows(self) -> list[AlarmPayloadRow]:
+        rows = {}  # {ts: [errors, warnings, infos]}
+        for ts, key, name, alarm_dict in zip(self._tss, self._keys, self._names, self._alarm_dicts):
+            if (row := rows.get(ts)) is None:
+                row = rows[ts] = [None, None, None]
+            if key == "i":
+                if row[2] is None:
+                    row[2] = []
+                row[2].append(name)
+            else:
+                pos = 0 if key == "e" else 1
+                if row[pos] is None:
+                    row[pos] = {}
+                row[pos][name] = alarm_dict
+        return [(ts, *rows[ts]) for ts in sorted(rows)]
+
+
+class AlarmState:
     """
-    This function updates certain part of the alarm map - "errors" or "warnings. Also, it puts all
-    the transistions of individual alarms into the alarm log. The variable "alarm_dict_for_ts" should contain
-    the dictionary of errors or warnings for a certain timestamp. This dictionary looks like
-    {"error 1 name": {"st": "in"}, "error 2 name ": {}, ...} and usually is part of payload coming from different
-    devices and datastreams. If "has_value" is True, then persistent errors (but not warnings) that have status "in"
-    will be assigned status "out" if there is no record for this error for this timestamp.
+    Wraps the alarm map of an instance ('instance.alarms') and changes it in place while a payload is processed,
+    timestamp after timestamp, without copying it. 'changed' gives the alarms that differ from what they were
+    before the first change (an alarm can go "in" and "out" at the same timestamp), only they are saved
+    by 'save_alarm_states', 'transitions' keeps all the changes of "st" in the order they happened.
+    Every transition is also put into the alarm log.
+    The names of the alarms with "st" = "in" are indexed ('active'), so only they are checked for "out"
+    at every timestamp, the rest of the map is not scanned.
     """
-    alarm_map = instance.alarms[alarm_map_part]
-    log_level: Literal["ERROR", "WARNING"] = alarm_map_part[:-1].upper()
-    is_nd_marker_needed = False
-    upd_alarm_map = copy.deepcopy(alarm_map)
-    if alarm_dict_for_ts is not None:
-        for alarm_name, ind_alarm_obj in alarm_dict_for_ts.items():  # ind_alarm_obj can be {"st": "in"} or {}
-            if alarm_name in upd_alarm_map:
-                if isinstance(ind_alarm_obj, dict) and (
-                    (new_status := str(ind_alarm_obj.get("st")).lower()) == "in" or new_status == "out"
-                ):
-                    upd_alarm_map[alarm_name]["persist"] = True
-                    upd_alarm_map[alarm_name]["lastInPayloadTs"] = ts
-                    # it is not reasonable to create an nd marker every time
-                    # when the same persistent alarm with the status "in" comes
-                    # but if there is also a value in parallel, then an nd marker
-                    # should be created
-                    if alarm_map_part == "errors" and new_status == "in" and has_value:
-                        is_nd_marker_needed = True
-                    # print(f"Persistent alarm '{alarm_name}' comes again with st='{new_status}'")
-                    if upd_alarm_map[alarm_name]["st"] != new_status:
-                        upd_alarm_map[alarm_name]["st"] = new_status
-                        upd_alarm_map[alarm_name]["lastTransTs"] = ts
-                        add_to_alarm_log(log_level, alarm_name, ts, instance, new_status)
-                        # also, an nd marker should be created when the alarm
-                        # emerges first time after being "out"
-                        if alarm_map_part == "errors" and new_status == "in":
+
+    def __init__(self, instance: Device | Datastream | Application):
+        self.instance = instance
+        self.alarms = instance.alarms
+        self._originals: dict[tuple[str, str], dict | None] = {}  # (part, alarm name): the alarm before the changes
+        self.transitions: list[AlarmTransition] = []
+        self.active: dict[str, set[str]] = {}
+        self._positions: dict[str, dict[str, int]] = {}  # to check the active alarms in the order of the map
+        for part in ("errors", "warnings"):
+            self.active[part] = {name for name, alarm in self.alarms[part].items() if alarm.get("st") == "in"}
+            self._positions[part] = {name: i for i, name in enumerate(self.alarms[part])}
+
+    def has_active_non_persistent(self) -> bool:
+        """
+        Non-persistent alarms with "st" = "in" get "out" at the first timestamp without them,
+        so the instance has to be processed even if there is nothing for it in the payload.
+        """
+        for part, names in self.active.items():
+            for name in names:
+                if not self.alarms[part][name]["persist"]:
+                    return True
+        return False
+
+    @property
+    def changed(self) -> set[tuple[str, str]]:  # (part, alarm name)
+        return {
+            (part, alarm_name)
+            for (part, alarm_name), original in self._originals.items()
+            if self.alarms[part].get(alarm_name) != original
+        }
+
+    @property
+    def is_dirty(self) -> bool:
+        return len(self.changed) > 0
+
+    def clear_changed(self) -> None:
+        self._originals.clear()
+
+    def _set(self, part: Literal["errors", "warnings"], alarm_name: str, alarm: dict, key: str, value) -> None:
+        if alarm.get(key) != value:
+            self._originals.setdefault((part, alarm_name), dict(alarm))
+            alarm[key] = value
+
+    def _transit(self, alarm_name: str, alarm: dict, part: Literal["errors", "warnings"], st: str, ts: int) -> None:
+        self._set(part, alarm_name, alarm, "st", st)
+        self._set(part, alarm_name, alarm, "lastTransTs", ts)
+        if st == "in":
+            self.active[part].add(alarm_name)
+        else:
+            self.active[part].discard(alarm_name)
+        self.transitions.append(AlarmTransition(part=part, name=alarm_name, st=st, ts=ts))
+        add_to_alarm_log(part[:-1].upper(), alarm_name, ts, self.instance, st)
+
+    def update_part(
+        self,
+        alarm_dict_for_ts: AlarmPayloadDictForTs | None,
+        ts: int,
+        alarm_map_part: Literal["errors", "warnings"],
+        has_value: bool = False,
+    ) -> bool:
+        """
+        Updates certain part of the alarm map - "errors" or "warnings". The variable "alarm_dict_for_ts" should
+        contain the dictionary of errors or warnings for a certain timestamp. This dictionary looks like
+        {"error 1 name": {"st": "in"}, "error 2 name ": {}, ...} and usually is part of payload coming from different
+        devices and datastreams. If "has_value" is True, then persistent errors (but not warnings) that have
+        status "in" will be assigned status "out" if there is no record for this error for this timestamp.
+        Returns True if a no-data marker is needed for this timestamp.
+        """
+        alarm_map = self.alarms[alarm_map_part]
+        is_nd_marker_needed = False
+        if alarm_dict_for_ts is not None:
+            for alarm_name, ind_alarm_obj in alarm_dict_for_ts.items():  # ind_alarm_obj can be {"st": "in"} or {}
+                if alarm_name in alarm_map:
+                    alarm = alarm_map[alarm_name]
+                    if isinstance(ind_alarm_obj, dict) and (
+                        (new_status := str(ind_alarm_obj.get("st")).lower()) == "in" or new_status == "out"
+                    ):
+                        self._set(alarm_map_part, alarm_name, alarm, "persist", True)
+                        self._set(alarm_map_part, alarm_name, alarm, "lastInPayloadTs", ts)
+                        # it is not reasonable to create an nd marker every time
+                        # when the same persistent alarm with the status "in" comes
+                        # but if there is also a value in parallel, then an nd marker
+                        # should be created
+                        if alarm_map_part == "errors" and new_status == "in" and has_value:
                             is_nd_marker_needed = True
+                        if alarm["st"] != new_status:
+                            self._transit(alarm_name, alarm, alarm_map_part, new_status, ts)
+                            # also, an nd marker should be created when the alarm
+                            # emerges first time after being "out"
+                            if alarm_map_part == "errors" and new_status == "in":
+                                is_nd_marker_needed = True
+                    else:
+                        self._set(alarm_map_part, alarm_name, alarm, "persist", False)
+                        self._set(alarm_map_part, alarm_name, alarm, "lastInPayloadTs", ts)
+                        # it is not reasonable to create an nd marker every time
+                        # when the same non-persistent alarm comes
+                        # but if there is also a value in parallel, then an nd marker
+                        # should be created
+                        if alarm_map_part == "errors" and has_value:
+                            is_nd_marker_needed = True
+                        if alarm["st"] != "in":
+                            self._transit(alarm_name, alarm, alarm_map_part, "in", ts)
+                            # also, an nd marker should be created when the alarm
+                            # emerges first time after being "out"
+                            if alarm_map_part == "errors":
+                                is_nd_marker_needed = True
+
                 else:
-                    upd_alarm_map[alarm_name]["persist"] = False
-                    upd_alarm_map[alarm_name]["lastInPayloadTs"] = ts
-                    # it is not reasonable to create an nd marker every time
-                    # when the same non-persistent alarm comes
-                    # but if there is also a value in parallel, then an nd marker
-                    # should be created
-                    if alarm_map_part == "errors" and has_value:
-                        is_nd_marker_needed = True
-                    # print(f"NON-Persistent alarm '{alarm_name}' comes again with st='in'")
-                    if upd_alarm_map[alarm_name]["st"] != "in":
-                        upd_alarm_map[alarm_name]["st"] = "in"
-                        upd_alarm_map[alarm_name]["lastTransTs"] = ts
-                        add_to_alarm_log(log_level, alarm_name, ts, instance, "in")
-                        # also, an nd marker should be created when the alarm
-                        # emerges first time after being "out"
+                    alarm = alarm_map[alarm_name] = {}
+                    self._positions[alarm_map_part][alarm_name] = len(self._positions[alarm_map_part])
+                    self._originals.setdefault((alarm_map_part, alarm_name), None)
+                    if isinstance(ind_alarm_obj, dict) and (
+                        (new_status := str(ind_alarm_obj.get("st")).lower()) == "in" or new_status == "out"
+                    ):
+                        alarm["persist"] = True
+                        alarm["st"] = new_status
+                        alarm["lastInPayloadTs"] = ts
+                        alarm["lastTransTs"] = ts  # an arguable question what to put here when "out"
+                        # if the first message has the status "out", then no sense in logging it
+                        if new_status == "in":
+                            self._transit(alarm_name, alarm, alarm_map_part, "in", ts)
+                            if alarm_map_part == "errors":
+                                is_nd_marker_needed = True
+                    else:
+                        alarm["persist"] = False
+                        alarm["lastInPayloadTs"] = ts
+                        self._transit(alarm_name, alarm, alarm_map_part, "in", ts)
                         if alarm_map_part == "errors":
                             is_nd_marker_needed = True
 
+        # only the active alarms can get "out"
+        for alarm_name in sorted(self.active[alarm_map_part], key=self._positions[alarm_map_part].__getitem__):
+            alarm = alarm_map[alarm_name]
+            # if there is at least one datastream with a value and without an error,
+            # all persistent errors get discarded, otherwise, it acquires "out" in the upper part of the code
+            if alarm["persist"]:
+                if alarm_map_part == "errors" and alarm["lastInPayloadTs"] < ts and has_value:
+                    self._transit(alarm_name, alarm, alarm_map_part, "out", ts)
             else:
-                upd_alarm_map[alarm_name] = {}
-                if isinstance(ind_alarm_obj, dict) and (
-                    (new_status := str(ind_alarm_obj.get("st")).lower()) == "in" or new_status == "out"
-                ):
-                    upd_alarm_map[alarm_name]["persist"] = True
-                    upd_alarm_map[alarm_name]["st"] = new_status
-                    upd_alarm_map[alarm_name]["lastInPayloadTs"] = ts
-                    upd_alarm_map[alarm_name]["lastTransTs"] = ts  # an arguable question what to put here when "out"
-                    # print(f"Persistent alarm '{alarm_name}' comes FIRST TIME with st='{new_status}'")
-                    if new_status == "in":  # if the first message has the status "out", then no sense in logging it
-                        add_to_alarm_log(log_level, alarm_name, ts, instance, "in")
-                        if alarm_map_part == "errors":
-                            is_nd_marker_needed = True
-                else:
-                    upd_alarm_map[alarm_name]["persist"] = False
-                    upd_alarm_map[alarm_name]["st"] = "in"
-                    upd_alarm_map[alarm_name]["lastInPayloadTs"] = ts
-                    upd_alarm_map[alarm_name]["lastTransTs"] = ts
-                    # print(f"NON-Persistent alarm '{alarm_name}' comes FIRST TIME with st='in'")
-                    add_to_alarm_log(log_level, alarm_name, ts, instance, "in")
-                    if alarm_map_part == "errors":
-                        is_nd_marker_needed = True
-
-    for alarm_name, ind_alarm_obj in upd_alarm_map.items():
-        # if there is at least one datastream with a value and without an error,
-        # all persistent errors get discarded, otherwise, it acquires "out" in the upper part of the code
-        if ind_alarm_obj["persist"]:
-            if (
-                alarm_map_part == "errors"
-                and ind_alarm_obj["st"] == "in"
-                and ind_alarm_obj["lastInPayloadTs"] < ts
-                and has_value
-            ):
-                ind_alarm_obj["st"] = "out"
-                ind_alarm_obj["lastTransTs"] = ts
-                # print(f"Persistent alarm '{alarm_name}' st='out' because at least one ds has readings and no errors")
-                add_to_alarm_log(log_level, alarm_name, ts, instance, "out")
-        else:
-            # non-persisten alarms acquire "out" when there is no such an alarm in 'alarm_dict_for_ts'
-            if ind_alarm_obj["st"] == "in" and (alarm_dict_for_ts is None or alarm_dict_for_ts.get(alarm_name) is None):
-                ind_alarm_obj["st"] = "out"
-                ind_alarm_obj["lastTransTs"] = ts
-                # print(f"NON-Persistent alarm '{alarm_name}' st='out' because there's no fresh alarm income readings")
-                add_to_alarm_log(log_level, alarm_name, ts, instance, "out")
-
-    return upd_alarm_map, is_nd_marker_needed
+                # non-persisten alarms acquire "out" when there is no such an alarm in 'alarm_dict_for_ts'
+                if alarm_dict_for_ts is None or alarm_dict_for_ts.get(alarm_name) is None:
+                    self._transit(alarm_name, alarm, alarm_map_part, "out", ts)
+
+        return is_nd_marker_needed
+
+
+def save_alarm_states(alarm_states: Iterable[AlarmState]) -> None:
+    """
+    Saves only the changed alarms of the instances with one query.
+    """
+    rows = []
+    for alarm_state in alarm_states:
+        for part, alarm_name in alarm_state.changed:
+            rows.append(get_alarm_row(alarm_state.instance, part, alarm_name, alarm_state.alarms[part][alarm_name]))
+        alarm_state.clear_changed()
+    save_alarm_rows(rows)
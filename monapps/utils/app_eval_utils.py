@@ -0,0 +1,261 @@
+import traceback
+from collections.abc import Iterable
+
+from django.db import transaction, IntegrityError
+
+from apps.applications.models import Application
+from apps.datafeeds.models import Datafeed
+
+from common.constants import HealthGrades, STATUS_FIELD_NAME, CURR_STATE_FIELD_NAME
+from common.complex_types import AppFuncReturn
+from utils.ts_utils import create_now_ts_ms
+from utils.alarm_utils import AlarmState, save_alarm_states
+from utils.dfr_utils import get_df_reading_rows, save_df_reading_rows
+from utils.prep_all_df_readings import create_all_df_readings
+from utils.app_state_utils import save_app_state
+from utils.update_utils import enqueue_asset_updates
+from services.alarm_log import add_to_alarm_log
+from app_functions.app_functions import app_function_map, load_app_function
+
+
+def run_app(app_id: int) -> Application | None:
+    """
+    Creates new df readings for the app, evaluates it and enqueues the update of its parent.
+    Returns the app as it was saved or None if there is no app with this id.
+    """
+    app: Application | None = (
+        Application.objects.select_related("type", "invoc_interval", "catch_up_interval").filter(pk=app_id).first()
+    )
+
+    if app is None:
+        print(f"No application with id {app_id}")
+        return None
+
+    app_func_return = None
+    excep_health = HealthGrades.UNDEFINED
+    if app.is_enabled:
+        # first, create new df readings - this function has its own 'transaction.atomic'
+        create_all_df_readings(app)
+
+        native_df_map = {df.name: df for df in app.get_native_df_qs().select_related("data_type")}
+        derived_df_map = {df.name: df for df in app.get_derived_df_qs().select_related("data_type")}
+        app_func_return, excep_health = compute_app(app, native_df_map, derived_df_map)
+
+    app, app_update_fields = commit_app(app, app_func_return, excep_health)
+
+    # Update parent
+    enqueue_app_parent_update(app, app_update_fields)
+
+    return app
+
+
+def get_app_func(app: Application):
+    app_func_cluster = app_function_map.get(app.type.func_name)
+    if app_func_cluster is None:
+        raise Exception(f"No {app.type.func_name} in the app function map")
+
+    app_func_path = app_func_cluster.get(app.func_version)
+    if app_func_path is None:
+        raise Exception(f"No version {app.func_version} for {app.type.func_name} in the app function map")
+
+    return load_app_function(app_func_path)
+
+
+def compute_app(
+    app: Application, native_df_map: dict[str, Datafeed], derived_df_map: dict[str, Datafeed]
+) -> tuple[AppFuncReturn | None, HealthGrades]:
+    """
+    Executes the app function on a snapshot of the app and its datafeeds, nothing is locked or saved here,
+    so the app function can take as long as it needs. The results are saved by 'commit_app'.
+    """
+    try:
+        app_func = get_app_func(app)
+        # now it is possible to do the main thing - to do some application logic
+        return app_func(app, native_df_map, derived_df_map), HealthGrades.UNDEFINED
+    except Exception as e:
+        print(f"Error happened while executing app function, {e}\n{traceback.format_exc()}")
+        return None, HealthGrades.ERROR
+
+
+def commit_app(
+    app_snapshot: Application, app_func_return: AppFuncReturn | None, excep_health: HealthGrades
+) -> tuple[Application, set]:
+    """
+    Locks the app for a short time to save the results of 'compute_app', evaluates staleness and health
+    of the app and saves it. The results are discarded if the app was evaluated by someone else
+    after the snapshot was taken (its cursor moved).
+    Returns the app as it was saved and the names of the app fields that were updated.
+    """
+    app_update_fields = set()
+    health_from_app = HealthGrades.UNDEFINED
+
+    with transaction.atomic():
+        app = (
+            Application.objects.select_related("type", "invoc_interval", "catch_up_interval")
+            .select_for_update(of=("self",))
+            .get(pk=app_snapshot.pk)
+        )
+        if app.cursor_ts != app_snapshot.cursor_ts or app.is_enabled != app_snapshot.is_enabled:
+            print(f"{app} was changed while its app function was executed, the results are discarded")
+            app_func_return = None
+
+        if app.is_enabled and app_func_return is not None:
+            derived_df_readings, update_map = app_func_return
+            try:
+                with transaction.atomic():
+                    # -1- update derived datafeeds and save derived df readings
+                    # df readings of all the derived datafeeds are saved at once
+                    new_dfr_rows = []
+                    updated_dfs = []
+                    for df_name, df_row in derived_df_readings.items():
+                        df = df_row["df"]
+                        df_reading_rows = get_df_reading_rows(df_row)
+                        if len(df_reading_rows) > 0:
+                            new_dfr_rows.extend(df_reading_rows)
+                            _, max_rts, db_val_at_max_rts, _ = max(df_reading_rows, key=lambda row: row[1])
+                            val_at_max_rts = round(db_val_at_max_rts) if df.is_value_interger else db_val_at_max_rts
+                            if df.last_reading_ts is None or max_rts > df.last_reading_ts:
+                                df.last_reading_ts = max_rts
+                                updated_dfs.append(df)
+
+                            # -1-1- update status
+                            if df_name == STATUS_FIELD_NAME and app.type.has_status:
+                                if app.last_status_update_ts is None or max_rts > app.last_status_update_ts:
+                                    app.last_status_update_ts = max_rts
+                                    app_update_fields.add("last_status_update_ts")
+                                    if app.status != val_at_max_rts:
+                                        app.status = val_at_max_rts
+                                        app_update_fields.add("status")
+                                        # TODO: add a message to the alarm log
+                            # -1-2- update curr state
+                            if df_name == CURR_STATE_FIELD_NAME and app.type.has_curr_state:
+                                if app.last_curr_state_update_ts is None or max_rts > app.last_curr_state_update_ts:
+                                    app.last_curr_state_update_ts = max_rts
+                                    app_update_fields.add("last_curr_state_update_ts")
+                                    if app.curr_state != val_at_max_rts:
+                                        app.curr_state = val_at_max_rts
+                                        app_update_fields.add("curr_state")
+                                        # TODO: add a message to the alarm log
+
+                    save_df_reading_rows(new_dfr_rows, app.type.dfr_conflict_policy)
+                    Datafeed.bulk_save(updated_dfs, ["last_reading_ts"])
+
+                    # -2- update the catching up flag, it defines the next run time (see below)
+                    if (is_catching_up := update_map.get("is_catching_up")) is not None:
+                        if is_catching_up != app.is_catching_up:
+                            app.is_catching_up = is_catching_up
+                            app_update_fields.add("is_catching_up")
+
+                    # -3- update the cursor position
+                    cursor_ts = app.cursor_ts
+                    if (ts := update_map.get("cursor_ts")) is not None:
+                        cursor_ts = ts
+                        if cursor_ts > app.cursor_ts:
+                            app.cursor_ts = cursor_ts
+                            app_update_fields.add("cursor_ts")
+
+                    # -3-1- save the state of the app function at the new cursor position
+                    if (state := update_map.get("state")) is not None:
+                        save_app_state(app, state, app.cursor_ts)
+
+                    # -4- health from the app function
+                    if (h := update_map.get("health")) is not None:
+                        # HealthGrades.OK is not used for this type of health
+                        health_from_app = h if h != HealthGrades.OK else HealthGrades.UNDEFINED
+
+                    # -5- process alarms
+                    alarm_rows = update_map.get("alarm_rows")
+                    if (alarm_payload := update_map.get("alarm_payload")) is not None:
+                        alarm_rows = (
+                            (ts, row.get("e"), row.get("w"), row.get("i")) for ts, row in alarm_payload.items()
+                        )
+                    if alarm_rows is not None:
+                        alarm_state = AlarmState(app)
+                        for ts, app_error_dict_for_ts, app_warning_dict_for_ts, app_infos_for_ts in alarm_rows:
+                            alarm_state.update_part(app_error_dict_for_ts, ts, "errors")
+                            alarm_state.update_part(app_warning_dict_for_ts, ts, "warnings")
+
+                            if app_infos_for_ts is not None and isinstance(app_infos_for_ts, Iterable):
+                                for info_str in app_infos_for_ts:
+                                    add_to_alarm_log("INFO", info_str, ts, app)
+                        save_alarm_states([alarm_state])
+
+                    add_to_alarm_log("INFO", "App function was executed", create_now_ts_ms(), instance=app)
+
+            except IntegrityError:
+                print(
+                    """An attempt to rewrite existing df readings detected,
+                        all the results of the app function evaluation will be discarded
+                        (the app type conflict policy can be switched to SKIP or OVERWRITE)"""
+                )
+                excep_health = HealthGrades.ERROR
+            except Exception as e:
+                excep_health = HealthGrades.ERROR
+                print(f"Error happened while saving the results of app function, {e}\n{traceback.format_exc()}")
+
+        # this part is performed regardles of the 'app.is_enabled' value
+        now_ts = create_now_ts_ms()
+        if app.type.has_status:
+            if app.last_status_update_ts is not None:
+                is_status_stale = now_ts - app.last_status_update_ts > app.t_status_stale
+            else:
+                is_status_stale = now_ts - app.created_ts > app.t_status_stale
+
+            if is_status_stale != app.is_status_stale:
+                app.is_status_stale = is_status_stale
+                app_update_fields.add("is_status_stale")
+                # TODO: add a message to the alarm log
+
+        if app.type.has_curr_state:
+            if app.last_curr_state_update_ts is not None:
+                is_curr_state_stale = now_ts - app.last_curr_state_update_ts > app.t_curr_state_stale
+            else:
+                is_curr_state_stale = now_ts - app.created_ts > app.t_status_stale
+
+            if is_curr_state_stale != app.is_curr_state_stale:
+                app.is_curr_state_stale = is_curr_state_stale
+                app_update_fields.add("is_curr_state_stale")
+                # TODO: add a message to the alarm log
+
+        # health based on the cursor timestamp
+        if app.is_enabled and not app.is_catching_up:
+            if now_ts - app.cursor_ts > app.t_health_error:
+                cs_health = HealthGrades.ERROR
+            else:
+                cs_health = HealthGrades.OK
+        else:
+            cs_health = HealthGrades.UNDEFINED
+
+        health = max(cs_health, health_from_app, excep_health)
+        if app.health != health:
+            app.health = health
+            app_update_fields.add("health")
+            # TODO: add a message to the alarm log
+
+        # the next invocation, 'catch_up_interval' or 'invoc_interval' depending on 'is_catching_up'
+        app.next_run_ts = now_ts + app.get_run_interval_ms()
+        app_update_fields.add("next_run_ts")
+
+        # finally, save the app
+        app.save(update_fields=app_update_fields)
+
+        return app, app_update_fields
+
+
+def get_app_parent_fields(app_update_fields: set) -> set[str]:
+    # the fields of the parent to be updated when the app's 'status', 'curr_state' or 'health' changed
+    parent_fields = set()
+    if "status" in app_update_fields or "is_status_stale" in app_update_fields:
+        parent_fields.add("status")
+    if "curr_state" in app_update_fields or "is_curr_state_stale" in app_update_fields:
+        parent_fields.add("curr_state")
+    if "health" in app_update_fields:
+        parent_fields.add("health")
+    return parent_fields
+
+
+def enqueue_app_parent_update(app: Application, app_update_fields: set) -> None:
+    parent_fields = get_app_parent_fields(app_update_fields)
+    if app.parent_id is not None and len(parent_fields) > 0:
+        # the parent is not locked, so the fields are merged by the db
+        enqueue_asset_updates({app.parent_id: parent_fields}, create_now_ts_ms())
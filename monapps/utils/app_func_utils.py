@@ -1,10 +1,11 @@
 from collections.abc import Iterable
+import numpy as np
 
 from django.conf import settings
 
 from apps.datafeeds.models import Datafeed
 from apps.dfreadings.models import DfReading
-from common.complex_types import DfValueMap
+from common.complex_types import DfValueMap, DfFrame
 
 
 def get_end_rts(
@@ -54,3 +55,44 @@ def get_df_value_map(datafeeds, start_rts: int, end_rts: int) -> DfValueMap:
             df_value_map[dfr.time][df.name] = dfr.value
 
     return df_value_map
+
+
+def get_df_frame(datafeeds: Iterable[Datafeed], start_rts: int, end_rts: int, t_resample: int) -> DfFrame:
+    """
+    Columnar alternative to 'get_df_value_map'. Brings df readings with timestamps in (start_rts, end_rts]
+    for all the datafeeds in one query and puts their values into NumPy arrays aligned with the grid
+    'start_rts + t_resample, ..., end_rts'. Points without df readings are NaN in 'values' and False in 'masks'.
+    Can be used by app functions instead of 'native_df_map' lookups when the app logic is vectorized.
+    """
+    datafeeds = list(datafeeds)
+    grid = np.arange(start_rts + t_resample, end_rts + 1, t_resample, dtype=np.int64)
+    values = {df.name: np.full(len(grid), np.nan) for df in datafeeds}
+    masks = {df.name: np.zeros(len(grid), dtype=bool) for df in datafeeds}
+
+    if len(grid) == 0 or len(datafeeds) == 0:
+        return {"grid": grid, "values": values, "masks": masks}
+
+    rows = list(
+        DfReading.objects.filter(
+            datafeed_id__in=[df.pk for df in datafeeds], time__gt=start_rts, time__lte=end_rts
+        ).values_list("datafeed_id", "time", "db_value")
+    )
+    num_rows = len(rows)
+    df_ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=num_rows)
+    rtss = np.fromiter((r[1] for r in rows), dtype=np.int64, count=num_rows)
+    db_values = np.fromiter((r[2] for r in rows), dtype=np.float64, count=num_rows)
+
+    # df readings are always created on the grid, but just in case the ones that are not aligned are ignored
+    offsets = rtss - start_rts
+    is_on_grid = offsets % t_resample == 0
+    idxs = offsets // t_resample - 1
+
+    for df in datafeeds:
+        sel = (df_ids == df.pk) & is_on_grid
+        df_values = db_values[sel]
+        if df.is_value_interger:
+            df_values = np.rint(df_values)  # the same as 'round' in 'DfReading.value'
+        values[df.name][idxs[sel]] = df_values
+        masks[df.name][idxs[sel]] = True
+
+    return {"grid": grid, "values": values, "masks": masks}
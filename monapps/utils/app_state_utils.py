@@ -0,0 +1,53 @@
+import numpy as np
+
+from apps.applications.models import Application, AppState
+from common.complex_types import AppStateMap, AppStateValue
+
+
+def encode_app_state_value(value: AppStateValue) -> tuple[str, list[int], bytes]:
+    arr = np.asarray(value)
+    if arr.dtype.hasobject:
+        raise ValueError(f"Cannot store a value of dtype {arr.dtype} in the app state")
+    return arr.dtype.str, list(arr.shape), arr.tobytes()
+
+
+def decode_app_state_value(dtype: str, shape: list[int], data: bytes) -> AppStateValue:
+    arr = np.frombuffer(bytes(data), dtype=np.dtype(dtype)).reshape(shape)
+    if arr.ndim == 0:
+        return arr.item()  # a Python scalar
+    return arr.copy()  # 'frombuffer' gives a read-only array
+
+
+def load_app_state(app: Application) -> AppStateMap:
+    """
+    Returns the state saved by the previous invocation of the app function.
+    Only the values saved at the current cursor position are returned,
+    so the state is dropped if the cursor was moved by someone else (f.e. set back manually).
+    """
+    state_qs = AppState.objects.filter(app_id=app.pk, ts=app.cursor_ts).values_list("name", "dtype", "shape", "data")
+    return {name: decode_app_state_value(dtype, shape, data) for name, dtype, shape, data in state_qs}
+
+
+def save_app_state(app: Application, state: AppStateMap, ts: int) -> None:
+    """
+    Upserts the values of 'state' for the cursor position 'ts', a value None removes the entry.
+    Should be called in the same transaction as the cursor of the app is saved.
+    """
+    app_states = []
+    names_to_delete = []
+    for name, value in state.items():
+        if value is None:
+            names_to_delete.append(name)
+            continue
+        dtype, shape, data = encode_app_state_value(value)
+        app_states.append(AppState(app_id=app.pk, name=name, dtype=dtype, shape=shape, data=data, ts=ts))
+
+    if len(names_to_delete) > 0:
+        AppState.objects.filter(app_id=app.pk, name__in=names_to_delete).delete()
+    if len(app_states) > 0:
+        AppState.objects.bulk_create(
+            app_states,
+            update_conflicts=True,
+            unique_fields=["app", "name"],
+            update_fields=["dtype", "shape", "data", "ts"],
+        )
@@ -0,0 +1,40 @@
+from django.conf import settings
+
+from utils.ts_utils import ceil_timestamp
+
+
+class DsReadingBatchPlanner:
+    """
+    Picks the number of ds readings to be brought from the db in one batch
+    when df readings are created in 'create_all_df_readings'.
+    The initial size is estimated from how many ds readings fall into one resampling interval,
+    then it is adjusted after every batch according to the measured processing time.
+    If a batch produced only unclosed df readings (no progress), the size grows geometrically,
+    so the processing cycle doesn't crawl forward one ds reading at a time.
+    """
+
+    def __init__(self, t_update: int | None, t_resample: int):
+        if t_update is not None and t_update > 0:
+            # for periodic datastreams, the number of ds readings per one df reading is known in advance
+            num_dsrs_per_rts = max(1, ceil_timestamp(t_resample, t_update) // t_update)
+        else:
+            num_dsrs_per_rts = 1  # for RBE datastreams there is no way to know it, so assume the best case
+
+        self.max_size = max(settings.NUM_MAX_DSREADINGS_TO_PROCESS, 2)
+        # at least two df readings should be obtained from one batch, otherwise the batch is useless
+        self.min_size = min(max(settings.NUM_MIN_DSREADINGS_TO_PROCESS, 2 * num_dsrs_per_rts), self.max_size)
+        self.size = min(max(num_dsrs_per_rts * settings.NUM_MAX_DFREADINGS_TO_PROCESS, self.min_size), self.max_size)
+
+    def register_stall(self) -> None:
+        # no closed df readings were obtained from the batch, so the next batch should be bigger,
+        # 'max_size' is deliberately not applied here, otherwise the cycle can run on the spot
+        self.size *= 2
+
+    def register_progress(self, num_dsrs: int, elapsed_ms: float) -> None:
+        size = min(self.size, self.max_size)  # the size could grow above the limit during stalls
+        if elapsed_ms > settings.T_DSR_BATCH_TARGET_MS:
+            size = max(self.min_size, size // 2)
+        elif elapsed_ms < settings.T_DSR_BATCH_TARGET_MS / 2 and num_dsrs >= size:
+            # only full batches are a reason to grow, a short batch means that the readings ran out
+            size = min(self.max_size, size * 2)
+        self.size = size
@@ -0,0 +1,161 @@
+from collections.abc import Iterable
+from typing import Any
+
+from django.db import connection
+
+from common.constants import StatusTypes, CurrStateTypes, HealthGrades, StatusUse, CurrStateUse
+from utils.rollup_utils import HEALTH_USE, rollup
+
+# Per-asset counters of the children (applications, devices, sub-assets) by the value
+# of "status"/"curr_state"/"health", by '*_use' and by staleness. They are kept in the table 'asset_child_counters'
+# and changed incrementally when a child is saved (see 'ChildCountedModel'), so the rollup of an asset
+# does not load its children. A counter key is (asset_id, prop, value, use, is_stale), the children with
+# the value None or with '*_use' = DONT_USE are not counted, because they are not used in the rollup.
+
+type CounterKey = tuple[str, int, int, bool]  # (prop, value, use, is_stale), 'asset_id' is added when saved
+type CounterDeltas = dict[tuple[int, str, int, int, bool], int]
+
+COUNTED_FIELDS_BY_PROP = {
+    "status": ("status", "status_use", "is_status_stale"),
+    "curr_state": ("curr_state", "curr_state_use", "is_curr_state_stale"),
+    "health": ("health",),
+}
+
+APPLY_DELTAS_SQL = """
+    INSERT INTO asset_child_counters (asset_id, prop, value, use, is_stale, count)
+    SELECT * FROM unnest(%s::bigint[], %s::varchar(50)[], %s::integer[], %s::integer[], %s::boolean[], %s::integer[])
+    ON CONFLICT (asset_id, prop, value, use, is_stale) DO UPDATE
+    SET count = asset_child_counters.count + EXCLUDED.count
+"""
+
+LOAD_COUNTERS_SQL = """
+    SELECT asset_id, prop, value, use, is_stale, count
+    FROM asset_child_counters
+    WHERE asset_id = ANY(%s) AND count > 0
+"""
+
+# the counters recomputed from the children, assets have no staleness
+EXPECTED_COUNTERS_SQL = f"""
+    SELECT parent_id, 'status', status, status_use, is_status_stale, count(*)
+    FROM applications
+    WHERE parent_id IS NOT NULL AND status IS NOT NULL AND status_use <> {StatusUse.DONT_USE}
+    GROUP BY 1, 3, 4, 5
+    UNION ALL
+    SELECT parent_id, 'curr_state', curr_state, curr_state_use, is_curr_state_stale, count(*)
+    FROM applications
+    WHERE parent_id IS NOT NULL AND curr_state IS NOT NULL AND curr_state_use <> {CurrStateUse.DONT_USE}
+    GROUP BY 1, 3, 4, 5
+    UNION ALL
+    SELECT parent_id, 'status', status, status_use, FALSE, count(*)
+    FROM assets
+    WHERE parent_id IS NOT NULL AND status IS NOT NULL AND status_use <> {StatusUse.DONT_USE}
+    GROUP BY 1, 3, 4
+    UNION ALL
+    SELECT parent_id, 'curr_state', curr_state, curr_state_use, FALSE, count(*)
+    FROM assets
+    WHERE parent_id IS NOT NULL AND curr_state IS NOT NULL AND curr_state_use <> {CurrStateUse.DONT_USE}
+    GROUP BY 1, 3, 4
+    UNION ALL
+    SELECT parent_id, 'health', health, {HEALTH_USE}, FALSE, count(*)
+    FROM (
+        SELECT parent_id, health FROM applications
+        UNION ALL SELECT parent_id, health FROM devices
+        UNION ALL SELECT parent_id, health FROM assets
+    ) AS children
+    WHERE parent_id IS NOT NULL
+    GROUP BY 1, 3
+"""
+
+
+def get_counter_keys(instance: Any, props: Iterable[str] = COUNTED_FIELDS_BY_PROP) -> dict[str, CounterKey | None]:
+    """
+    Returns the counter keys the instance is counted under (None - the instance is not counted for this prop).
+    """
+    counter_keys = {}
+    for prop in props:
+        value = getattr(instance, prop, None)
+        if prop == "health":
+            use, is_stale = HEALTH_USE, False
+        else:
+            use = getattr(instance, f"{prop}_use", StatusUse.DONT_USE)  # CurrStateUse has the same values
+            is_stale = getattr(instance, f"is_{prop}_stale", False)
+        if value is None or use == StatusUse.DONT_USE:
+            counter_keys[prop] = None
+        else:
+            counter_keys[prop] = (prop, int(value), int(use), bool(is_stale))
+    return counter_keys
+
+
+def add_counter_deltas(
+    deltas: CounterDeltas,
+    old_parent_id: int | None,
+    old_keys: dict[str, CounterKey | None],
+    new_parent_id: int | None,
+    new_keys: dict[str, CounterKey | None],
+) -> None:
+    for prop in new_keys.keys() | old_keys.keys():
+        old_key = old_keys.get(prop)
+        new_key = new_keys.get(prop)
+        if old_parent_id == new_parent_id and old_key == new_key:
+            continue
+        if old_parent_id is not None and old_key is not None:
+            deltas[(old_parent_id, *old_key)] = deltas.get((old_parent_id, *old_key), 0) - 1
+        if new_parent_id is not None and new_key is not None:
+            deltas[(new_parent_id, *new_key)] = deltas.get((new_parent_id, *new_key), 0) + 1
+
+
+def apply_counter_deltas(deltas: CounterDeltas) -> None:
+    # the keys are sorted, so concurrent transactions lock the counters in the same order and do not deadlock
+    items = sorted((key, delta) for key, delta in deltas.items() if delta != 0)
+    if len(items) == 0:
+        return
+    columns = list(zip(*(key + (delta,) for key, delta in items)))
+    with connection.cursor() as cursor:
+        cursor.execute(APPLY_DELTAS_SQL, [list(column) for column in columns])
+
+
+def load_child_counters(asset_ids: Iterable[int]) -> dict[int, dict[str, dict[tuple[int, int, bool], int]]]:
+    """
+    Returns {asset_id: {prop: {(value, use, is_stale): count}}} for the counters > 0.
+    """
+    counters_by_asset_id = {}
+    with connection.cursor() as cursor:
+        cursor.execute(LOAD_COUNTERS_SQL, [list(asset_ids)])
+        for asset_id, prop, value, use, is_stale, count in cursor.fetchall():
+            counters_by_asset_id.setdefault(asset_id, {}).setdefault(prop, {})[(value, use, is_stale)] = count
+    return counters_by_asset_id
+
+
+def derive_from_child_counters(
+    prop: str, counters: dict[tuple[int, int, bool], int]
+) -> StatusTypes | CurrStateTypes | HealthGrades | None:
+    value_type = {"status": StatusTypes, "curr_state": CurrStateTypes, "health": HealthGrades}[prop]
+    value = rollup(((value, use, is_stale, count) for (value, use, is_stale), count in counters.items()), value_type)
+    if value is None and prop == "health":
+        return HealthGrades.UNDEFINED
+    return value
+
+
+def recompute_child_counters() -> set[int]:
+    """
+    Recomputes all the counters from the children and fixes the ones that differ from the stored values.
+    Returns the ids of the assets whose counters were fixed.
+    Should be executed in a transaction, the table is locked for writing till the end of it,
+    so the children that are being saved meanwhile apply their deltas after the recomputation.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("LOCK TABLE asset_child_counters IN EXCLUSIVE MODE")
+        cursor.execute(EXPECTED_COUNTERS_SQL)
+        expected = {tuple(row[:5]): row[5] for row in cursor.fetchall()}
+        cursor.execute("SELECT asset_id, prop, value, use, is_stale, count FROM asset_child_counters WHERE count <> 0")
+        stored = {tuple(row[:5]): row[5] for row in cursor.fetchall()}
+
+        deltas = {}
+        for key in expected.keys() | stored.keys():
+            delta = expected.get(key, 0) - stored.get(key, 0)
+            if delta != 0:
+                deltas[key] = delta
+        apply_counter_deltas(deltas)
+        cursor.execute("DELETE FROM asset_child_counters WHERE count = 0")
+
+    return set(key[0] for key in deltas.keys())
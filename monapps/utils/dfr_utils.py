@@ -0,0 +1,87 @@
+from itertools import repeat
+import numpy as np
+
+from django.db import connection
+from django.conf import settings
+
+from apps.dfreadings.models import DfReading
+from common.complex_types import DerivedDfReadingRow, DfReadingRow
+from common.constants import DfrConflictPolicies
+
+
+def get_df_reading_rows(df_row: DerivedDfReadingRow) -> list[DfReadingRow]:
+    """
+    Converts both 'new_df_readings' and the columnar 'rtss'/'values' of a derived datafeed into plain tuples,
+    so the df readings of all the derived datafeeds can be saved at once.
+    """
+    df = df_row["df"]
+    rows = [(dfr.datafeed_id, dfr.time, dfr.db_value, dfr.restored) for dfr in df_row["new_df_readings"]]
+    if (rtss := df_row.get("rtss")) is not None:
+        values = np.asarray(df_row["values"], dtype=np.float64)
+        rows.extend(zip(repeat(df.pk), rtss.tolist(), values.tolist(), repeat(False)))
+    return rows
+
+
+def save_df_reading_rows(
+    rows: list[DfReadingRow], conflict_policy: DfrConflictPolicies = DfrConflictPolicies.FAIL
+) -> None:
+    """
+    Saves df readings in one flush: either with 'COPY' or with multi-row INSERTs of 'DFR_SAVE_BATCH_SIZE' rows.
+    An attempt to rewrite existing df readings raises IntegrityError if 'conflict_policy' is FAIL,
+    otherwise the colliding df readings are either skipped or overwritten.
+    """
+    if len(rows) == 0:
+        return
+
+    if settings.DFR_SAVE_USE_COPY:
+        copy_df_reading_rows(rows, conflict_policy)
+    else:
+        conflict_kwargs = {}
+        if conflict_policy == DfrConflictPolicies.SKIP:
+            conflict_kwargs = {"ignore_conflicts": True}
+        elif conflict_policy == DfrConflictPolicies.OVERWRITE:
+            conflict_kwargs = {
+                "update_conflicts": True,
+                "update_fields": ["db_value", "restored"],
+                "unique_fields": ["datafeed", "time"],
+            }
+        DfReading.objects.bulk_create(
+            [
+                DfReading(datafeed_id=df_id, time=rts, db_value=db_value, restored=restored)
+                for df_id, rts, db_value, restored in rows
+            ],
+            batch_size=settings.DFR_SAVE_BATCH_SIZE,
+            **conflict_kwargs,
+        )
+
+
+def copy_df_reading_rows(rows: list[DfReadingRow], conflict_policy: DfrConflictPolicies) -> None:
+    table = DfReading._meta.db_table
+    columns = "datafeed_id, time, db_value, restored"
+
+    # 'copy' is not wrapped by Django, so the psycopg errors are translated explicitly
+    with connection.wrap_database_errors, connection.cursor() as cursor:
+        if conflict_policy == DfrConflictPolicies.FAIL:
+            with cursor.copy(f"COPY {table} ({columns}) FROM STDIN") as copy:
+                for row in rows:
+                    copy.write_row(row)
+            return
+
+        # COPY can't resolve conflicts, so the rows go to a staging table first
+        # and then are moved to the main table with 'INSERT ... ON CONFLICT'
+        staging_table = f"{table}_staging"
+        cursor.execute(
+            f"CREATE TEMP TABLE IF NOT EXISTS {staging_table} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DELETE ROWS"
+        )
+        with cursor.copy(f"COPY {staging_table} ({columns}) FROM STDIN") as copy:
+            for row in rows:
+                copy.write_row(row)
+        if conflict_policy == DfrConflictPolicies.SKIP:
+            on_conflict = "DO NOTHING"
+        else:
+            on_conflict = "DO UPDATE SET db_value = EXCLUDED.db_value, restored = EXCLUDED.restored"
+        cursor.execute(
+            f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {staging_table} "
+            f"ON CONFLICT (datafeed_id, time) {on_conflict}"
+        )
+        cursor.execute(f"TRUNCATE {staging_table}")
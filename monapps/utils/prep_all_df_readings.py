@@ -1,5 +1,6 @@
+import time
+
 from django.db import transaction
-from django.conf import settings
 
 from apps.datafeeds.models import Datafeed
 from apps.datastreams.models import Datastream
@@ -7,6 +8,7 @@ from apps.dsreadings.models import DsReading
 from apps.applications.models import Application
 
 from utils.prep_df_readings import create_df_readings
+from utils.batch_utils import DsReadingBatchPlanner
 from utils.ts_utils import ceil_timestamp
 
 from common.constants import AugmentationPolicy
@@ -48,21 +50,33 @@ def create_all_df_readings(app: Application) -> None:
 
             last_saved_dfr_rts = None
 
-            num_dsrs_to_process = settings.NUM_MAX_DSREADINGS_TO_PROCESS
-            # if there are too many ds readings, they are processed in batches of size 'NUM_MAX_DSREADINGS_TO_PROCESS'
+            # if there are too many ds readings, they are processed in batches,
+            # the size of a batch is picked by the planner and ds readings are brought from the db
+            # page by page using the timestamp of the last fetched ds reading as a key
+            batch_planner = DsReadingBatchPlanner(ds.t_update, app.t_resample)
+            ds_readings = []
+            last_fetched_dsr_ts = start_rts
             while True:
-                ds_readings = list(
-                    DsReading.objects.filter(datastream__id=ds.pk, time__gt=start_rts).order_by("time")[
-                        :num_dsrs_to_process
-                    ]
-                )
+                batch_start = time.monotonic()
+                num_dsrs_to_fetch = batch_planner.size - len(ds_readings)
+                new_ds_readings = []
+                if num_dsrs_to_fetch > 0:
+                    new_ds_readings = list(
+                        DsReading.objects.filter(datastream__id=ds.pk, time__gt=last_fetched_dsr_ts).order_by("time")[
+                            :num_dsrs_to_fetch
+                        ]
+                    )
+                    if len(new_ds_readings) > 0:
+                        last_fetched_dsr_ts = new_ds_readings[-1].time
+                        ds_readings.extend(new_ds_readings)
+
                 # no reason to proceed
                 if len(ds_readings) == 0 and not df.is_aug_on and df.aug_policy != AugmentationPolicy.TILL_NOW:
                     rts_to_start_with_next_time = start_rts
                     break
 
                 last_dfr_rts, rts_to_start_with_next_time, last_saved_dfr_rts = create_df_readings(
-                    ds_readings, df, ds, app.t_resample, start_rts
+                    ds_readings, df, ds, app.t_resample, start_rts, app.type.dfr_conflict_policy
                 )
 
                 if (
@@ -77,25 +91,26 @@ def create_all_df_readings(app: Application) -> None:
                     break
                 elif last_dfr_rts is not None and last_saved_dfr_rts is None:
                     # it may happen that because of the limitation for max ds readings to process
-                    # (when 'NUM_MAX_DSREADINGS_TO_PROCESS' is small)
                     # only 1-3 unclosed df readings were created from ds readings and therefore these df readings
                     # were not saved inside the 'prep_df_readings' function.
                     # 'last_saved_dfr_rts' then will be None.
                     # But if we got to this point (which means that the condition
                     # 'last_dfr_rts' >= 'end_rts_by_very_last_ds_reading'
                     # was not true), it means that there are more ds readings ahead of 'last_dfr_rts'.
-                    # In this case, we need to increase the number of ds readings processed in one subcycle
+                    # In this case, the already fetched ds readings are kept and the batch is enlarged
                     # in order not to let the processing cycle run on the spot.
-                    # This is an extremely far-fetched situation (when, sat, MAX_NUM is measured in tens or so),
-                    # but for consistency it is necessary to include this handler into the code.
-                    num_dsrs_to_process += 1
+                    if len(new_ds_readings) == 0 and num_dsrs_to_fetch > 0:
+                        break  # no more ds readings in the db, just for safety
+                    batch_planner.register_stall()
                 elif (
                     rts_to_start_with_next_time == start_rts
                 ):  # no readings were processed, maybe an unnecessary branch
                     break
                 else:
-                    num_dsrs_to_process = settings.NUM_MAX_DSREADINGS_TO_PROCESS
+                    batch_planner.register_progress(len(ds_readings), (time.monotonic() - batch_start) * 1000)
                     start_rts = rts_to_start_with_next_time
+                    # ds readings that have not been used yet will be processed in the next batch
+                    ds_readings = [r for r in ds_readings if r.time > start_rts]
 
             df_fields_to_update = []
             if rts_to_start_with_next_time > df.ts_to_start_with:
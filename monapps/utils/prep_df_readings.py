@@ -9,8 +9,15 @@ from apps.dsreadings.models import DsReading, NoDataMarker
 from apps.dfreadings.models import DfReading
 
 from common.complex_types import IndDfReadingMap
-from common.constants import DataAggrTypes, NotToUseDfrTypes, VariableTypes, AugmentationPolicy
+from common.constants import (
+    DataAggrTypes,
+    NotToUseDfrTypes,
+    VariableTypes,
+    AugmentationPolicy,
+    DfrConflictPolicies,
+)
 from utils.ts_utils import ceil_timestamp, create_grid, create_ts_ms_from_dt_obj
+from utils.dfr_utils import save_df_reading_rows
 
 
 def create_df_readings(
@@ -19,6 +26,7 @@ def create_df_readings(
     ds: Datastream,
     t_resample: int,
     start_rts: int,
+    conflict_policy: DfrConflictPolicies = DfrConflictPolicies.FAIL,
 ) -> tuple[int | None, int, int | None]:
     """
     Creates datafeed readings from a set of datastream readings.
@@ -29,7 +37,8 @@ def create_df_readings(
     'rts_to_start_with_next_time' - a timestamp to start with next time.
     It is usally a timestamp before the first 'unused'/'unclosed' reading.
     'last_saved_dfr_rts' - a timestamp of the last saved df reading.
-    Also saves new datafeed readings in the database.
+    Also saves new datafeed readings in the database, collisions with existing df readings
+    are resolved according to 'conflict_policy'.
     """
 
     df_readings = []
@@ -103,10 +112,9 @@ def create_df_readings(
         rts_to_start_with_next_time = rts
 
     if len(df_readings) > 0:
-        DfReading.objects.bulk_create(
-            df_readings,
-            # update_conflicts=True, update_fields=["db_value"], unique_fields=["time", "datafeed_id"]
-        )  # TODO: do we need all these kwargs?
+        save_df_reading_rows(
+            [(dfr.datafeed_id, dfr.time, dfr.db_value, dfr.restored) for dfr in df_readings], conflict_policy
+        )
         last_saved_dfr_rts = df_readings[-1].time
 
     if len(df_reading_rtss) > 0:  # almost impossible that len(df_reading_rtss) == 0 if we got to this point
@@ -0,0 +1,245 @@
+from collections import deque
+
+import numpy as np
+from scipy.signal import lfilter
+
+from common.complex_types import AppStateMap
+
+# Incremental aggregators over the last 'window' points (grid points, not milliseconds).
+# 'update' takes only the new values and returns the aggregate for every new point,
+# the work is proportional to the number of new values, not to the window length.
+# The state of an aggregator can be kept between invocations of an app function with 'to_state'/'from_state',
+# the names of the state entries are prefixed with 'name', so several aggregators can share one app state.
+# NaN values are not expected, the values that are not valid should be filtered out before 'update'.
+
+
+class _WindowBuffer:
+    """
+    A ring buffer with the last 'window' values.
+    """
+
+    def __init__(self, window: int, values: np.ndarray | None = None, start: int = 0, count: int = 0):
+        if window < 1:
+            raise ValueError("Window should be >= 1")
+        self.window = window
+        self.values = np.zeros(window) if values is None else values.astype(np.float64)
+        self.start = start  # the index of the oldest value
+        self.count = count  # how many values are in the buffer, <= window
+
+    def get(self, begin: int, end: int) -> np.ndarray:
+        # the values [begin, end) counting from the oldest one
+        return self.values[(self.start + np.arange(begin, end)) % self.window]
+
+    def get_leaving(self, new_values: np.ndarray) -> np.ndarray:
+        """
+        For every new value, the value that leaves the window when the new one enters it (0 if none leaves).
+        """
+        n = len(new_values)
+        leaving = np.zeros(n)
+        first_j = max(0, self.window - self.count)  # the first new value that pushes out an older one
+        if first_j >= n:
+            return leaving
+        begin = self.count + first_j - self.window  # the index of the leaving value in (buffer + new_values)
+        end = begin + n - first_j
+        from_buffer = self.get(begin, min(end, self.count)) if begin < self.count else np.zeros(0)
+        from_new = new_values[max(0, begin - self.count) : max(0, end - self.count)]
+        leaving[first_j:] = np.concatenate((from_buffer, from_new))
+        return leaving
+
+    def push(self, new_values: np.ndarray) -> None:
+        tail = new_values[-self.window :]
+        positions = (self.start + self.count + np.arange(len(tail))) % self.window
+        self.values[positions] = tail
+        overflow = max(0, self.count + len(tail) - self.window)
+        self.start = (self.start + overflow) % self.window
+        self.count = min(self.window, self.count + len(tail))
+
+    def get_counts(self, n: int) -> np.ndarray:
+        # the number of values in the window after each of 'n' new values
+        return np.minimum(self.count + np.arange(1, n + 1), self.window)
+
+    def to_state(self, name: str) -> AppStateMap:
+        return {f"{name}.values": self.values, f"{name}.start": self.start, f"{name}.count": self.count}
+
+    @classmethod
+    def from_state(cls, name: str, state: AppStateMap, window: int) -> "_WindowBuffer":
+        values = state.get(f"{name}.values")
+        if values is None or len(values) != window:  # no state yet or the window was changed
+            return cls(window)
+        return cls(window, values, state[f"{name}.start"], state[f"{name}.count"])
+
+
+class RollingSum:
+
+    def __init__(self, window: int):
+        self.buffer = _WindowBuffer(window)
+        self.sum = 0.0
+
+    def update(self, values: np.ndarray) -> np.ndarray:
+        values = np.asarray(values, dtype=np.float64)
+        sums = self.sum + np.cumsum(values - self.buffer.get_leaving(values))
+        self.buffer.push(values)
+        if len(values) >= self.buffer.window:
+            # the whole window is new, so the sum is recalculated to drop accumulated rounding errors
+            self.sum = float(self.buffer.values.sum())
+        elif len(values) > 0:
+            self.sum = float(sums[-1])
+        return sums
+
+    def to_state(self, name: str) -> AppStateMap:
+        return {**self.buffer.to_state(name), f"{name}.sum": self.sum}
+
+    @classmethod
+    def from_state(cls, name: str, state: AppStateMap, window: int) -> "RollingSum":
+        aggr = cls(window)
+        aggr.buffer = _WindowBuffer.from_state(name, state, window)
+        if aggr.buffer.count > 0:
+            aggr.sum = state[f"{name}.sum"]
+        return aggr
+
+
+class RollingMean(RollingSum):
+
+    def update(self, values: np.ndarray) -> np.ndarray:
+        counts = self.buffer.get_counts(len(values))
+        return super().update(values) / counts
+
+
+class RollingVariance:
+    """
+    Sample variance (ddof=1, NaN while there is only one value in the window).
+    The values are shifted by the first value ever seen to keep the sums of squares small.
+    """
+
+    def __init__(self, window: int):
+        self.buffer = _WindowBuffer(window)
+        self.shift = None
+        self.sum = 0.0
+        self.sum_sq = 0.0
+
+    def update(self, values: np.ndarray) -> np.ndarray:
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) == 0:
+            return np.zeros(0)
+        if self.shift is None:
+            self.shift = float(values[0])
+        shifted = values - self.shift
+        leaving = self.buffer.get_leaving(shifted)
+        counts = self.buffer.get_counts(len(values))
+        sums = self.sum + np.cumsum(shifted - leaving)
+        sums_sq = self.sum_sq + np.cumsum(shifted**2 - leaving**2)
+        self.buffer.push(shifted)
+        if len(values) >= self.buffer.window:
+            # the whole window is new, so the sums are recalculated to drop accumulated rounding errors
+            self.sum = float(self.buffer.values.sum())
+            self.sum_sq = float((self.buffer.values**2).sum())
+        else:
+            self.sum = float(sums[-1])
+            self.sum_sq = float(sums_sq[-1])
+        with np.errstate(invalid="ignore", divide="ignore"):
+            variances = (sums_sq - sums**2 / counts) / (counts - 1)
+        return np.where(counts > 1, np.maximum(variances, 0.0), np.nan)
+
+    def to_state(self, name: str) -> AppStateMap:
+        if self.shift is None:
+            return {}
+        return {
+            **self.buffer.to_state(name),
+            f"{name}.shift": self.shift,
+            f"{name}.sum": self.sum,
+            f"{name}.sum_sq": self.sum_sq,
+        }
+
+    @classmethod
+    def from_state(cls, name: str, state: AppStateMap, window: int) -> "RollingVariance":
+        aggr = cls(window)
+        aggr.buffer = _WindowBuffer.from_state(name, state, window)
+        if aggr.buffer.count > 0:
+            aggr.shift = state[f"{name}.shift"]
+            aggr.sum = state[f"{name}.sum"]
+            aggr.sum_sq = state[f"{name}.sum_sq"]
+        return aggr
+
+
+class RollingMax:
+    """
+    Keeps a monotonic deque of (index, value), each value is put into it and taken from it only once.
+    """
+
+    sign = 1.0  # RollingMin works with the negated values
+
+    def __init__(self, window: int):
+        if window < 1:
+            raise ValueError("Window should be >= 1")
+        self.window = window
+        self.next_idx = 0
+        self.candidates: deque[tuple[int, float]] = deque()
+
+    def update(self, values: np.ndarray) -> np.ndarray:
+        results = np.empty(len(values))
+        candidates = self.candidates
+        for j, value in enumerate(np.asarray(values, dtype=np.float64) * self.sign):
+            idx = self.next_idx + j
+            while candidates and candidates[-1][1] <= value:
+                candidates.pop()
+            candidates.append((idx, value))
+            if candidates[0][0] <= idx - self.window:
+                candidates.popleft()
+            results[j] = candidates[0][1]
+        self.next_idx += len(values)
+        return results * self.sign
+
+    def to_state(self, name: str) -> AppStateMap:
+        return {
+            f"{name}.next_idx": self.next_idx,
+            f"{name}.idxs": np.array([idx for idx, _ in self.candidates], dtype=np.int64),
+            f"{name}.values": np.array([value for _, value in self.candidates], dtype=np.float64),
+        }
+
+    @classmethod
+    def from_state(cls, name: str, state: AppStateMap, window: int):
+        aggr = cls(window)
+        if (next_idx := state.get(f"{name}.next_idx")) is not None:
+            aggr.next_idx = next_idx
+            # the candidates that are out of the window (if it was made shorter) are dropped
+            aggr.candidates = deque(
+                (int(idx), float(value))
+                for idx, value in zip(state[f"{name}.idxs"], state[f"{name}.values"])
+                if idx > next_idx - 1 - window
+            )
+        return aggr
+
+
+class RollingMin(RollingMax):
+
+    sign = -1.0
+
+
+class Ewma:
+    """
+    Exponentially weighted moving average y[i] = alpha * x[i] + (1 - alpha) * y[i - 1], y[0] = x[0].
+    """
+
+    def __init__(self, alpha: float):
+        if not 0 < alpha <= 1:
+            raise ValueError("Alpha should be in (0, 1]")
+        self.alpha = alpha
+        self.last = None
+
+    def update(self, values: np.ndarray) -> np.ndarray:
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) == 0:
+            return np.zeros(0)
+        last = values[0] if self.last is None else self.last
+        results, _ = lfilter([self.alpha], [1.0, self.alpha - 1.0], values, zi=[(1.0 - self.alpha) * last])
+        self.last = float(results[-1])
+        return results
+
+    def to_state(self, name: str) -> AppStateMap:
+        return {} if self.last is None else {f"{name}.last": self.last}
+
+    @classmethod
+    def from_state(cls, name: str, state: AppStateMap, alpha: float) -> "Ewma":
+        aggr = cls(alpha)
+        aggr.last = state.get(f"{name}.last")
+        return aggr
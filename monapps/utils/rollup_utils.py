@@ -0,0 +1,66 @@
+from collections.abc import Iterable
+
+from common.constants import StatusTypes, CurrStateTypes, HealthGrades, StatusUse
+
+# The rollup of "status"/"curr_state"/"health" of the children into the value of the parent.
+# The children are given as rows (value, use, is_stale, count), so it can be fed with grouped 'values_list' queries
+# ('.values_list("status", "status_use", "is_status_stale").annotate(Count("pk"))') or with the child counters,
+# without creating model instances. The rules:
+# - the children with the value None or with use = DONT_USE are not taken into account,
+#   if there are no other children, the value of the parent is None
+# - stale children and children with UNDEFINED are not taken into account, but they are still counted as having
+#   the value, so if there are only such children the value of the parent is UNDEFINED
+# - ERROR of a child with use = AS_WARNING is taken as WARNING, with use = AS_ERROR_IF_ALL - as WARNING
+#   if there are other children with OK/WARNING
+# StatusTypes, CurrStateTypes, HealthGrades and StatusUse, CurrStateUse have the same values,
+# so the same function works for all of them.
+
+type RollupRow = tuple[int | None, int, bool, int]  # (value, use, is_stale, count)
+type RollupValueType = type[StatusTypes] | type[CurrStateTypes] | type[HealthGrades]
+
+HEALTH_USE = StatusUse.AS_ERROR_IF_ALL  # "health" of the children is always used as "error if all are errors"
+
+
+def rollup(
+    rows: Iterable[RollupRow], value_type: RollupValueType
+) -> StatusTypes | CurrStateTypes | HealthGrades | None:
+    has_value = False
+    num_warn_ok = 0
+    max_warn_ok = value_type.UNDEFINED
+    has_error_as_is = False
+    has_error_if_all = False
+    has_error_as_warning = False
+
+    for value, use, is_stale, count in rows:
+        if value is None or use == StatusUse.DONT_USE or count <= 0:
+            continue
+        has_value = True
+        if is_stale:
+            continue
+        if value == value_type.ERROR:
+            if use == StatusUse.AS_WARNING:
+                has_error_as_warning = True
+            elif use == StatusUse.AS_ERROR_IF_ALL:
+                has_error_if_all = True
+            else:
+                has_error_as_is = True
+        elif value != value_type.UNDEFINED:
+            num_warn_ok += count
+            if value > max_warn_ok:
+                max_warn_ok = value
+
+    if not has_value:
+        return None
+    if has_error_as_is or (has_error_if_all and num_warn_ok == 0):
+        return value_type.ERROR
+    if has_error_as_warning or has_error_if_all:
+        return value_type.WARNING
+    return value_type(max_warn_ok)
+
+
+def rollup_health(rows: Iterable[tuple[int, int]]) -> HealthGrades:
+    """
+    The same as 'rollup' for the rows (health, count), without children the health is UNDEFINED.
+    """
+    health = rollup(((value, HEALTH_USE, False, count) for value, count in rows), HealthGrades)
+    return HealthGrades.UNDEFINED if health is None else health